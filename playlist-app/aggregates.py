@@ -0,0 +1,276 @@
+"""Per-playlist aggregates: track count and artist histogram.
+
+playlist_stats.song_count and playlist_artist_counts are derived from
+playlist_song so list pages can show "N songs" and top artists without
+loading any songs. Triggers keep them current (see
+models.PLAYLIST_AGGREGATES_DDL): every write to playlist_song, and every
+song deleted or given another artist, adds or subtracts just the rows it
+changed, whatever the writer (ORM, set-at-a-time INSERT ... SELECT, or
+plain SQL). A one-track edit costs the same on a ten-track playlist as
+on a 100k-track one, and concurrent writers to one playlist serialize on
+its counter rows instead of racing to re-insert them.
+
+This module reads the aggregates, tracks which playlists a commit
+changed (for after-commit listeners such as membership.py), and
+`flask rebuild-aggregates` recomputes everything and reports drift,
+including in song_stats (per-song playlist counts, kept the same way).
+"""
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, orm, select
+
+from models import (db, Playlist, PlaylistArtistCount, PlaylistSong, PlaylistStats,
+                    Song, SongStats)
+
+# Keep IN-lists under SQLite's bound-parameter limit
+CHUNK_SIZE = 900
+TOP_ARTISTS = 3
+
+_PENDING = 'changing_playlists'
+_CHANGED = 'changed_playlists'
+
+_stats = PlaylistStats.__table__
+_artists = PlaylistArtistCount.__table__
+_song_stats = SongStats.__table__
+_playlist_song = PlaylistSong.__table__
+
+
+# Playlists without songs have no rows in either table
+
+def _computed_stats():
+    return (select(_playlist_song.c.playlist_id,
+                   func.count().label('song_count'))
+            .group_by(_playlist_song.c.playlist_id))
+
+
+def _computed_artists():
+    return (select(_playlist_song.c.playlist_id, Song.artist,
+                   func.count().label('song_count'))
+            .select_from(_playlist_song.join(Song.__table__,
+                                             Song.id == _playlist_song.c.song_id))
+            .group_by(_playlist_song.c.playlist_id, Song.artist))
+
+
+def _refresh(connection, playlist_ids):
+    stats, artists = _computed_stats(), _computed_artists()
+    delete_stats, delete_artists = _stats.delete(), _artists.delete()
+
+    if playlist_ids is not None:
+        stats = stats.where(_playlist_song.c.playlist_id.in_(playlist_ids))
+        artists = artists.where(_playlist_song.c.playlist_id.in_(playlist_ids))
+        delete_stats = delete_stats.where(_stats.c.playlist_id.in_(playlist_ids))
+        delete_artists = delete_artists.where(_artists.c.playlist_id.in_(playlist_ids))
+
+    connection.execute(delete_stats)
+    connection.execute(delete_artists)
+    connection.execute(_stats.insert().from_select(['playlist_id', 'song_count'], stats))
+    connection.execute(_artists.insert().from_select(['playlist_id', 'artist', 'song_count'],
+                                                     artists))
+
+
+def refresh(connection, playlist_ids=None):
+    """Recompute the aggregates of playlist_ids, or of every playlist.
+
+    For repairs and bulk loads only; writes keep them current.
+    """
+
+    if playlist_ids is None:
+        _refresh(connection, None)
+        return
+
+    playlist_ids = sorted(set(playlist_ids))
+    for start in range(0, len(playlist_ids), CHUNK_SIZE):
+        _refresh(connection, playlist_ids[start:start + CHUNK_SIZE])
+
+
+def drifted_playlists(connection):
+    """Ids of playlists whose stored aggregates differ from playlist_song."""
+
+    stored_stats = select(_stats.c.playlist_id, _stats.c.song_count)
+    stored_artists = select(_artists.c.playlist_id, _artists.c.artist, _artists.c.song_count)
+    computed_stats, computed_artists = _computed_stats(), _computed_artists()
+
+    differences = [computed_stats.except_(stored_stats),
+                   stored_stats.except_(computed_stats),
+                   computed_artists.except_(stored_artists),
+                   stored_artists.except_(computed_artists)]
+
+    drifted = set()
+    for difference in differences:
+        drifted.update(connection.execute(
+            select(difference.subquery().c.playlist_id)).scalars())
+    return sorted(drifted)
+
+
+# song_stats is kept by triggers too (see models.SongStats)
+
+def _computed_song_stats():
+    return (select(_playlist_song.c.song_id, func.count().label('playlist_count'))
+            .group_by(_playlist_song.c.song_id))
+
+
+def drifted_songs(connection):
+    """Ids of songs whose stored playlist count differs from playlist_song."""
+
+    stored = (select(_song_stats.c.song_id, _song_stats.c.playlist_count)
+              .where(_song_stats.c.playlist_count != 0))
+    computed = _computed_song_stats()
+
+    drifted = set()
+    for difference in (computed.except_(stored), stored.except_(computed)):
+        drifted.update(connection.execute(
+            select(difference.subquery().c.song_id)).scalars())
+    return sorted(drifted)
+
+
+def rebuild_song_stats(connection):
+    """Recount every song's playlists."""
+
+    connection.execute(_song_stats.delete())
+    connection.execute(_song_stats.insert().from_select(['song_id', 'playlist_count'],
+                                                        _computed_song_stats()))
+
+
+def top_artists_query(playlist_ids, limit=TOP_ARTISTS):
+    """SELECT (playlist_id, artist, song_count) of the top artists per playlist.
+
+    playlist_ids may be a list or a subquery of ids.
+    """
+
+    rank = func.row_number().over(partition_by=_artists.c.playlist_id,
+                                  order_by=(_artists.c.song_count.desc(), _artists.c.artist))
+    ranked = (select(_artists.c.playlist_id, _artists.c.artist, _artists.c.song_count,
+                     rank.label('rank'))
+              .where(_artists.c.playlist_id.in_(playlist_ids))
+              .subquery())
+
+    return (select(ranked.c.playlist_id, ranked.c.artist, ranked.c.song_count)
+            .where(ranked.c.rank <= limit)
+            .order_by(ranked.c.playlist_id, ranked.c.rank))
+
+
+def group_top_artists(rows):
+    """{playlist id: [(artist, song count)]} from top_artists_query rows."""
+
+    top = {}
+    for playlist_id, artist, song_count in rows:
+        top.setdefault(playlist_id, []).append((artist, song_count))
+    return top
+
+
+def top_artists(playlist_ids, limit=TOP_ARTISTS):
+    """{playlist id: [(artist, song count)]}, most frequent artists first."""
+
+    if not playlist_ids:
+        return {}
+    return group_top_artists(db.session.execute(top_artists_query(playlist_ids, limit)))
+
+
+def changed_on_commit(session, *playlist_ids):
+    """Report these playlists as changed by session's next commit.
+
+    For writers that bypass the ORM (see changed_playlists).
+    """
+
+    session.info.setdefault(_PENDING, set()).update(playlist_ids)
+
+
+def changed_playlists(session):
+    """Playlists whose songs session's last commit changed, once.
+
+    For after_commit listeners (see membership.py).
+    """
+
+    return session.info.pop(_CHANGED, set())
+
+
+# Session listeners
+
+def _playlists_of_songs(session, song_ids):
+    return session.execute(
+        select(_playlist_song.c.playlist_id)
+        .where(_playlist_song.c.song_id.in_(song_ids))).scalars().all()
+
+
+def _changed(obj, key):
+    history = orm.attributes.get_history(obj, key, passive=orm.attributes.PASSIVE_NO_INITIALIZE)
+    return list(history.added or ()) + list(history.deleted or ())
+
+
+def _before_flush(session, flush_context, instances):
+    # A deleted song's playlist_song rows are gone after the flush
+    deleted_song_ids = [obj.id for obj in session.deleted if isinstance(obj, Song)]
+    if deleted_song_ids:
+        changed_on_commit(session, *_playlists_of_songs(session, deleted_song_ids))
+
+
+def _after_flush(session, flush_context):
+    playlist_ids = set()
+
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, PlaylistSong):
+            playlist_ids.add(obj.playlist_id)
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Playlist) and _changed(obj, 'songs'):
+            playlist_ids.add(obj.id)
+        elif isinstance(obj, Song):
+            playlist_ids.update(playlist.id for playlist in _changed(obj, 'playlists'))
+
+    if playlist_ids:
+        changed_on_commit(session, *playlist_ids)
+
+
+def _before_commit(session):
+    # Flush first so the ORM listeners above have seen every pending change
+    session.flush()
+    session.info[_CHANGED] = session.info.pop(_PENDING, None) or set()
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop(_PENDING, None)
+    session.info.pop(_CHANGED, None)
+
+
+def maintain_aggregates(session):
+    """Track the playlists session's commits change (idempotent)."""
+
+    if not event.contains(session, 'before_commit', _before_commit):
+        event.listen(session, 'before_flush', _before_flush)
+        event.listen(session, 'after_flush', _after_flush)
+        event.listen(session, 'before_commit', _before_commit)
+        event.listen(session, 'after_soft_rollback', _after_rollback)
+
+
+@click.command('rebuild-aggregates')
+@click.option('--check', is_flag=True,
+              help='Only report playlists whose aggregates have drifted; exit 1 if any.')
+@with_appcontext
+def rebuild_aggregates_command(check):
+    """Recompute every playlist's track count and artist histogram.
+
+    Also recounts every song's playlists (song_stats).
+    """
+
+    connection = db.session.connection()
+    drifted = drifted_playlists(connection)
+    drifted_song_ids = drifted_songs(connection)
+
+    for ids, kind in ((drifted, 'playlist'), (drifted_song_ids, 'song')):
+        if ids:
+            shown = ', '.join(str(i) for i in ids[:20])
+            more = f' (and {len(ids) - 20} more)' if len(ids) > 20 else ''
+            click.echo(f"{len(ids)} {kind}(s) had drifted: {shown}{more}")
+    if not drifted and not drifted_song_ids:
+        click.echo("No drift.")
+
+    if check:
+        if drifted or drifted_song_ids:
+            raise SystemExit(1)
+        return
+
+    refresh(connection)
+    rebuild_song_stats(connection)
+    db.session.commit()
+    click.echo("Rebuilt aggregates for every playlist and song.")
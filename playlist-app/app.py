@@ -1,31 +1,135 @@
-from flask import Flask, redirect, render_template
+from flask import (Blueprint, Flask, Response, abort, current_app, jsonify, redirect,
+                   render_template, request, stream_with_context, url_for)
 from flask_debugtoolbar import DebugToolbarExtension
+from flask_migrate import Migrate
+from sqlalchemy import select
+from bisect import bisect_right
+from functools import wraps
 import os
 
-from models import db, connect_db, Playlist, Song, PlaylistSong
-from forms import NewSongForPlaylistForm, SongForm, PlaylistForm
-
-app = Flask(__name__)
-# Please do not modify the following line on submission
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
-    'DATABASE_URL', 'postgresql:///playlist-app')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
-
-connect_db(app)
-db.create_all()
-
-app.config['SECRET_KEY'] = "I'LL NEVER TELL!!"
-
-# Having the Debug Toolbar show redirects explicitly is often useful;
-# however, if you want to turn it off, you can uncomment this line:
-#
-# app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-
-debug = DebugToolbarExtension(app)
-
+from models import (db, connect_db, load_strategy, Playlist, PlaylistStats, Song,
+                    SongStats, PlaylistSong)
+from aggregates import (group_top_artists, maintain_aggregates, rebuild_aggregates_command,
+                        top_artists, top_artists_query)
+from async_db import async_db
+from cache import cache, playlist_key, song_key
+from choices import (playlist_choices, playlist_choices_among, song_choice, song_choices,
+                     song_choices_among)
+from db_audit import db_audit_command
+from dedupe import dedupe_songs_command, upsert_song
+from forms import (CombinePlaylistsForm, NewSongForPlaylistForm, NewSongsForPlaylistForm, SongForm,
+                   PlaylistForm)
+from export import MIMETYPES, export_chunks, export_command
+from importer import (ErrorSample, guess_format, import_songs, import_songs_command,
+                      text_lines)
+from instrumentation import instrumentation
+from membership import membership
+from movie_analytics import movies_cli
+from ordering import SongNotOnPlaylist, compact_positions_command, move_song
+from playlist_songs import CHUNK_SIZE, add_songs, remove_songs
+from recommend import build_recommendations_command, recommend_for_playlist, recommender
+from search import DEFAULT_LIMIT as SEARCH_LIMIT, search_songs
+from replicas import replicas
+from seed import seed_command
+from setops import UnknownPlaylists, clone_playlist, combine_playlists, playlists_cli
+from statements import playlist_or_404, songs_page, statements
+from versions import bump_on_commit, playlist_etag, playlist_version, track_versions
+from pagination import (DEFAULT_PAGE_SIZE, get_page_args, keyset_page, keyset_query, split_page,
+                        stream_rows, stream_template, wants_stream)
+
+bp = Blueprint("main", __name__)
+migrate = Migrate(render_as_batch=True)
+debug = DebugToolbarExtension()
+
+
+def create_app(config=None):
+    """Build the app; `config` overrides the settings read from the environment.
+
+    Nothing here touches the database: the engine and its pool are created
+    on first use and the schema is managed by `flask db upgrade`, so a
+    pre-forking server can build the app once and fork workers from it.
+    """
 
-@app.route("/")
+    app = Flask(__name__)
+    # Please do not modify the following line on submission
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+        'DATABASE_URL', 'postgresql:///playlist-app')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ECHO'] = os.environ.get('SQLALCHEMY_ECHO') == '1'
+
+    # Connection pool, per worker process: see models.PooledSQLAlchemy
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+
+    # Read replicas for GET / HEAD requests, comma-separated; see replicas.py
+    app.config['SQLALCHEMY_REPLICA_URIS'] = [
+        uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+
+    # Serve the playlist / song read routes as async views; see async_db.py
+    app.config['ASYNC_VIEWS'] = os.environ.get('ASYNC_VIEWS') == '1'
+
+    # Process-local playlist <-> song membership index; see membership.py
+    app.config['MEMBERSHIP_INDEX'] = os.environ.get('MEMBERSHIP_INDEX') == '1'
+
+    # Run the hot reads as server-side prepared statements (PostgreSQL
+    # only); see statements.py
+    app.config['PREPARED_STATEMENTS'] = os.environ.get('PREPARED_STATEMENTS') == '1'
+
+    # movies_db, for `flask movies` reports; see movie_analytics.py
+    app.config['MOVIES_DATABASE_URL'] = os.environ.get(
+        'MOVIES_DATABASE_URL', 'postgresql:///movies_db')
+
+    # Fraction of requests /metrics samples; 0 leaves the hooks switched off
+    app.config['METRICS_SAMPLE_RATE'] = float(
+        os.environ.get('METRICS_SAMPLE_RATE', 0))
+
+    # How the playlist page loads its songs: see models.LOADER_STRATEGIES
+    app.config['PLAYLIST_SONGS_LOADER'] = 'joined'
+
+    app.config['SECRET_KEY'] = "I'LL NEVER TELL!!"
+
+    # Having the Debug Toolbar show redirects explicitly is often useful;
+    # however, if you want to turn it off, you can uncomment this line:
+    #
+    # app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+
+    if config:
+        app.config.update(config)
+
+    connect_db(app)
+    replicas.init_app(app, db.session)
+    migrate.init_app(app, db)
+    cache.init_app(app, db.session)
+    membership.init_app(app, db.session)
+    statements.init_app(app)
+    track_versions(db.session)
+    maintain_aggregates(db.session)
+    instrumentation.init_app(app)
+    async_db.init_app(app)
+    recommender.init_app(app)
+    debug.init_app(app)
+
+    app.register_blueprint(bp)
+    if app.config['ASYNC_VIEWS']:
+        app.view_functions.update(ASYNC_VIEWS)
+    app.cli.add_command(export_command)
+    app.cli.add_command(import_songs_command)
+    app.cli.add_command(movies_cli)
+    app.cli.add_command(playlists_cli)
+    app.cli.add_command(compact_positions_command)
+    app.cli.add_command(db_audit_command)
+    app.cli.add_command(dedupe_songs_command)
+    app.cli.add_command(rebuild_aggregates_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(build_recommendations_command)
+
+    return app
+
+
+@bp.route("/")
 def root():
     """Homepage: redirect to /playlists."""
 
@@ -36,22 +140,50 @@ def root():
 # Playlist routes
 
 
-@app.route("/playlists")
+@bp.route("/playlists")
 def show_all_playlists():
-    """Return a list of playlists."""
+    """Return a page of playlists.
+
+    Paged by id with ?after=<last id>&limit=<n>; ?stream=1 streams them all.
+    """
+
+    query = (Playlist.query
+             .outerjoin(PlaylistStats, PlaylistStats.playlist_id == Playlist.id)
+             .with_entities(Playlist.id, Playlist.name,
+                            db.func.coalesce(PlaylistStats.song_count, 0)
+                            .label('song_count')))
 
-    playlists = Playlist.query.all()
-    return render_template("playlists.html", playlists=playlists)
+    if wants_stream():
+        return stream_template("playlists.html",
+                               playlists=stream_rows(query, Playlist.id))
 
+    after, limit = get_page_args()
+    playlists, next_after = keyset_page(query, Playlist.id, after, limit)
+    return render_template("playlists.html",
+                           playlists=playlists,
+                           top_artists=top_artists([p.id for p in playlists]),
+                           next_after=next_after,
+                           limit=limit)
 
-@app.route("/playlists/<int:playlist_id>")
+
+@bp.route("/playlists/<int:playlist_id>")
 def show_playlist(playlist_id):
     """Show detail on specific playlist."""
 
-    # ADD THE NECESSARY CODE HERE FOR THIS ROUTE TO WORK
+    def load():
+        songs_loader = load_strategy(Playlist.songs,
+                                     current_app.config['PLAYLIST_SONGS_LOADER'])
+        playlist = Playlist.query.options(songs_loader).get_or_404(playlist_id)
+        return dict(playlist.serialize(),
+                    songs=[song.serialize() for song in playlist.songs])
+
+    playlist = cache.get_or_set(playlist_key(playlist_id), _from_primary(load))
+    recommended = recommend_for_playlist(playlist_id,
+                                         [song['id'] for song in playlist['songs']])
+    return render_template("playlist.html", playlist=playlist, recommended=recommended)
 
 
-@app.route("/playlists/add", methods=["GET", "POST"])
+@bp.route("/playlists/add", methods=["GET", "POST"])
 def add_playlist():
     """Handle add-playlist form:
 
@@ -59,61 +191,708 @@ def add_playlist():
     - if valid: add playlist to SQLA and redirect to list-of-playlists
     """
 
-    # ADD THE NECESSARY CODE HERE FOR THIS ROUTE TO WORK
+    form = PlaylistForm()
+
+    if form.validate_on_submit():
+        playlist = Playlist(name=form.name.data,
+                            description=form.description.data)
+        db.session.add(playlist)
+        db.session.flush()
+        cache.invalidate_on_commit(db.session, playlist_key(playlist.id))
+        db.session.commit()
+
+        return redirect("/playlists")
+
+    return render_template("new_playlist.html", form=form)
+
+
+@bp.route("/playlists/<int:playlist_id>/clone", methods=["GET", "POST"])
+def clone_playlist_form(playlist_id):
+    """Copy a playlist under a new name and redirect to the copy."""
+
+    playlist = playlist_or_404(playlist_id)
+    form = PlaylistForm(data={'name': f"{playlist.name} (copy)",
+                              'description': playlist.description})
+
+    if form.validate_on_submit():
+        new_id, _ = clone_playlist(playlist_id, form.name.data, form.description.data)
+        db.session.commit()
+
+        return redirect(f"/playlists/{new_id}")
+
+    return render_template("clone_playlist.html", playlist=playlist, form=form)
+
+
+@bp.route("/playlists/combine", methods=["GET", "POST"])
+def combine_playlists_form():
+    """Make a playlist out of two or more others and redirect to it."""
+
+    form = CombinePlaylistsForm()
+    search = request.args.get("q")
+
+    if form.is_submitted():
+        form.first.choices = playlist_choices_among([form.first.data])
+        form.playlists.choices = playlist_choices_among(form.playlists.data)
+
+    if form.validate_on_submit():
+        # The first playlist as chosen, then the others by id
+        playlist_ids = [form.first.data] + sorted(form.playlists.data)
+        try:
+            new_id, _ = combine_playlists(form.operation.data, playlist_ids,
+                                          form.name.data, form.description.data)
+        except ValueError as exc:
+            form.playlists.errors.append(str(exc))
+        else:
+            db.session.commit()
+            return redirect(f"/playlists/{new_id}")
+
+    form.first.choices = form.playlists.choices = playlist_choices(search)
+
+    return render_template("combine_playlists.html", form=form, search=search)
 
 
 ##############################################################################
 # Song routes
 
 
-@app.route("/songs")
+@bp.route("/songs")
 def show_all_songs():
-    """Show list of songs."""
+    """Show a page of songs.
+
+    Paged by id with ?after=<last id>&limit=<n>; ?stream=1 streams them all.
+    """
+
+    if wants_stream():
+        query = Song.query.with_entities(Song.id, Song.title)
+        return stream_template("songs.html",
+                               songs=stream_rows(query, Song.id))
+
+    after, limit = get_page_args()
+    songs, next_after = songs_page(after, limit)
+    return render_template("songs.html",
+                           songs=songs,
+                           next_after=next_after,
+                           limit=limit)
+
+
+@bp.route("/songs/search")
+def search_songs_page():
+    """Ranked full-text search over song titles and artists.
+
+    ?q=<words>; page on with ?after=<cursor from the previous page>.
+    """
+
+    q = request.args.get("q", "")
+    results, next_after = search_songs(q,
+                                       request.args.get("after"),
+                                       request.args.get("limit", SEARCH_LIMIT, type=int))
+    return render_template("search.html",
+                           q=q,
+                           results=results,
+                           next_after=next_after)
 
-    songs = Song.query.all()
-    return render_template("songs.html", songs=songs)
 
+@bp.route("/api/v1/songs/search")
+def search_songs_api():
+    """JSON version of /songs/search."""
 
-@app.route("/songs/<int:song_id>")
+    results, next_after = search_songs(request.args.get("q", ""),
+                                       request.args.get("after"),
+                                       request.args.get("limit", SEARCH_LIMIT, type=int))
+    return jsonify(results=[{"id": song_id, "title": title, "artist": artist, "score": score}
+                            for song_id, title, artist, score in results],
+                   next_after=next_after)
+
+
+@bp.route("/songs/<int:song_id>")
 def show_song(song_id):
-    """return a specific song"""
+    """return a specific song, with a page of the playlists it is on"""
+
+    after, limit = get_page_args()
+
+    def load():
+        song = db.session.execute(_song_row(song_id)).first()
+        if song is None:
+            abort(404)
+        playlists, next_after = _song_playlist_page(song_id, after, limit)
+        return dict(song._mapping, playlists=playlists, next_after=next_after)
+
+    song = _cached_song(song_id, after, limit, load)
+    return render_template("song.html", song=song, limit=limit)
+
+
+def _song_row(song_id):
+    """The song and the number of playlists it is on, from song_stats."""
+
+    return (select(Song.id, Song.title, Song.artist,
+                   db.func.coalesce(SongStats.playlist_count, 0).label('playlist_count'))
+            .outerjoin(SongStats, SongStats.song_id == Song.id)
+            .where(Song.id == song_id))
+
+
+def _song_playlists(song_id, after, limit):
+    """A keyset page of the playlists song_id is on, read off the
+    (song_id, playlist_id) index of playlist_song."""
+
+    return keyset_query(select(PlaylistSong.playlist_id, Playlist.name)
+                        .join(Playlist, Playlist.id == PlaylistSong.playlist_id)
+                        .where(PlaylistSong.song_id == song_id),
+                        PlaylistSong.playlist_id, after, limit)
+
+
+def _playlist_page(rows, limit):
+    rows, next_after = split_page(rows, PlaylistSong.playlist_id, limit)
+    return [{'id': row.playlist_id, 'name': row.name} for row in rows], next_after
 
-    # ADD THE NECESSARY CODE HERE FOR THIS ROUTE TO WORK
 
+def _song_playlist_page(song_id, after, limit):
+    """([{'id', 'name'}], next_after) for the playlists song_id is on."""
 
-@app.route("/songs/add", methods=["GET", "POST"])
+    if membership.enabled():
+        playlist_ids = membership.playlists_of(song_id)
+        start = bisect_right(playlist_ids, after) if after is not None else 0
+        page_ids = playlist_ids[start:start + limit + 1]
+        next_after = page_ids[limit - 1] if len(page_ids) > limit else None
+        return _playlists_named(page_ids[:limit]), next_after
+
+    return _playlist_page(
+        db.session.execute(_song_playlists(song_id, after, limit)).all(), limit)
+
+
+def _cached_song(song_id, after, limit, load):
+    """Only the first page, at the default size, is cached (under song_key)."""
+
+    if after is None and limit == DEFAULT_PAGE_SIZE:
+        return cache.get_or_set(song_key(song_id), _from_primary(load))
+    return load()
+
+
+def _from_primary(load):
+    """load, reading from the primary, for a cache miss (see replicas.py)."""
+
+    def load_from_primary():
+        with replicas.primary():
+            return load()
+    return load_from_primary
+
+
+def _playlists_named(playlist_ids):
+    """[{'id', 'name'}] of playlist_ids, in id order."""
+
+    playlist_ids = list(playlist_ids)
+    playlists = []
+    for start in range(0, len(playlist_ids), CHUNK_SIZE):
+        playlists.extend(
+            {'id': playlist_id, 'name': name} for playlist_id, name in db.session.execute(
+                select(Playlist.id, Playlist.name)
+                .where(Playlist.id.in_(playlist_ids[start:start + CHUNK_SIZE]))
+                .order_by(Playlist.id)))
+    return playlists
+
+
+@bp.route("/songs/add", methods=["GET", "POST"])
 def add_song():
     """Handle add-song form:
 
     - if form not filled out or invalid: show form
-    - if valid: add playlist to SQLA and redirect to list-of-songs
+    - if valid: add song (unless the same normalized title and artist is
+      already there) and redirect to list-of-songs
     """
 
-    # ADD THE NECESSARY CODE HERE FOR THIS ROUTE TO WORK
+    form = SongForm()
 
+    if form.validate_on_submit():
+        song_id, created = upsert_song(form.title.data, form.artist.data)
+        if created:
+            cache.invalidate_on_commit(db.session, song_key(song_id))
+        db.session.commit()
 
-@app.route("/playlists/<int:playlist_id>/add-song", methods=["GET", "POST"])
-def add_song_to_playlist(playlist_id):
-    """Add a playlist and redirect to list."""
+        return redirect("/songs")
+
+    return render_template("new_song.html", form=form)
+
+
+@bp.route("/songs/import", methods=["POST"])
+def import_songs_upload():
+    """Bulk-import songs from an uploaded CSV / JSONL file.
+
+    The upload goes in the `file` field; ?format=csv|jsonl overrides the
+    file extension. Responds with counts and the first rejected rows.
+    """
+
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify(error="No file uploaded"), 400
+
+    fmt = request.args.get("format") or guess_format(upload.filename or "")
+    if fmt not in ("csv", "jsonl"):
+        return jsonify(error="Unknown format; pass ?format=csv or jsonl"), 400
+
+    errors = ErrorSample()
+    result = import_songs(text_lines(upload.stream), fmt, errors=errors)
+
+    return jsonify(processed=result.processed,
+                   inserted=result.inserted,
+                   failed=result.failed,
+                   errors=errors.rows)
+
+
+def _export(fmt, filename, playlist_id=None):
+    """Stream an export; gzip it when the client accepts gzip."""
+
+    compress = 'gzip' in request.accept_encodings
+    try:
+        chunks = export_chunks(fmt, playlist_id, compress,
+                               lambda song_id: url_for("main.show_song", song_id=song_id,
+                                                       _external=True))
+    except LookupError:
+        abort(404)
 
-    # BONUS - ADD THE NECESSARY CODE HERE FOR THIS ROUTE TO WORK
+    response = Response(stream_with_context(chunks), mimetype=MIMETYPES[fmt])
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.vary.add("Accept-Encoding")
+    if compress:
+        response.content_encoding = "gzip"
+    return response
 
-    # THE SOLUTION TO THIS IS IN A HINT IN THE ASSESSMENT INSTRUCTIONS
 
-    playlist = Playlist.query.get_or_404(playlist_id)
+@bp.route("/playlists/<int:playlist_id>/export.<any(csv, jsonl, m3u):fmt>")
+def export_playlist(playlist_id, fmt):
+    """Download a playlist's songs, in order, as CSV, JSONL or M3U."""
+
+    return _export(fmt, f"playlist-{playlist_id}.{fmt}", playlist_id)
+
+
+@bp.route("/songs/export.<any(csv, jsonl, m3u):fmt>")
+def export_songs(fmt):
+    """Download the whole catalog as CSV, JSONL or M3U."""
+
+    return _export(fmt, f"songs.{fmt}")
+
+
+@bp.route("/playlists/<int:playlist_id>/add-song", methods=["GET", "POST"])
+def add_song_to_playlist(playlist_id):
+    """Add a playlist and redirect to list."""
+
+    playlist = playlist_or_404(playlist_id)
     form = NewSongForPlaylistForm()
+    search = request.args.get("q")
 
-    # Restrict form to songs not already on this playlist
+    # Restrict form to songs not already on this playlist. A POST only has
+    # to check the one submitted song, not build the whole choice list.
 
-    curr_on_playlist = ...
-    form.song.choices = ...
+    if form.is_submitted():
+        form.song.choices = song_choice(playlist_id, form.song.data)
 
     if form.validate_on_submit():
-
-        # ADD THE NECESSARY CODE HERE FOR THIS ROUTE TO WORK
+        db.session.add(PlaylistSong(playlist_id=playlist_id,
+                                    song_id=form.song.data))
+        cache.invalidate_on_commit(db.session,
+                                   playlist_key(playlist_id),
+                                   song_key(form.song.data))
+        bump_on_commit(db.session, playlist_id)
+        db.session.commit()
 
         return redirect(f"/playlists/{playlist_id}")
 
+    form.song.choices = song_choices(playlist_id, search)
+    if not search:
+        # Suggestions first, as their own group of the dropdown
+        suggested = [(song_id, title) for song_id, title, _
+                     in recommend_for_playlist(playlist_id)]
+        if suggested:
+            form.song.choices = {"Suggested": suggested,
+                                 "All songs": form.song.choices}
+
     return render_template("add_song_to_playlist.html",
                            playlist=playlist,
-                           form=form)
+                           form=form,
+                           search=search)
+
+
+@bp.route("/playlists/<int:playlist_id>/add-song/choices")
+def add_song_to_playlist_choices(playlist_id):
+    """Typeahead source: songs matching ?q= not already on the playlist."""
+
+    choices = song_choices(playlist_id, request.args.get("q"))
+    return jsonify([{"id": song_id, "title": title}
+                    for song_id, title in choices])
+
+
+@bp.route("/playlists/<int:playlist_id>/add-songs", methods=["GET", "POST"])
+def add_songs_to_playlist(playlist_id):
+    """Add several songs to a playlist in one go and redirect to it."""
+
+    playlist = playlist_or_404(playlist_id)
+    form = NewSongsForPlaylistForm()
+    search = request.args.get("q")
+
+    if form.is_submitted():
+        form.songs.choices = song_choices_among(playlist_id, form.songs.data)
+
+    if form.validate_on_submit():
+        if add_songs(playlist_id, form.songs.data):
+            bump_on_commit(db.session, playlist_id)
+        cache.invalidate_on_commit(db.session,
+                                   playlist_key(playlist_id),
+                                   *(song_key(song_id) for song_id in form.songs.data))
+        db.session.commit()
+
+        return redirect(f"/playlists/{playlist_id}")
+
+    form.songs.choices = song_choices(playlist_id, search)
+
+    return render_template("add_songs_to_playlist.html",
+                           playlist=playlist,
+                           form=form,
+                           search=search)
+
+
+@bp.route("/playlists/<int:playlist_id>/songs/batch", methods=["POST"])
+def batch_playlist_songs(playlist_id):
+    """Add and/or remove many songs in one transaction.
+
+    Takes JSON {"add": [song ids], "remove": [song ids]}; songs already on
+    the playlist (or not on it, for removal) are skipped.
+    """
+
+    playlist_or_404(playlist_id)
+    body = request.get_json(silent=True) or {}
+    to_add = body.get("add", [])
+    to_remove = body.get("remove", [])
+
+    for ids in (to_add, to_remove):
+        if not isinstance(ids, list) or not all(type(i) is int for i in ids):
+            return jsonify(error="'add' and 'remove' must be lists of song ids"), 400
+
+    added = add_songs(playlist_id, to_add)
+    removed = remove_songs(playlist_id, to_remove)
+    if added or removed:
+        bump_on_commit(db.session, playlist_id)
+    cache.invalidate_on_commit(db.session,
+                               playlist_key(playlist_id),
+                               *(song_key(song_id) for song_id in to_add + to_remove))
+    db.session.commit()
+
+    return jsonify(added=added, removed=removed)
+
+
+@bp.route("/playlists/<int:playlist_id>/songs/<int:song_id>/move",
+           methods=["POST"])
+def move_playlist_song(playlist_id, song_id):
+    """Move a song within a playlist.
+
+    Takes JSON {"after": <song id>} to place it right after that song, or
+    {"after": null} to move it to the top.
+    """
+
+    after = (request.get_json(silent=True) or {}).get("after")
+    if after is not None and type(after) is not int:
+        return jsonify(error="'after' must be a song id or null"), 400
+
+    try:
+        move_song(playlist_id, song_id, after)
+    except SongNotOnPlaylist as exc:
+        return jsonify(error=f"Song {exc.args[0]} is not on this playlist"), 404
+
+    cache.invalidate_on_commit(db.session, playlist_key(playlist_id))
+    bump_on_commit(db.session, playlist_id)
+    db.session.commit()
+
+    return jsonify(moved=song_id, after=after)
+
+
+##############################################################################
+# JSON API
+#
+# Built from plain row tuples rather than model instances. Every response
+# carries an ETag; a matching If-None-Match gets an empty 304. For a single
+# playlist the ETag comes from its playlist_versions row (see versions.py),
+# so a 304 is decided from that row alone.
+
+
+def _rows(rows):
+    return [dict(row._mapping) for row in rows]
+
+
+def _playlist_row(playlist_id):
+    return (select(Playlist.id, Playlist.name, Playlist.description)
+            .where(Playlist.id == playlist_id))
+
+
+def _playlist_songs(playlist_id):
+    return (select(Song.id, Song.title, Song.artist)
+            .join(PlaylistSong, PlaylistSong.song_id == Song.id)
+            .where(PlaylistSong.playlist_id == playlist_id)
+            .order_by(PlaylistSong.position, PlaylistSong.song_id))
+
+
+@bp.route("/api/v1/playlists")
+def api_playlists():
+    """A page of playlists; paged like /playlists."""
+
+    query = db.session.query(Playlist.id, Playlist.name, Playlist.description)
+    after, limit = get_page_args()
+    playlists, next_after = keyset_page(query, Playlist.id, after, limit)
+
+    response = jsonify(playlists=_rows(playlists), next_after=next_after)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@bp.route("/api/v1/playlists/<int:playlist_id>")
+def api_playlist(playlist_id):
+    """A playlist and its songs, in playlist order."""
+
+    version = playlist_version(db.session.connection(), playlist_id)
+
+    def conditional(response):
+        if version is not None:
+            response.set_etag(playlist_etag(playlist_id, version.version))
+            response.last_modified = version.updated_at
+        return response.make_conditional(request)
+
+    if version is not None:
+        not_modified = conditional(current_app.response_class())
+        if not_modified.status_code == 304:
+            return not_modified
+
+    playlist = db.session.execute(_playlist_row(playlist_id)).first()
+    if playlist is None:
+        abort(404)
+
+    songs = db.session.execute(_playlist_songs(playlist_id))
+    return conditional(jsonify(dict(playlist._mapping, songs=_rows(songs))))
+
+
+@bp.route("/api/v1/playlists/<int:playlist_id>/clone", methods=["POST"])
+def api_clone_playlist(playlist_id):
+    """Copy a playlist. Takes JSON {"name": ..., "description": ...}."""
+
+    body = request.get_json(silent=True) or {}
+    name = body.get("name")
+    if not isinstance(name, str) or not name.strip():
+        return jsonify(error="'name' is required"), 400
+
+    try:
+        new_id, songs = clone_playlist(playlist_id, name, body.get("description"))
+    except UnknownPlaylists:
+        abort(404)
+    return _created_playlist(new_id, songs)
+
+
+@bp.route("/api/v1/playlists/combine", methods=["POST"])
+def api_combine_playlists():
+    """Make a playlist out of others.
+
+    Takes JSON {"operation": "union" | "intersect" | "difference",
+    "playlists": [ids], "name": ..., "description": ...}; difference
+    keeps the first playlist's songs that are on none of the others.
+    """
+
+    body = request.get_json(silent=True) or {}
+    name = body.get("name")
+    playlist_ids = body.get("playlists")
+    if not isinstance(name, str) or not name.strip():
+        return jsonify(error="'name' is required"), 400
+    if not isinstance(playlist_ids, list) or not all(type(i) is int for i in playlist_ids):
+        return jsonify(error="'playlists' must be a list of playlist ids"), 400
+
+    try:
+        new_id, songs = combine_playlists(body.get("operation"), playlist_ids, name,
+                                          body.get("description"))
+    except UnknownPlaylists as exc:
+        return jsonify(error=f"No playlist(s) {exc.args[0]}"), 404
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+    return _created_playlist(new_id, songs)
+
+
+def _created_playlist(playlist_id, songs):
+    db.session.commit()
+    response = jsonify(id=playlist_id, songs=songs)
+    response.status_code = 201
+    response.headers['Location'] = url_for('main.api_playlist', playlist_id=playlist_id)
+    return response
+
+
+@bp.route("/api/v1/songs")
+def api_songs():
+    """A page of songs; paged like /songs."""
+
+    query = db.session.query(Song.id, Song.title, Song.artist)
+    after, limit = get_page_args()
+    songs, next_after = keyset_page(query, Song.id, after, limit)
+
+    response = jsonify(songs=_rows(songs), next_after=next_after)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@bp.route("/api/v1/songs/<int:song_id>")
+def api_song(song_id):
+    """A song and the number of playlists it is on."""
+
+    song = db.session.execute(_song_row(song_id)).first()
+    if song is None:
+        abort(404)
+    return jsonify(dict(song._mapping))
+
+
+@bp.route("/api/v1/songs/<int:song_id>/playlists")
+def api_song_playlists(song_id):
+    """A page of the playlists a song is on, by playlist id; paged like /songs."""
+
+    after, limit = get_page_args()
+    playlists, next_after = _song_playlist_page(song_id, after, limit)
+    if not playlists and db.session.get(Song, song_id) is None:
+        abort(404)
+
+    response = jsonify(playlists=playlists, next_after=next_after)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+##############################################################################
+# Async read routes
+#
+# With ASYNC_VIEWS on, create_app() swaps these in for the sync views of
+# the same endpoints. They run the same queries through async_db, with a
+# page's independent queries issued concurrently, and share the cache
+# entries (and so the dict shapes) of the sync versions.
+
+
+def _read_engine():
+    return async_db.engine(current_app._get_current_object(), replicas.read_bind())
+
+
+def _primary_engine():
+    """For cache misses, as _from_primary() is for the sync views."""
+
+    return async_db.engine(current_app._get_current_object())
+
+
+async def show_all_playlists_async():
+    """show_all_playlists() on the asyncio engine."""
+
+    after, limit = get_page_args()
+    page = keyset_query(select(Playlist.id, Playlist.name,
+                               db.func.coalesce(PlaylistStats.song_count, 0)
+                               .label('song_count'))
+                        .outerjoin(PlaylistStats, PlaylistStats.playlist_id == Playlist.id),
+                        Playlist.id, after, limit)
+    page_ids = page.with_only_columns(Playlist.id).scalar_subquery()
+
+    rows, artist_rows = await async_db.fetch(_read_engine(), page,
+                                             top_artists_query(page_ids))
+    playlists, next_after = split_page(rows, Playlist.id, limit)
+    return render_template("playlists.html",
+                           playlists=playlists,
+                           top_artists=group_top_artists(artist_rows),
+                           next_after=next_after,
+                           limit=limit)
+
+
+async def show_playlist_async(playlist_id):
+    """show_playlist() on the asyncio engine."""
+
+    async def load():
+        playlists, songs = await async_db.fetch(_primary_engine(),
+                                                _playlist_row(playlist_id),
+                                                _playlist_songs(playlist_id))
+        if not playlists:
+            abort(404)
+        return dict(playlists[0]._mapping, songs=_rows(songs))
+
+    playlist = await cache.get_or_set_async(playlist_key(playlist_id), load)
+    recommended = await recommender.recommend_async(
+        _read_engine(), [song['id'] for song in playlist['songs']])
+    return render_template("playlist.html", playlist=playlist, recommended=recommended)
+
+
+async def show_all_songs_async():
+    """show_all_songs() on the asyncio engine."""
+
+    after, limit = get_page_args()
+    page = keyset_query(select(Song.id, Song.title), Song.id, after, limit)
+
+    [rows] = await async_db.fetch(_read_engine(), page)
+    songs, next_after = split_page(rows, Song.id, limit)
+    return render_template("songs.html",
+                           songs=songs,
+                           next_after=next_after,
+                           limit=limit)
+
+
+async def show_song_async(song_id):
+    """show_song() on the asyncio engine."""
+
+    after, limit = get_page_args()
+
+    async def load(engine):
+        songs, playlists = await async_db.fetch(
+            engine, _song_row(song_id), _song_playlists(song_id, after, limit))
+        if not songs:
+            abort(404)
+        playlists, next_after = _playlist_page(playlists, limit)
+        return dict(songs[0]._mapping, playlists=playlists, next_after=next_after)
+
+    if after is None and limit == DEFAULT_PAGE_SIZE:
+        song = await cache.get_or_set_async(song_key(song_id),
+                                            lambda: load(_primary_engine()))
+    else:
+        song = await load(_read_engine())
+    return render_template("song.html", song=song, limit=limit)
+
+
+def _unless_streaming(async_view, sync_view):
+    """Serve ?stream=1 from the sync view.
+
+    A streamed body outlives the event loop an async view runs in.
+    """
+
+    @wraps(async_view)
+    def view(**kwargs):
+        if wants_stream():
+            return sync_view(**kwargs)
+        return current_app.ensure_sync(async_view)(**kwargs)
+
+    return view
+
+
+ASYNC_VIEWS = {
+    'main.show_all_playlists': _unless_streaming(show_all_playlists_async,
+                                                 show_all_playlists),
+    'main.show_playlist': show_playlist_async,
+    'main.show_all_songs': _unless_streaming(show_all_songs_async, show_all_songs),
+    'main.show_song': show_song_async,
+}
+
+
+##############################################################################
+# Metrics
+
+
+@bp.route("/metrics")
+def metrics():
+    """Per-route query counts, SQL time, latency and slowest statements."""
+
+    return jsonify(dict(instrumentation.report(), cache=cache.stats()))
+
+
+@bp.route("/metrics/cache")
+def cache_metrics():
+    """Detail-page cache hits, misses and hit ratio."""
+
+    return jsonify(cache.stats())
+
+
+@bp.route("/metrics/membership")
+def membership_metrics():
+    """Membership index size: edges, keys and bytes per million edges."""
+
+    return jsonify(membership.stats())
+
+
+# For `flask run` and the tests; gunicorn can use "app:create_app()"
+app = create_app()
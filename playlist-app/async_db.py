@@ -0,0 +1,105 @@
+"""asyncio database access for the async read routes.
+
+With ASYNC_VIEWS on, the playlist and song read routes run as Flask
+async views and query through SQLAlchemy's asyncio engine (asyncpg on
+PostgreSQL, aiosqlite on SQLite), issuing a page's independent queries
+concurrently instead of one after another.
+
+Flask runs every async view in an event loop of its own, and pooled
+asyncpg / aiosqlite connections belong to the loop that opened them.
+So the engines live on one long-running loop in a background thread,
+started on first use (after any pre-fork), and views await their
+queries there. Each connection pool is therefore shared by all requests
+of the process, just like the sync engine's.
+"""
+
+import asyncio
+from threading import Lock, Thread
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from models import db
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_url(url):
+    """The asyncio-driver equivalent of a sync engine URL."""
+
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for {backend!r} databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncDatabase:
+    """asyncio engines, one per bind, driven from a background event loop."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._loop = None
+        self._engines = {}
+
+    def init_app(self, app):
+        app.config.setdefault('ASYNC_VIEWS', False)
+        app.extensions['async_db'] = self
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                Thread(target=self._loop.run_forever, name='async-db', daemon=True).start()
+            return self._loop
+
+    def engine(self, app, bind=None):
+        """The asyncio engine for a bind (None is the primary)."""
+
+        url = async_url(db.get_engine(app, bind=bind).url)
+        key = str(url)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                options = {'pool_pre_ping': bool(app.config.get('DB_POOL_PRE_PING'))}
+                if url.get_backend_name() != 'sqlite':
+                    options.update(pool_size=app.config['DB_POOL_SIZE'],
+                                   max_overflow=app.config['DB_MAX_OVERFLOW'],
+                                   pool_timeout=app.config['DB_POOL_TIMEOUT'],
+                                   pool_recycle=app.config['DB_POOL_RECYCLE'])
+                engine = self._engines[key] = create_async_engine(url, **options)
+            return engine
+
+    async def _fetch(self, engine, stmt):
+        async with engine.connect() as connection:
+            return (await connection.execute(stmt)).all()
+
+    async def _fetch_all(self, engine, statements):
+        return await asyncio.gather(*(self._fetch(engine, stmt) for stmt in statements))
+
+    async def fetch(self, engine, *statements):
+        """Run statements concurrently, each on its own pooled connection.
+
+        Returns a list of row lists, one per statement.
+        """
+
+        future = asyncio.run_coroutine_threadsafe(self._fetch_all(engine, statements),
+                                                  self._get_loop())
+        return await asyncio.wrap_future(future)
+
+    async def _dispose(self, engines):
+        for engine in engines:
+            await engine.dispose()
+
+    def dispose(self):
+        """Close every pooled connection (e.g. between tests)."""
+
+        with self._lock:
+            engines, self._engines = list(self._engines.values()), {}
+        if engines:
+            asyncio.run_coroutine_threadsafe(self._dispose(engines),
+                                             self._get_loop()).result()
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,121 @@
+"""Throughput and tail latency of the sync vs async read routes.
+
+    python -m benchmarks.async_views [--concurrency 64] [--requests 4000]
+                                     [--database-url URL]
+
+Builds one app with ASYNC_VIEWS off and one with it on over the same
+database and drives each with --concurrency client threads, spread over
+/playlists, /playlists/<id>, /songs and /songs/<id>. The detail cache is
+switched off so every request reaches the database. Without a
+--database-url a temporary SQLite file is created and filled.
+
+Flask runs each async view to completion inside its request's worker
+thread, so the win comes from a page's independent queries running
+concurrently and from pool behaviour under load, not from freeing
+workers; compare with the database you deploy on.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+PLAYLISTS = 200
+SONGS = 2000
+SONGS_PER_PLAYLIST = 30
+
+
+def _seed(app):
+    from models import db, Playlist, Song
+    from playlist_songs import add_songs
+
+    with app.app_context():
+        db.create_all()
+        if Playlist.query.first() is not None:
+            return
+
+        db.session.execute(Song.__table__.insert(),
+                           [{'title': f'Song {i}', 'artist': f'Artist {i % 97}'}
+                            for i in range(SONGS)])
+        db.session.execute(Playlist.__table__.insert(),
+                           [{'name': f'Playlist {i}'} for i in range(PLAYLISTS)])
+        db.session.commit()
+
+        rng = random.Random(0)
+        for playlist_id in range(1, PLAYLISTS + 1):
+            add_songs(playlist_id, rng.sample(range(1, SONGS + 1), SONGS_PER_PLAYLIST))
+        db.session.commit()
+
+
+def _paths(n, seed=1):
+    rng = random.Random(seed)
+    choices = [lambda: '/playlists',
+               lambda: f'/playlists/{rng.randint(1, PLAYLISTS)}',
+               lambda: '/songs',
+               lambda: f'/songs/{rng.randint(1, SONGS)}']
+    return [rng.choice(choices)() for _ in range(n)]
+
+
+def run(app, paths, concurrency):
+    """Return (elapsed seconds, per-request latencies) for GETs of paths."""
+
+    def get(path):
+        started = perf_counter()
+        with app.test_client() as client:
+            status = client.get(path).status_code
+        if status != 200:
+            raise RuntimeError(f"GET {path} returned {status}")
+        return perf_counter() - started
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(get, paths[:concurrency]))  # warm the pools
+        started = perf_counter()
+        latencies = list(pool.map(get, paths))
+    return perf_counter() - started, latencies
+
+
+def _report(name, elapsed, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:>6}: {len(latencies) / elapsed:8.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.2f} ms  p99 {p99:7.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.database_url is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.database_url = f"sqlite:///{os.path.join(tmp.name, 'async_views.db')}"
+
+    from app import create_app
+    from async_db import async_db
+
+    config = {'SQLALCHEMY_DATABASE_URI': args.database_url,
+              'CACHE_BACKEND': 'null',
+              'DB_POOL_SIZE': args.concurrency,
+              'DB_MAX_OVERFLOW': args.concurrency}
+    sync_app = create_app(dict(config, ASYNC_VIEWS=False))
+    async_app = create_app(dict(config, ASYNC_VIEWS=True))
+    _seed(sync_app)
+
+    paths = _paths(args.requests)
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {args.database_url}")
+    _report('sync', *run(sync_app, paths, args.concurrency))
+    _report('async', *run(async_app, paths, args.concurrency))
+
+    async_db.dispose()
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Synthetic catalogs for the benchmark suite.
+
+A catalog is N songs plus playlists whose lengths are spread
+log-uniformly between MIN_TRACKS and MAX_TRACKS, with one playlist of
+each extreme so both ends are always measured. Everything is inserted
+with seed.bulk_insert (COPY on PostgreSQL, executemany elsewhere); the
+aggregates follow by trigger and playlist versions are filled
+set-at-a-time.
+"""
+
+import math
+import random
+
+from sqlalchemy import func, select
+
+from models import db, dedupe_key, POSITION_GAP, Playlist, PlaylistSong, Song
+from seed import bulk_insert
+from versions import bump
+
+MIN_TRACKS = 10
+MAX_TRACKS = 10000
+
+CATALOGS = {
+    'tiny': {'songs': 500, 'playlists': 10, 'max_tracks': 100},
+    'small': {'songs': 10000, 'playlists': 100, 'max_tracks': MAX_TRACKS},
+    'large': {'songs': 1000000, 'playlists': 1000, 'max_tracks': MAX_TRACKS},
+}
+
+
+def playlist_lengths(playlists, max_tracks, rng):
+    """Track counts for each playlist: the two extremes, then log-uniform."""
+
+    max_tracks = max(MIN_TRACKS, max_tracks)
+    lengths = [max_tracks, MIN_TRACKS][:playlists]
+    low, high = math.log(MIN_TRACKS), math.log(max_tracks)
+    while len(lengths) < playlists:
+        lengths.append(int(math.exp(rng.uniform(low, high))))
+    return lengths
+
+
+def seed_catalog(connection, songs, playlists, max_tracks=MAX_TRACKS, seed=0):
+    """Fill an empty schema with a synthetic catalog; returns its shape."""
+
+    rng = random.Random(seed)
+
+    bulk_insert(connection, Song.__table__,
+                ({'title': f'Song {i}', 'artist': f'Artist {i % 997}',
+                  'dedupe_key': dedupe_key(f'Song {i}', f'Artist {i % 997}')}
+                 for i in range(songs)))
+    bulk_insert(connection, Playlist.__table__,
+                ({'name': f'Playlist {i}', 'description': None}
+                 for i in range(playlists)))
+
+    first_song = connection.execute(select(func.min(Song.id))).scalar()
+    playlist_ids = connection.execute(select(Playlist.id).order_by(Playlist.id)).scalars().all()
+    lengths = playlist_lengths(playlists, min(max_tracks, songs), rng)
+
+    first_tracks = {}
+
+    def rows():
+        for playlist_id, length in zip(playlist_ids, lengths):
+            song_ids = rng.sample(range(first_song, first_song + songs), length)
+            first_tracks[playlist_id] = song_ids[0]
+            for position, song_id in enumerate(song_ids, 1):
+                yield {'playlist_id': playlist_id, 'song_id': song_id,
+                       'position': position * POSITION_GAP}
+
+    bulk_insert(connection, PlaylistSong.__table__, rows())
+
+    bump(connection, playlist_ids)
+
+    # (playlist id, a song on it) for the longest and the shortest playlist
+    extremes = dict(zip(('largest', 'smallest'), playlist_ids))
+    return {'songs': songs,
+            'playlists': {label: (playlist_id, first_tracks[playlist_id])
+                          for label, playlist_id in extremes.items()},
+            'song': first_song}
+
+
+def seed(app, name):
+    """Create the schema and seed catalog `name` into app's database."""
+
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            return seed_catalog(connection, **CATALOGS[name])
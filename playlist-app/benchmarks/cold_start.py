@@ -0,0 +1,122 @@
+"""Cold-start time per worker under a gunicorn-style pre-fork model.
+
+    python -m benchmarks.cold_start [--workers 4] [--database-url URL]
+
+For each mode a master process forks N workers and each worker reports:
+
+- boot: fork until the app object is ready to serve
+- first request: the first GET /playlists, which opens the pool's first
+  connection
+
+"preload" builds the app in the master before forking (gunicorn
+--preload), so workers only pay for the first request; "lazy" imports
+and builds it inside every worker. Without a --database-url a throwaway
+SQLite file is created and migrated up front.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+
+
+def _worker(started, write_fd, build):
+    """Runs in the child: build (if needed), serve one request, report."""
+
+    app = build()
+    booted = perf_counter()
+
+    with app.test_client() as client:
+        status = client.get('/playlists').status_code
+    served = perf_counter()
+
+    os.write(write_fd, json.dumps({'boot': booted - started,
+                                   'first_request': served - booted,
+                                   'status': status}).encode() + b'\n')
+    os.close(write_fd)
+
+
+def _lazy_build():
+    from app import create_app
+    return create_app()
+
+
+def run(workers, build):
+    """Fork `workers` children that call build(); return their reports."""
+
+    read_fd, write_fd = os.pipe()
+    children = []
+
+    for _ in range(workers):
+        started = perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                _worker(started, write_fd, build)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    os.close(write_fd)
+    for pid in children:
+        os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as reports:
+        return [json.loads(line) for line in reports]
+
+
+def _summary(name, reports):
+    for key in ('boot', 'first_request'):
+        times = [report[key] * 1000 for report in reports]
+        print(f"{name:>8} {key:>14}: mean {statistics.mean(times):8.2f} ms  "
+              f"median {statistics.median(times):8.2f} ms  max {max(times):8.2f} ms")
+
+    failed = [report['status'] for report in reports if report['status'] != 200]
+    if failed:
+        print(f"{name:>8}: {len(failed)} worker(s) got HTTP {failed[0]}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--database-url')
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'cold_start.db')}"
+
+        # Schema setup is a deploy step, not part of a worker's start-up;
+        # do it in a throwaway child so the master stays import-clean.
+        pid = os.fork()
+        if pid == 0:
+            from flask_migrate import upgrade
+            from app import create_app
+            with create_app().app_context():
+                upgrade()
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+    # Lazy first, while nothing from the app is imported in the master
+    lazy = run(args.workers, _lazy_build)
+
+    from app import create_app
+    app = create_app()
+    preload = run(args.workers, lambda: app)
+
+    print(f"{args.workers} worker(s), {os.environ['DATABASE_URL']}")
+    _summary('lazy', lazy)
+    _summary('preload', preload)
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
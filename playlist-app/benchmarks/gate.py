@@ -0,0 +1,85 @@
+"""Fail when a benchmark report regresses against a baseline.
+
+    python -m benchmarks.gate current.json baseline.json
+        [--latency-tolerance 0.25] [--latency-slack-ms 1.0]
+        [--rss-tolerance 0.10]
+
+Per route present in both reports:
+
+- queries may not go up at all
+- p95 latency may grow by at most --latency-tolerance (a fraction),
+  plus --latency-slack-ms so sub-millisecond routes aren't flaky
+- peak RSS may grow by at most --rss-tolerance
+
+Exits 1 and lists every regression if there is any. Routes only in the
+current report are listed as new; routes only in the baseline as gone.
+"""
+
+import argparse
+import json
+from collections import namedtuple
+
+Regression = namedtuple('Regression', 'route metric baseline current')
+
+DEFAULT_LATENCY_TOLERANCE = 0.25
+DEFAULT_LATENCY_SLACK_MS = 1.0
+DEFAULT_RSS_TOLERANCE = 0.10
+
+
+def compare(current, baseline,
+            latency_tolerance=DEFAULT_LATENCY_TOLERANCE,
+            latency_slack_ms=DEFAULT_LATENCY_SLACK_MS,
+            rss_tolerance=DEFAULT_RSS_TOLERANCE):
+    """Return the list of Regressions of current against baseline."""
+
+    regressions = []
+    for route, now in sorted(current['routes'].items()):
+        before = baseline['routes'].get(route)
+        if before is None:
+            continue
+
+        if now['queries'] > before['queries']:
+            regressions.append(Regression(route, 'queries', before['queries'], now['queries']))
+
+        allowed = before['p95_ms'] * (1 + latency_tolerance) + latency_slack_ms
+        if now['p95_ms'] > allowed:
+            regressions.append(Regression(route, 'p95_ms', before['p95_ms'], now['p95_ms']))
+
+        if now['peak_rss_kb'] > before['peak_rss_kb'] * (1 + rss_tolerance):
+            regressions.append(Regression(route, 'peak_rss_kb',
+                                          before['peak_rss_kb'], now['peak_rss_kb']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('current')
+    parser.add_argument('baseline')
+    parser.add_argument('--latency-tolerance', type=float, default=DEFAULT_LATENCY_TOLERANCE)
+    parser.add_argument('--latency-slack-ms', type=float, default=DEFAULT_LATENCY_SLACK_MS)
+    parser.add_argument('--rss-tolerance', type=float, default=DEFAULT_RSS_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    with open(args.current) as f:
+        current = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    for route in sorted(set(current['routes']) - set(baseline['routes'])):
+        print(f"new: {route}")
+    for route in sorted(set(baseline['routes']) - set(current['routes'])):
+        print(f"gone: {route}")
+
+    regressions = compare(current, baseline, args.latency_tolerance,
+                          args.latency_slack_ms, args.rss_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression.route}: {regression.metric} "
+              f"{regression.baseline} -> {regression.current}")
+
+    if regressions:
+        raise SystemExit(1)
+    print(f"OK: {len(current['routes'])} route(s) within thresholds.")
+
+
+if __name__ == '__main__':
+    main()
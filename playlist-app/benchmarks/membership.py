@@ -0,0 +1,115 @@
+"""Size and speed of the membership index against the equivalent queries.
+
+    python -m benchmarks.membership [--playlists 20000] [--avg-len 50]
+                                    [--songs 200000] [--database-url URL]
+
+Seeds a Zipf-skewed catalog (see seed.py) into a temporary SQLite file,
+or into --database-url, loads the membership index and reports its load
+time and memory per million playlist_song edges, then the median time
+of a random "is song X on playlist Y" and "which playlists is song X
+on" with the index and with an indexed query.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+from time import perf_counter
+
+LOOKUPS = 2000
+
+
+def _median_us(calls):
+    timings = []
+    for call in calls:
+        started = perf_counter()
+        call()
+        timings.append(perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+def run(app, lookups=LOOKUPS, seed=0):
+    """Load the index and time lookups; returns a dict of figures."""
+
+    from sqlalchemy import bindparam, select
+    from membership import membership
+    from models import db, PlaylistSong
+
+    table = PlaylistSong.__table__
+    with app.app_context():
+        engine = db.get_engine()
+        started = perf_counter()
+        membership.load(engine)
+        report = dict(membership.stats(), load_seconds=perf_counter() - started)
+        report.pop('age')
+
+        rng = random.Random(seed)
+        pairs = [(rng.randint(1, report['playlists']), rng.randint(1, report['songs']))
+                 for _ in range(lookups)]
+
+        with engine.connect() as connection:
+            contains = (select(table.c.song_id)
+                        .where(table.c.playlist_id == bindparam('playlist_id'),
+                               table.c.song_id == bindparam('song_id'))
+                        .exists().select())
+            playlists_of = (select(table.c.playlist_id)
+                            .where(table.c.song_id == bindparam('song_id')))
+            report['contains_us'] = {
+                'index': _median_us(lambda p=p, s=s: membership.contains(p, s)
+                                    for p, s in pairs),
+                'query': _median_us(
+                    lambda p=p, s=s: connection.execute(
+                        contains, {'playlist_id': p, 'song_id': s}).scalar()
+                    for p, s in pairs),
+            }
+            report['playlists_of_us'] = {
+                'index': _median_us(lambda s=s: list(membership.playlists_of(s))
+                                    for _, s in pairs),
+                'query': _median_us(
+                    lambda s=s: connection.execute(
+                        playlists_of, {'song_id': s}).scalars().all()
+                    for _, s in pairs),
+            }
+        membership.clear()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--playlists', type=int, default=20000)
+    parser.add_argument('--avg-len', type=int, default=50)
+    parser.add_argument('--songs', type=int, default=200000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.database_url is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.database_url = f"sqlite:///{os.path.join(tmp.name, 'membership.db')}"
+
+    from app import create_app
+    from models import db
+    from seed import seed_database
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+    with app.app_context():
+        db.create_all()
+        with db.get_engine().begin() as connection:
+            seed_database(connection, args.songs, args.playlists, args.avg_len)
+
+    report = run(app)
+    print(f"{report['edges']} edges, {report['playlists']} playlists, "
+          f"{report['songs']} songs; loaded in {report['load_seconds']:.1f}s")
+    print(f"memory: {report['bytes'] / 2 ** 20:.1f} MiB, "
+          f"{report['bytes_per_million_edges'] / 2 ** 20:.1f} MiB per million edges")
+    for name in ('contains_us', 'playlists_of_us'):
+        print(f"{name[:-3]:>12}: index {report[name]['index']:8.2f} us  "
+              f"query {report[name]['query']:8.2f} us")
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
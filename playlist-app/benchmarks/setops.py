@@ -0,0 +1,114 @@
+"""Playlist clone / union / intersect / difference on large playlists.
+
+    python -m benchmarks.setops [--tracks 100000] [--playlists 2]
+                                [--database-url URL] [--by-hand]
+
+Fills --playlists playlists of --tracks tracks each, every one
+overlapping the next by half, into a temporary SQLite file or into
+--database-url. Then times each setops operation, commit included.
+--by-hand also times cloning the first one by hand for comparison: load
+playlist.songs and append them to a new playlist through the ORM. That
+takes minutes at 100k tracks; try it with --tracks 10000.
+"""
+
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+
+def _fill(app, tracks, playlists):
+    """Return the ids of `playlists` fresh playlists of `tracks` tracks."""
+
+    from models import db, dedupe_key, POSITION_GAP, Playlist, PlaylistSong, Song
+    from seed import bulk_insert
+    from sqlalchemy import func, select
+
+    step = tracks // 2
+    with app.app_context():
+        db.create_all()
+        with db.get_engine().begin() as connection:
+            first_song = (connection.execute(select(func.max(Song.id))).scalar() or 0) + 1
+            first_playlist = (connection.execute(select(func.max(Playlist.id))).scalar()
+                              or 0) + 1
+            songs = step * (playlists - 1) + tracks
+            bulk_insert(connection, Song.__table__, (
+                {'id': song_id, 'title': f'Song {song_id}', 'artist': f'Artist {song_id % 997}',
+                 'dedupe_key': dedupe_key(f'Song {song_id}', f'Artist {song_id % 997}')}
+                for song_id in range(first_song, first_song + songs)))
+            playlist_ids = list(range(first_playlist, first_playlist + playlists))
+            bulk_insert(connection, Playlist.__table__,
+                        ({'id': playlist_id, 'name': f'Big {playlist_id}'}
+                         for playlist_id in playlist_ids))
+            bulk_insert(connection, PlaylistSong.__table__, (
+                {'playlist_id': playlist_id, 'song_id': first_song + i * step + n,
+                 'position': (n + 1) * POSITION_GAP}
+                for i, playlist_id in enumerate(playlist_ids) for n in range(tracks)))
+    return playlist_ids
+
+
+def _timed(app, operation):
+    from models import db
+
+    with app.app_context():
+        started = perf_counter()
+        _, songs = operation()
+        db.session.commit()
+        return perf_counter() - started, songs
+
+
+def _clone_by_hand(source_id):
+    from models import db, Playlist
+
+    source = db.session.get(Playlist, source_id)
+    copy = Playlist(name='by hand')
+    copy.songs.extend(source.songs)
+    db.session.add(copy)
+    db.session.flush()
+    return copy.id, len(copy.songs)
+
+
+def run(app, tracks, playlists=2, by_hand=False):
+    """Return {operation: (seconds, songs in the result)}."""
+
+    from setops import clone_playlist, combine_playlists
+
+    ids = _fill(app, tracks, playlists)
+    results = {
+        'clone': _timed(app, lambda: clone_playlist(ids[0], 'clone')),
+        'union': _timed(app, lambda: combine_playlists('union', ids, 'union')),
+        'intersect': _timed(app, lambda: combine_playlists('intersect', ids, 'intersect')),
+        'difference': _timed(app, lambda: combine_playlists('difference', ids, 'difference')),
+    }
+    if by_hand:
+        results['clone by hand'] = _timed(app, lambda: _clone_by_hand(ids[0]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=100000)
+    parser.add_argument('--playlists', type=int, default=2)
+    parser.add_argument('--database-url')
+    parser.add_argument('--by-hand', action='store_true')
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.database_url is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.database_url = f"sqlite:///{os.path.join(tmp.name, 'setops.db')}"
+
+    from app import create_app
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+    print(f"{args.playlists} playlists of {args.tracks} tracks, {args.database_url}")
+    for name, (seconds, songs) in run(app, args.tracks, args.playlists,
+                                      args.by_hand).items():
+        print(f"{name:>14}: {seconds * 1000:9.1f} ms  ({songs} songs)")
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""CPU per request of the hot reads: per-request queries against statements.py.
+
+    python -m benchmarks.statements [--calls 2000] [--qps 1000]
+                                    [--songs 20000] [--playlists 1000]
+                                    [--avg-len 50] [--database-url URL]
+
+Seeds a catalog (see seed.py) into a temporary SQLite file, or into
+--database-url, then runs each hot read --calls times the way the app
+used to build it per request, and from its prebuilt statement. On
+PostgreSQL, also as a prepared statement. Each call gets a fresh
+session, as each request does. Reports the median client CPU time
+(time.process_time) and wall time per call, and the CPU seconds per
+second the prebuilt statement saves at --qps requests per second.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+from time import perf_counter, process_time
+
+CALLS = 2000
+WARMUP = 100
+
+
+def _timed(call, calls):
+    """Median (cpu seconds, wall seconds) of call() over `calls` fresh sessions."""
+
+    from models import db
+
+    for _ in range(WARMUP):
+        call()
+        db.session.remove()
+    cpu, wall = [], []
+    for _ in range(calls):
+        started_cpu, started = process_time(), perf_counter()
+        call()
+        db.session.remove()
+        cpu.append(process_time() - started_cpu)
+        wall.append(perf_counter() - started)
+    return statistics.median(cpu), statistics.median(wall)
+
+
+def _reads(playlist_id):
+    """{read: {'query': call, 'statement': call}}, old way and new."""
+
+    from choices import CHOICES_LIMIT, _not_on_playlist
+    from models import Playlist, Song
+    from pagination import keyset_page
+    from statements import SONG_CHOICES, playlist_or_404, songs_page, statements
+
+    return {
+        'playlist by id': {
+            'query': lambda: Playlist.query.get_or_404(playlist_id),
+            'statement': lambda: playlist_or_404(playlist_id),
+        },
+        'songs page': {
+            'query': lambda: keyset_page(Song.query.with_entities(Song.id, Song.title),
+                                         Song.id, None, 50),
+            'statement': lambda: songs_page(None, 50),
+        },
+        'song choices': {
+            'query': lambda: [tuple(row) for row in _not_on_playlist(playlist_id)
+                              .order_by(Song.title, Song.id).limit(CHOICES_LIMIT)],
+            'statement': lambda: [tuple(row) for row in statements.execute(
+                SONG_CHOICES, playlist_id=playlist_id, limit=CHOICES_LIMIT)],
+        },
+    }
+
+
+def run(app, calls=CALLS, qps=1000):
+    """Time every read each way.
+
+    Returns {read: {way: (cpu seconds, wall seconds), ...,
+    'cpu_saved_per_second': seconds}}.
+    """
+
+    from sqlalchemy import func, select
+    from models import db, Playlist
+    from statements import statements
+
+    report = {}
+    with app.app_context():
+        playlist_id = db.session.execute(select(func.min(Playlist.id))).scalar()
+        db.session.remove()
+        postgresql = db.get_engine().dialect.name == 'postgresql'
+
+        for read, ways in _reads(playlist_id).items():
+            timings = report[read] = {}
+            timings['query'] = _timed(ways['query'], calls)
+            timings['statement'] = _timed(ways['statement'], calls)
+            if postgresql:
+                statements.prepare = True
+                try:
+                    timings['prepared'] = _timed(ways['statement'], calls)
+                finally:
+                    statements.prepare = False
+            timings['cpu_saved_per_second'] = qps * (timings['query'][0]
+                                                     - timings['statement'][0])
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=CALLS)
+    parser.add_argument('--qps', type=int, default=1000)
+    parser.add_argument('--songs', type=int, default=20000)
+    parser.add_argument('--playlists', type=int, default=1000)
+    parser.add_argument('--avg-len', type=int, default=50)
+    parser.add_argument('--database-url')
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.database_url is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.database_url = f"sqlite:///{os.path.join(tmp.name, 'statements.db')}"
+
+    from app import create_app
+    from models import db
+    from seed import seed_database
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+    with app.app_context():
+        db.create_all()
+        with db.get_engine().begin() as connection:
+            seed_database(connection, args.songs, args.playlists, args.avg_len)
+
+    print(f"{args.database_url}, median of {args.calls} calls")
+    for read, timings in run(app, args.calls, args.qps).items():
+        saved = timings.pop('cpu_saved_per_second')
+        for way, (cpu, wall) in timings.items():
+            print(f"{read:>15} {way:>10}: cpu {cpu * 1e6:8.1f} us  wall {wall * 1e6:8.1f} us")
+        print(f"{'':>15} at {args.qps} req/s the statement saves "
+              f"{saved:.3f} CPU-seconds per second")
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
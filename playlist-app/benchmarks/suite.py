@@ -0,0 +1,173 @@
+"""Per-route benchmark suite with a machine-readable report.
+
+    python -m benchmarks.suite [--catalog small] [--iterations 20]
+                               [--database-url URL] [--output report.json]
+
+Seeds a synthetic catalog (see benchmarks/catalog.py) and requests every
+GET route of the app, plus the POST routes in POST_ROUTES, measuring per
+route:
+
+- latency: p50 / p95 / max over --iterations requests, after warm-up
+- queries: the most SQL statements any one request issued
+- peak_rss_kb: the process's peak resident set size once the route ran
+
+Routes are discovered from the URL map, so new routes are measured
+without touching this file; <playlist_id> is filled in with the largest
+and the smallest playlist in turn. The detail cache is switched off so
+every request reaches the database.
+
+Compare two reports with `python -m benchmarks.gate`.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+
+from benchmarks.catalog import CATALOGS, seed
+from instrumentation import count_queries
+
+WARMUP = 2
+QUERY_STRINGS = {
+    'main.search_songs_page': 'q=song 1',
+    'main.search_songs_api': 'q=song 1',
+    'main.add_song_to_playlist_choices': 'q=song',
+}
+
+# POST routes safe to repeat: (endpoint, JSON body)
+POST_ROUTES = {
+    'main.move_playlist_song': {'after': None},
+    'main.batch_playlist_songs': {'add': [], 'remove': []},
+}
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _variants(rule, shape):
+    """Yield (label, {argument: value}) to fill in a rule's <arguments>."""
+
+    if rule.arguments - {'playlist_id', 'song_id'}:
+        return
+    if 'playlist_id' in rule.arguments:
+        for label, (playlist_id, song_id) in shape['playlists'].items():
+            args = {'playlist_id': playlist_id}
+            if 'song_id' in rule.arguments:
+                args['song_id'] = song_id
+            yield label, args
+    elif 'song_id' in rule.arguments:
+        yield '', {'song_id': shape['song']}
+    else:
+        yield '', {}
+
+
+def _paths(app, shape):
+    """Yield (name, method, path, json) for every route we can exercise."""
+
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if rule.endpoint == 'static' or rule.endpoint.startswith('_debug_toolbar'):
+            continue
+
+        if rule.endpoint in POST_ROUTES:
+            method, body = 'POST', POST_ROUTES[rule.endpoint]
+        elif 'GET' in rule.methods:
+            method, body = 'GET', None
+        else:
+            continue
+
+        query = QUERY_STRINGS.get(rule.endpoint)
+        for label, args in _variants(rule, shape):
+            path = rule.rule
+            for arg, value in args.items():
+                path = path.replace(f'<int:{arg}>', str(value))
+            if query:
+                path = f'{path}?{query}'
+            name = f'{method} {rule.rule}' + (f' [{label}]' if label else '')
+            yield name, method, path, body
+
+
+def measure(client, method, path, body, iterations):
+    for _ in range(WARMUP):
+        client.open(path, method=method, json=body)
+
+    latencies, queries = [], 0
+    for _ in range(iterations):
+        with count_queries() as statements:
+            started = perf_counter()
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            latencies.append((perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+        queries = max(queries, len(statements))
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries': queries,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def run(app, catalog, iterations):
+    """Seed `catalog` into app's database and return the report dict."""
+
+    shape = seed(app, catalog)
+    routes = {}
+    with app.test_client() as client:
+        for name, method, path, body in _paths(app, shape):
+            routes[name] = measure(client, method, path, body, iterations)
+
+    return {
+        'catalog': dict(CATALOGS[catalog], name=catalog),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+        'python': platform.python_version(),
+        'routes': routes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--catalog', choices=sorted(CATALOGS), default='small')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--database-url',
+                        help='An empty database to seed; default a temporary SQLite file.')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.database_url is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.database_url = f"sqlite:///{os.path.join(tmp.name, 'benchmark.db')}"
+
+    from app import create_app
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url,
+                      'CACHE_BACKEND': 'null',
+                      'TESTING': True})
+
+    report = run(app, args.catalog, args.iterations)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
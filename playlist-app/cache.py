@@ -0,0 +1,240 @@
+"""Read-through cache for playlist app detail pages.
+
+Detail routes cache serialized rows (plain dicts) under keys like
+'playlist:3' / 'song:7'. Writes register the keys they affect with
+invalidate_on_commit(); they are dropped only once the transaction
+commits, and forgotten if it rolls back. A write touching too many keys
+to list can drop a whole family of them with invalidate_prefix_on_commit()
+instead, at a cost bounded by the cache's size.
+
+Backends:
+
+- 'memory' (default): per-process, TTL + LRU eviction
+- 'redis': shared between workers; any server speaking the Redis
+  protocol will do (a local redis-server stands in during development)
+- 'null': caching off
+"""
+
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from sqlalchemy import event
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 10000
+
+_PENDING = 'cache_invalidate'
+_PENDING_PREFIXES = 'cache_invalidate_prefixes'
+
+PLAYLIST_PREFIX = 'playlist:'
+SONG_PREFIX = 'song:'
+
+
+def playlist_key(playlist_id):
+    return f'{PLAYLIST_PREFIX}{playlist_id}'
+
+
+def song_key(song_id):
+    return f'{SONG_PREFIX}{song_id}'
+
+
+class NullBackend:
+    """Backend that never stores anything."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def delete_prefix(self, prefix):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryBackend:
+    """In-process backend with per-entry TTL and LRU eviction."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Shared backend storing JSON values in a Redis-protocol server.
+
+    Eviction is left to the server (e.g. maxmemory-policy allkeys-lru).
+    """
+
+    def __init__(self, url=None, client=None, prefix='playlist-app:'):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND='redis' needs the redis package") from None
+            client = redis.Redis.from_url(url)
+
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=self.prefix + prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix('')
+
+
+class Cache:
+    """Read-through cache with hit/miss accounting."""
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app, session):
+        """Configure from app.config and hook commit-time invalidation."""
+
+        kind = app.config.setdefault('CACHE_BACKEND', 'memory')
+        self.ttl = app.config.setdefault('CACHE_TTL', DEFAULT_TTL)
+
+        if kind == 'memory':
+            max_entries = app.config.setdefault('CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+            self.backend = MemoryBackend(max_entries)
+        elif kind == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+        elif kind == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND {kind!r}")
+
+        # One set of listeners however many apps share the session
+        if not event.contains(session, 'after_commit', self._after_commit):
+            event.listen(session, 'after_commit', self._after_commit)
+            event.listen(session, 'after_soft_rollback', self._after_rollback)
+
+    def get_or_set(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss."""
+
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = loader()
+        self.backend.set(key, value, self.ttl)
+        return value
+
+    async def get_or_set_async(self, key, loader):
+        """get_or_set() for an async loader, awaited on a miss."""
+
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = await loader()
+        self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate(self, *keys):
+        self.backend.delete(*keys)
+
+    def invalidate_on_commit(self, session, *keys):
+        """Drop keys once session's current transaction commits."""
+
+        session.info.setdefault(_PENDING, set()).update(keys)
+
+    def invalidate_prefix_on_commit(self, session, prefix):
+        """Drop every key starting with prefix once the transaction commits."""
+
+        session.info.setdefault(_PENDING_PREFIXES, set()).add(prefix)
+
+    def _after_commit(self, session):
+        keys = session.info.pop(_PENDING, None)
+        if keys:
+            self.invalidate(*keys)
+        for prefix in session.info.pop(_PENDING_PREFIXES, ()):
+            self.backend.delete_prefix(prefix)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop(_PENDING, None)
+        session.info.pop(_PENDING_PREFIXES, None)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+cache = Cache()
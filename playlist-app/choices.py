@@ -0,0 +1,132 @@
+"""Choice sources for the add-song-to-playlist and combine-playlists forms."""
+
+from membership import membership
+from models import db, Playlist, Song, PlaylistSong
+from search import matching_song_ids
+from statements import SONG_CHOICE, SONG_CHOICES, statements
+
+CHOICES_LIMIT = 100
+SKIP_PAGES = 4
+
+
+def _not_on_playlist(playlist_id):
+    """(id, title) query of songs with no playlist_song row for playlist.
+
+    A correlated NOT EXISTS, so the database does the anti-join and we
+    never pull the playlist's songs (or the catalog) into Python.
+    """
+
+    on_playlist = (db.session.query(PlaylistSong.song_id)
+                   .filter(PlaylistSong.playlist_id == playlist_id,
+                           PlaylistSong.song_id == Song.id))
+    return (db.session.query(Song.id, Song.title)
+            .filter(~on_playlist.exists()))
+
+
+def _escape_like(term):
+    """Escape LIKE wildcards in user input."""
+
+    return (term.replace('\\', '\\\\')
+            .replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def _skipping_playlist(query, playlist_id, limit):
+    """Up to `limit` rows of an (id, title) query that aren't on playlist.
+
+    Reads the query in title order a page at a time (keyset on title,
+    id) and drops the playlist's songs with the membership index, until
+    enough are left, instead of anti-joining playlist_song. A page has
+    room for the playlist's songs too (up to SKIP_PAGES extra pages'
+    worth), so it usually takes one.
+    """
+
+    on_playlist = len(membership.songs_of(playlist_id))
+    page = limit + min(on_playlist, limit * SKIP_PAGES)
+    choices = []
+    rows = query.order_by(Song.title, Song.id).limit(page).all()
+    while rows:
+        choices.extend(tuple(row) for row in rows
+                       if not membership.contains(playlist_id, row.id))
+        if len(choices) >= limit or len(rows) < page:
+            break
+        song_id, title = rows[-1]
+        rows = (query.filter(db.or_(Song.title > title,
+                                    db.and_(Song.title == title, Song.id > song_id)))
+                .order_by(Song.title, Song.id).limit(page).all())
+    return choices[:limit]
+
+
+def song_choices(playlist_id, search=None, limit=CHOICES_LIMIT):
+    """Return up to `limit` (id, title) choices not already on playlist.
+
+    With `search`, only songs matching it in the full-text index (or,
+    where there is none, whose title or artist starts with it).
+    """
+
+    indexed = membership.enabled()
+    if not indexed and not search:
+        rows = statements.execute(SONG_CHOICES, playlist_id=playlist_id, limit=limit)
+        return [tuple(row) for row in rows]
+
+    if indexed:
+        query = db.session.query(Song.id, Song.title)
+    else:
+        query = _not_on_playlist(playlist_id)
+    matches = matching_song_ids(search) if search else None
+
+    if matches is not None:
+        query = query.filter(Song.id.in_(matches))
+    elif search:
+        pattern = _escape_like(search.strip()) + '%'
+        query = query.filter(db.or_(Song.title.ilike(pattern, escape='\\'),
+                                    Song.artist.ilike(pattern, escape='\\')))
+
+    if indexed:
+        return _skipping_playlist(query, playlist_id, limit)
+    rows = query.order_by(Song.title, Song.id).limit(limit)
+    return [tuple(row) for row in rows]
+
+
+def song_choice(playlist_id, song_id):
+    """Return [(id, title)] if song_id may be added to playlist, else [].
+
+    Guards a write, so it asks the database, never the membership index.
+    """
+
+    if song_id is None:
+        return []
+    rows = statements.execute(SONG_CHOICE, playlist_id=playlist_id, song_id=song_id)
+    return [tuple(row) for row in rows]
+
+
+def song_choices_among(playlist_id, song_ids):
+    """Return (id, title) for those of song_ids that may be added."""
+
+    if not song_ids:
+        return []
+    rows = _not_on_playlist(playlist_id).filter(Song.id.in_(song_ids))
+    return [tuple(row) for row in rows]
+
+
+def playlist_choices(search=None, limit=CHOICES_LIMIT):
+    """Return up to `limit` (id, name) playlist choices, by name.
+
+    With `search`, only playlists whose name starts with it.
+    """
+
+    query = db.session.query(Playlist.id, Playlist.name)
+    if search:
+        pattern = _escape_like(search.strip()) + '%'
+        query = query.filter(Playlist.name.ilike(pattern, escape='\\'))
+    rows = query.order_by(Playlist.name, Playlist.id).limit(limit)
+    return [tuple(row) for row in rows]
+
+
+def playlist_choices_among(playlist_ids):
+    """Return (id, name) for those of playlist_ids that exist."""
+
+    if not playlist_ids:
+        return []
+    rows = db.session.query(Playlist.id, Playlist.name).filter(Playlist.id.in_(playlist_ids))
+    return [tuple(row) for row in rows]
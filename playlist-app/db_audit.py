@@ -0,0 +1,121 @@
+"""`flask db-audit`: report missing indexes and sequential-scan hot spots.
+
+Two checks against the live database:
+
+- indexes declared on the models that the database doesn't have, and
+  foreign keys with no index leading on their columns (any dialect)
+- tables read mostly by sequential scan, from pg_stat_user_tables
+  (PostgreSQL only)
+"""
+
+from collections import namedtuple
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text
+
+from models import db
+
+# Tables smaller than this are cheap to scan and not worth reporting
+DEFAULT_MIN_ROWS = 10000
+
+MissingIndex = namedtuple('MissingIndex', 'table columns reason')
+SeqScan = namedtuple('SeqScan', 'table seq_scan seq_tup_read idx_scan live_rows')
+
+
+def _live_index_columns(inspector, table):
+    """Column tuples of every index-like structure on a live table."""
+
+    columns = [tuple(ix['column_names']) for ix in inspector.get_indexes(table)]
+    columns += [tuple(uc['column_names'])
+                for uc in inspector.get_unique_constraints(table)]
+
+    pk = inspector.get_pk_constraint(table)['constrained_columns']
+    if pk:
+        columns.append(tuple(pk))
+    return columns
+
+
+def _is_covered(columns, live_indexes):
+    """Does some live index lead on exactly these columns?"""
+
+    return any(index[:len(columns)] == columns for index in live_indexes)
+
+
+def missing_indexes(engine, metadata):
+    """Return MissingIndex for each declared or FK index the database lacks."""
+
+    inspector = inspect(engine)
+    live_tables = set(inspector.get_table_names())
+    missing = []
+
+    for table in metadata.sorted_tables:
+        if table.name not in live_tables:
+            continue
+        live_indexes = _live_index_columns(inspector, table.name)
+
+        for index in table.indexes:
+            columns = tuple(column.name for column in index.columns)
+            if not _is_covered(columns, live_indexes):
+                missing.append(MissingIndex(table.name, columns,
+                                            f'declared on the model as {index.name}'))
+
+        for fk in inspector.get_foreign_keys(table.name):
+            columns = tuple(fk['constrained_columns'])
+            if not _is_covered(columns, live_indexes):
+                missing.append(MissingIndex(table.name, columns,
+                                            f"foreign key to {fk['referred_table']}"))
+
+    return missing
+
+
+def sequential_scans(connection, min_rows=DEFAULT_MIN_ROWS):
+    """Return SeqScan for big tables read more by seq scan than by index.
+
+    Only PostgreSQL keeps these statistics; elsewhere returns None.
+    """
+
+    if connection.dialect.name != 'postgresql':
+        return None
+
+    rows = connection.execute(text("""
+        SELECT relname, seq_scan, seq_tup_read, coalesce(idx_scan, 0), n_live_tup
+        FROM pg_stat_user_tables
+        WHERE n_live_tup >= :min_rows
+          AND seq_scan > coalesce(idx_scan, 0)
+        ORDER BY seq_tup_read DESC
+    """), {'min_rows': min_rows})
+    return [SeqScan(*row) for row in rows]
+
+
+@click.command('db-audit')
+@click.option('--min-rows', default=DEFAULT_MIN_ROWS, show_default=True,
+              help='Ignore sequential scans on tables smaller than this.')
+@with_appcontext
+def db_audit_command(min_rows):
+    """Report missing indexes and tables hit by sequential scans."""
+
+    missing = missing_indexes(db.engine, db.metadata)
+    if missing:
+        click.echo('Missing indexes:')
+        for index in missing:
+            click.echo(f"  {index.table}({', '.join(index.columns)}): {index.reason}")
+    else:
+        click.echo('No missing indexes.')
+
+    with db.engine.connect() as connection:
+        scans = sequential_scans(connection, min_rows)
+
+    if scans is None:
+        click.echo('Sequential scan statistics need PostgreSQL; skipped.')
+    elif scans:
+        click.echo('Tables read mostly by sequential scan:')
+        for scan in scans:
+            click.echo(f'  {scan.table}: {scan.seq_scan} seq scans '
+                       f'({scan.seq_tup_read} rows read) vs {scan.idx_scan} index scans, '
+                       f'{scan.live_rows} live rows')
+    else:
+        click.echo('No tables dominated by sequential scans.')
+
+    if missing or scans:
+        raise SystemExit(1)
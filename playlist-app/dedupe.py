@@ -0,0 +1,165 @@
+"""Duplicate songs: one row per normalized (title, artist).
+
+songs.dedupe_key is a hash of the title and artist with case, diacritics
+and whitespace folded (see models.dedupe_key), under a unique index.
+New songs get it by default, and upsert_song() returns the existing row
+instead of adding a copy.
+
+Rows from before the key existed have it NULL, which the unique index
+allows. `flask dedupe-songs` walks them in id order, batch by batch: a
+row whose key is free takes it, a row whose key is taken is merged into
+the keyed song. Merging moves the duplicate's playlist_song rows onto
+the kept song (dropping them where the playlist already has it) and
+deletes the duplicate. Each batch is its own short transaction, so
+nothing holds locks on songs or playlist_song for long.
+"""
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from aggregates import changed_on_commit
+from cache import cache, playlist_key, song_key
+from models import db, dedupe_key, PlaylistSong, Song
+from versions import bump_on_commit
+
+DEFAULT_BATCH_SIZE = 500
+# Keep IN-lists under SQLite's bound-parameter limit
+CHUNK_SIZE = 900
+
+_INSERT_IGNORE = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+_songs = Song.__table__
+_playlist_song = PlaylistSong.__table__
+
+
+def upsert_song(title, artist):
+    """Return (song id, created) for the song matching title and artist."""
+
+    key = dedupe_key(title, artist)
+    values = {'title': title, 'artist': artist, 'dedupe_key': key}
+
+    insert = _INSERT_IGNORE.get(db.session.connection().dialect.name)
+    if insert is not None:
+        stmt = insert(_songs).values(values).on_conflict_do_nothing(
+            index_elements=['dedupe_key'])
+        created = db.session.execute(stmt).rowcount == 1
+    else:
+        created = db.session.execute(
+            select(Song.id).where(Song.dedupe_key == key)).first() is None
+        if created:
+            db.session.execute(_songs.insert().values(values))
+
+    song_id = db.session.execute(select(Song.id).where(Song.dedupe_key == key)).scalar_one()
+    return song_id, created
+
+
+def _keyed(keys):
+    """{dedupe_key: song id} for the keys already taken."""
+
+    keys = sorted(keys)
+    taken = {}
+    for start in range(0, len(keys), CHUNK_SIZE):
+        taken.update(db.session.execute(
+            select(Song.dedupe_key, Song.id)
+            .where(Song.dedupe_key.in_(keys[start:start + CHUNK_SIZE]))).all())
+    return taken
+
+
+def merge_song(duplicate_id, song_id):
+    """Fold a duplicate into song_id; return the playlist ids it was on."""
+
+    playlist_ids = db.session.execute(
+        select(_playlist_song.c.playlist_id)
+        .where(_playlist_song.c.song_id == duplicate_id)).scalars().all()
+
+    if playlist_ids:
+        already_there = (select(_playlist_song.c.playlist_id)
+                         .where(_playlist_song.c.song_id == song_id))
+        db.session.execute(_playlist_song.delete()
+                           .where(_playlist_song.c.song_id == duplicate_id,
+                                  _playlist_song.c.playlist_id.in_(already_there)))
+        db.session.execute(_playlist_song.update()
+                           .where(_playlist_song.c.song_id == duplicate_id)
+                           .values(song_id=song_id))
+
+    db.session.execute(_songs.delete().where(_songs.c.id == duplicate_id))
+    return playlist_ids
+
+
+def dedupe_batch(after_id=0, batch_size=DEFAULT_BATCH_SIZE):
+    """Key or merge the next batch of unkeyed songs, and commit.
+
+    Returns (last id seen or None when done, songs keyed, songs merged).
+    """
+
+    rows = db.session.execute(
+        select(Song.id, Song.title, Song.artist)
+        .where(Song.dedupe_key.is_(None), Song.id > after_id)
+        .order_by(Song.id)
+        .limit(batch_size)).all()
+    if not rows:
+        return None, 0, 0
+
+    keys = {song_id: dedupe_key(title, artist) for song_id, title, artist in rows}
+    taken = _keyed(keys.values())
+
+    keyed, merged, playlist_ids = [], [], set()
+    for song_id, key in keys.items():
+        if key in taken:
+            playlist_ids.update(merge_song(song_id, taken[key]))
+            merged.append((song_id, taken[key]))
+        else:
+            taken[key] = song_id
+            keyed.append({'song_id': song_id, 'key': key})
+
+    if keyed:
+        db.session.execute(_songs.update()
+                           .where(_songs.c.id == bindparam('song_id'))
+                           .values(dedupe_key=bindparam('key')),
+                           keyed)
+
+    if playlist_ids:
+        changed_on_commit(db.session, *playlist_ids)
+        bump_on_commit(db.session, *playlist_ids)
+    cache.invalidate_on_commit(db.session,
+                               *(song_key(song_id) for pair in merged for song_id in pair),
+                               *(playlist_key(playlist_id) for playlist_id in playlist_ids))
+    db.session.commit()
+
+    return rows[-1].id, len(keyed), len(merged)
+
+
+def dedupe_songs(batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Run dedupe_batch() until no unkeyed songs are left.
+
+    Returns (songs keyed, songs merged); progress(keyed, merged) is
+    called after each batch.
+    """
+
+    after_id, keyed, merged = 0, 0, 0
+    while True:
+        after_id, batch_keyed, batch_merged = dedupe_batch(after_id, batch_size)
+        if after_id is None:
+            return keyed, merged
+        keyed += batch_keyed
+        merged += batch_merged
+        if progress is not None:
+            progress(keyed, merged)
+
+
+@click.command('dedupe-songs')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+@with_appcontext
+def dedupe_songs_command(batch_size):
+    """Merge duplicate songs (same normalized title and artist)."""
+
+    def report(keyed, merged):
+        click.echo(f"{keyed} songs keyed, {merged} duplicates merged", err=True)
+
+    keyed, merged = dedupe_songs(batch_size, report)
+    click.echo(f"Done: {keyed} songs keyed, {merged} duplicates merged.")
@@ -0,0 +1,153 @@
+"""Streaming export of a playlist, or the whole catalog, as CSV / JSONL / M3U.
+
+Rows come from a server-side cursor (Query.yield_per; stream_results on
+PostgreSQL) and are encoded a chunk of rows at a time, optionally
+through one running gzip stream, so neither the database driver nor
+this process ever holds more than a chunk however long the export is.
+Used by the /export.<format> routes and by `flask export`.
+"""
+
+import csv
+import io
+import json
+import sys
+import zlib
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, Playlist, PlaylistSong, Song
+
+FORMATS = ('csv', 'jsonl', 'm3u')
+MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'm3u': 'audio/x-mpegurl',
+}
+CHUNK_ROWS = 1000
+COLUMNS = ('position', 'song_id', 'title', 'artist')
+
+
+def playlist_rows(playlist_id, chunk_rows=CHUNK_ROWS):
+    """(position, song_id, title, artist) of a playlist's songs, in order."""
+
+    return (db.session.query(PlaylistSong.position, Song.id, Song.title, Song.artist)
+            .join(Song, Song.id == PlaylistSong.song_id)
+            .filter(PlaylistSong.playlist_id == playlist_id)
+            .order_by(PlaylistSong.position, PlaylistSong.song_id)
+            .yield_per(chunk_rows))
+
+
+def catalog_rows(chunk_rows=CHUNK_ROWS):
+    """(position, song_id, title, artist) of every song; position counts up from 1."""
+
+    songs = (db.session.query(Song.id, Song.title, Song.artist)
+             .order_by(Song.id)
+             .yield_per(chunk_rows))
+    return ((position, song_id, title, artist)
+            for position, (song_id, title, artist) in enumerate(songs, 1))
+
+
+def _chunks(rows, chunk_rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode(rows, fmt, name=None, song_url=None, chunk_rows=CHUNK_ROWS):
+    """Yield the export as text, one string per chunk of rows.
+
+    `name` titles an M3U playlist; song_url(song_id) gives its entries'
+    locations (default /songs/<id>).
+    """
+
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}")
+    song_url = song_url or (lambda song_id: f"/songs/{song_id}")
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+        for chunk in _chunks(rows, chunk_rows):
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    elif fmt == 'jsonl':
+        for chunk in _chunks(rows, chunk_rows):
+            yield ''.join(json.dumps(dict(zip(COLUMNS, row))) + '\n' for row in chunk)
+
+    else:
+        yield '#EXTM3U\n' + (f'#PLAYLIST:{name}\n' if name else '')
+        for chunk in _chunks(rows, chunk_rows):
+            yield ''.join(f'#EXTINF:-1,{artist} - {title}\n{song_url(song_id)}\n'
+                          for _, song_id, title, artist in chunk)
+
+
+def gzip_chunks(chunks):
+    """Compress text chunks into a single gzip stream, chunk by chunk."""
+
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(fmt, playlist_id=None, gzip=False, song_url=None):
+    """The encoded (bytes) export of a playlist, or of the catalog when None.
+
+    Raises LookupError for an unknown playlist.
+    """
+
+    if playlist_id is None:
+        chunks = encode(catalog_rows(), fmt, 'Catalog', song_url)
+    else:
+        name = db.session.query(Playlist.name).filter_by(id=playlist_id).scalar()
+        if name is None:
+            raise LookupError(playlist_id)
+        chunks = encode(playlist_rows(playlist_id), fmt, name, song_url)
+
+    if gzip:
+        return gzip_chunks(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
+
+
+@click.command('export')
+@click.argument('fmt', metavar='FORMAT', type=click.Choice(FORMATS))
+@click.option('--playlist', 'playlist_id', type=int,
+              help='Export this playlist; by default the whole catalog.')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Write here instead of stdout.')
+@click.option('--gzip', 'compress', is_flag=True, help='gzip the output.')
+@click.option('--base-url', default='', help='Prefix for song locations in M3U.')
+@with_appcontext
+def export_command(fmt, playlist_id, output, compress, base_url):
+    """Stream a playlist or the whole catalog as CSV, JSONL or M3U."""
+
+    base_url = base_url.rstrip('/')
+    try:
+        chunks = export_chunks(fmt, playlist_id, compress,
+                               lambda song_id: f"{base_url}/songs/{song_id}")
+    except LookupError:
+        raise click.BadParameter(f"No playlist {playlist_id}", param_hint='--playlist')
+
+    stream = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
+        else:
+            stream.flush()
@@ -1,19 +1,22 @@
 """Forms for playlist app."""
 
-from wtforms import SelectField
+from wtforms import SelectField, SelectMultipleField, StringField
+from wtforms.validators import DataRequired, Length, Optional
 from flask_wtf import FlaskForm
 
 
 class PlaylistForm(FlaskForm):
     """Form for adding playlists."""
 
-    # Add the necessary code to use this form
+    name = StringField('Playlist Name', validators=[DataRequired(), Length(max=100)])
+    description = StringField('Description', validators=[Optional(), Length(max=255)])
 
 
 class SongForm(FlaskForm):
     """Form for adding songs."""
 
-    # Add the necessary code to use this form
+    title = StringField('Song Title', validators=[DataRequired(), Length(min=1, max=100)])
+    artist = StringField('Artist', validators=[DataRequired(), Length(min=1, max=100)])
 
 
 # DO NOT MODIFY THIS FORM - EVERYTHING YOU NEED IS HERE
@@ -21,3 +24,26 @@ class NewSongForPlaylistForm(FlaskForm):
     """Form for adding a song to playlist."""
 
     song = SelectField('Song To Add', coerce=int)
+
+
+class NewSongsForPlaylistForm(FlaskForm):
+    """Form for adding several songs to a playlist at once."""
+
+    songs = SelectMultipleField('Songs To Add', coerce=int)
+
+
+class CombinePlaylistsForm(PlaylistForm):
+    """Form for making a playlist out of two or more others.
+
+    A multiple select submits in option order, not the order picked in,
+    so the first playlist (the base of a difference, and the one whose
+    order comes first) is a field of its own.
+    """
+
+    operation = SelectField('Operation', choices=[
+        ('union', 'Songs on any of them'),
+        ('intersect', 'Songs on all of them'),
+        ('difference', 'Songs on the first and none of the others'),
+    ])
+    first = SelectField('First playlist', coerce=int)
+    playlists = SelectMultipleField('Other playlists', coerce=int)
@@ -0,0 +1,238 @@
+"""Bulk song import from CSV / JSONL files.
+
+Rows are read one at a time, checked with the same field rules as
+SongForm, and written in batches: COPY into a temporary table on
+PostgreSQL, a single executemany INSERT elsewhere. Either way songs
+whose normalized (title, artist) already exists are skipped (see
+dedupe.py), so re-importing a file adds nothing. Each batch is committed
+on its own so a huge file never sits in memory or in one long
+transaction.
+
+Rejected rows are written to an error stream as JSON lines:
+
+    {"line": 7, "row": {...}, "errors": {"title": ["..."]}}
+"""
+
+import csv
+import io
+import json
+from collections import namedtuple
+
+import click
+from flask.cli import with_appcontext
+from wtforms import Form
+
+from sqlalchemy import text
+from sqlalchemy.dialects import sqlite
+
+from forms import SongForm
+from models import db, dedupe_key, Song
+
+DEFAULT_BATCH_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+COLUMNS = ('title', 'artist')
+STAGING_TABLE = 'song_import'
+
+ImportResult = namedtuple('ImportResult', 'processed inserted failed')
+
+
+class SongRowForm(Form):
+    """SongForm's fields, without the CSRF/request machinery."""
+
+    title = SongForm.title
+    artist = SongForm.artist
+
+
+class ErrorSample:
+    """Error stream that keeps only the first `limit` rejected rows."""
+
+    def __init__(self, limit=100):
+        self.limit = limit
+        self.rows = []
+
+    def write(self, line):
+        if len(self.rows) < self.limit:
+            self.rows.append(json.loads(line))
+
+
+def guess_format(filename):
+    """Return 'csv' or 'jsonl' from a file name, or None."""
+
+    for fmt in FORMATS:
+        if filename.lower().endswith('.' + fmt):
+            return fmt
+    if filename.lower().endswith('.json'):
+        return 'jsonl'
+    return None
+
+
+def text_lines(stream, encoding='utf-8'):
+    """Decoded lines, endings kept, of a binary stream such as an upload.
+
+    Unlike io.TextIOWrapper this needs nothing but iteration, which
+    Werkzeug's SpooledTemporaryFile lacks readable() for on Python 3.9.
+    Splitting on b'\n' is safe for UTF-8 and keeps \r\n intact, as
+    newline='' does for the csv module.
+    """
+
+    for line in stream:
+        yield line.decode(encoding)
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row dict) from a text stream, lazily."""
+
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else {'_raw': line.rstrip('\n')}
+    else:
+        raise ValueError(f"Unknown import format {fmt!r}")
+
+
+def validate_row(row):
+    """Return ({title, artist}, None) if row is valid, else (None, errors)."""
+
+    data = {}
+    for column in COLUMNS:
+        value = row.get(column)
+        data[column] = None if value is None else str(value)
+
+    form = SongRowForm(data=data)
+    if not form.validate():
+        return None, form.errors
+    return {column: form[column].data for column in COLUMNS}, None
+
+
+def _copy_batch(connection, batch):
+    """Load a batch with PostgreSQL COPY ... FROM STDIN, via a staging table.
+
+    COPY can't skip conflicting rows, so it fills a temporary table that
+    is then moved over with INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+    Returns the number of songs inserted.
+    """
+
+    columns = COLUMNS + ('dedupe_key',)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in batch:
+        writer.writerow(values[column] for column in columns)
+    buffer.seek(0)
+
+    connection.execute(text(
+        f"CREATE TEMPORARY TABLE {STAGING_TABLE} "
+        f"(title varchar(100), artist varchar(100), dedupe_key varchar(40)) "
+        f"ON COMMIT DROP"))
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer)
+    return connection.execute(text(
+        f"INSERT INTO {Song.__tablename__} ({', '.join(columns)}) "
+        f"SELECT {', '.join(columns)} FROM {STAGING_TABLE} "
+        f"ON CONFLICT (dedupe_key) DO NOTHING")).rowcount
+
+
+def insert_batch(batch):
+    """Insert a batch of song dicts, skipping duplicates, and commit.
+
+    Returns the number of songs inserted.
+    """
+
+    if not batch:
+        return 0
+
+    for values in batch:
+        values['dedupe_key'] = dedupe_key(values['title'], values['artist'])
+
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        inserted = _copy_batch(connection, batch)
+    elif connection.dialect.name == 'sqlite':
+        inserted = connection.execute(sqlite.insert(Song.__table__)
+                                      .on_conflict_do_nothing(index_elements=['dedupe_key']),
+                                      batch).rowcount
+    else:
+        inserted = connection.execute(Song.__table__.insert(), batch).rowcount
+    db.session.commit()
+    return inserted
+
+
+def import_songs(stream, fmt, batch_size=DEFAULT_BATCH_SIZE, errors=None,
+                 progress=None):
+    """Import songs from a text stream; return an ImportResult.
+
+    `errors` is a writable text stream for rejected rows; `progress` is
+    called as progress(result) after each batch is committed.
+    """
+
+    processed = inserted = failed = 0
+    batch = []
+
+    def flush():
+        nonlocal inserted
+        inserted += insert_batch(batch)
+        batch.clear()
+        if progress is not None:
+            progress(ImportResult(processed, inserted, failed))
+
+    for line_num, row in iter_rows(stream, fmt):
+        processed += 1
+        values, row_errors = validate_row(row)
+
+        if row_errors:
+            failed += 1
+            if errors is not None:
+                errors.write(json.dumps({'line': line_num, 'row': row,
+                                         'errors': row_errors}) + '\n')
+            continue
+
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    return ImportResult(processed, inserted, failed)
+
+
+@click.command('import-songs')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS),
+              help='Defaults to the file extension.')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='Write rejected rows here (JSON lines).')
+@with_appcontext
+def import_songs_command(path, fmt, batch_size, errors_path):
+    """Bulk-import songs from a CSV or JSONL file."""
+
+    fmt = fmt or guess_format(path)
+    if fmt is None:
+        raise click.UsageError("Can't tell the format from the file name; pass --format.")
+
+    def report(result):
+        click.echo(f"{result.processed} rows read, {result.inserted} inserted, "
+                   f"{result.failed} rejected", err=True)
+
+    errors = open(errors_path, 'w', encoding='utf-8') if errors_path else None
+    try:
+        with open(path, newline='', encoding='utf-8') as stream:
+            result = import_songs(stream, fmt, batch_size, errors, report)
+    finally:
+        if errors is not None:
+            errors.close()
+
+    duplicates = result.processed - result.inserted - result.failed
+    click.echo(f"Done: {result.inserted} songs imported, {result.failed} rows rejected, "
+               f"{duplicates} duplicates skipped.")
@@ -0,0 +1,220 @@
+"""Lightweight query and latency instrumentation for playlist app.
+
+A cheaper stand-in for SQLALCHEMY_ECHO / the debug toolbar that can be
+left on in production. For a sampled fraction of requests we record,
+per route:
+
+- request count and a latency histogram
+- number of SQL statements and total time spent in them
+
+plus the slowest statements overall, normalized so that the same query
+with different literals or IN-list lengths is counted once.
+
+With a sample rate of 0 (the default) no SQLAlchemy listeners are
+installed at all and the request hooks return immediately.
+"""
+
+import random
+import re
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+from flask import g, has_request_context, request, request_finished, request_started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_STATEMENTS = 500
+SLOWEST_STATEMENTS = 20
+
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,?)+\)', re.I)
+_PARAMS = re.compile(r'%\(\w+\)s|%s|:\w+|\?')
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """Collapse literals, bind params and IN-lists so similar SQL groups."""
+
+    statement = _STRINGS.sub('?', statement)
+    statement = _PARAMS.sub('?', statement)
+    statement = _NUMBERS.sub('?', statement)
+    statement = _IN_LIST.sub('IN (...)', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+@contextmanager
+def count_queries(engine=Engine):
+    """Collect the SQL statements executed inside the block.
+
+        with count_queries() as statements:
+            ...
+        assert len(statements) == 1
+    """
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+class RouteStats:
+    """Aggregates for one endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, latency, queries, sql_time):
+        self.requests += 1
+        self.queries += queries
+        self.sql_time += sql_time
+        self.latency_sum += latency
+
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.latency_buckets[i] += 1
+                break
+        else:
+            self.latency_buckets[-1] += 1
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+        return {
+            'requests': self.requests,
+            'queries': self.queries,
+            'queries_per_request': self.queries / self.requests,
+            'sql_time': self.sql_time,
+            'latency_sum': self.latency_sum,
+            'latency_histogram': dict(zip(bounds, self.latency_buckets)),
+        }
+
+
+class StatementStats:
+    """Aggregates for one normalized SQL statement."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+
+class Instrumentation:
+    """Collects per-route SQL and latency metrics for a sample of requests."""
+
+    def __init__(self, sample_rate=0.0):
+        self.sample_rate = 0.0
+        self.routes = {}
+        self.statements = {}
+        self._lock = Lock()
+        self._listening = False
+        self.set_sample_rate(sample_rate)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_SAMPLE_RATE', 0.0)
+        self.set_sample_rate(float(app.config['METRICS_SAMPLE_RATE']))
+
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+
+    def set_sample_rate(self, rate):
+        """Change the sampled fraction of requests; 0 turns hooks off."""
+
+        self.sample_rate = rate
+        if rate > 0 and not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        elif rate <= 0 and self._listening:
+            event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = False
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+            self.statements = {}
+
+    # Flask signal receivers
+
+    def _request_started(self, sender, **extra):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        g._instrumentation = {'start': perf_counter(), 'queries': []}
+
+    def _request_finished(self, sender, response, **extra):
+        state = g.pop('_instrumentation', None)
+        if state is None:
+            return
+
+        latency = perf_counter() - state['start']
+        queries = state['queries']
+        endpoint = request.endpoint or 'unmatched'
+
+        with self._lock:
+            route = self.routes.get(endpoint)
+            if route is None:
+                route = self.routes[endpoint] = RouteStats()
+            route.add(latency, len(queries), sum(elapsed for _, elapsed in queries))
+
+            for statement, elapsed in queries:
+                key = normalize_sql(statement)
+                stats = self.statements.get(key)
+                if stats is None:
+                    if len(self.statements) >= MAX_STATEMENTS:
+                        continue
+                    stats = self.statements[key] = StatementStats()
+                stats.add(elapsed)
+
+    # SQLAlchemy engine listeners
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_instrumentation_start', []).append(perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('_instrumentation_start')
+        if not started:
+            return
+        elapsed = perf_counter() - started.pop()
+
+        if has_request_context():
+            state = g.get('_instrumentation')
+            if state is not None:
+                state['queries'].append((statement, elapsed))
+
+    def report(self, slowest=SLOWEST_STATEMENTS):
+        with self._lock:
+            routes = {endpoint: stats.to_dict()
+                      for endpoint, stats in self.routes.items()}
+            statements = sorted(self.statements.items(),
+                                key=lambda item: item[1].max_time,
+                                reverse=True)[:slowest]
+
+        return {
+            'sample_rate': self.sample_rate,
+            'routes': routes,
+            'slowest_statements': [{'statement': statement,
+                                    'count': stats.count,
+                                    'total_time': stats.total_time,
+                                    'max_time': stats.max_time}
+                                   for statement, stats in statements],
+        }
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,209 @@
+"""Process-local index of which songs are on which playlists.
+
+Optional (MEMBERSHIP_INDEX, off by default). When on, every
+playlist_song edge is held twice, as sorted arrays of 32-bit ids: a
+playlist's song ids, and a song's playlist ids. "Is song X on playlist
+Y" is then a binary search and "which playlists is song X on" a dict
+lookup, with no query and no ORM collection loaded. That is 8 bytes
+per edge plus ~150 bytes per playlist and per song: about 28 MiB per
+million edges on benchmarks/membership.py's catalog. stats() (and
+/metrics/membership) reports the actual figure.
+
+The index is loaded on first use, with two ordered scans of
+playlist_song. After that it follows this process's commits: the
+playlists a commit changed (as tracked for the aggregates, see
+aggregates.changed_playlists) have their rows re-read once the commit
+is done. Other processes' commits are picked up by a full reload once
+the index is MEMBERSHIP_MAX_AGE seconds old, so answers may lag those by
+that much. One request does that reload; the others arriving meanwhile
+wait for it rather than each reading the table again. Reads only, then:
+writes still check the database.
+"""
+
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from threading import Lock
+
+from sqlalchemy import event, select
+
+from aggregates import changed_playlists
+from models import db, PlaylistSong
+
+DEFAULT_MAX_AGE = 300
+FETCH_SIZE = 100000
+# Keep IN-lists under SQLite's bound-parameter limit
+CHUNK_SIZE = 900
+TYPECODE = 'i'
+
+_table = PlaylistSong.__table__
+
+
+def _grouped(rows):
+    """{key: array of values} from (key, value) rows sorted by key, value."""
+
+    groups = {}
+    key, values = None, None
+    for row_key, value in rows:
+        if row_key != key:
+            key, values = row_key, array(TYPECODE)
+            groups[key] = values
+        values.append(value)
+    return groups
+
+
+def _scan(connection, key, value, where=None):
+    stmt = select(key, value).order_by(key, value)
+    if where is not None:
+        stmt = stmt.where(where)
+    result = connection.execution_options(stream_results=True).execute(stmt)
+    return _grouped(row for rows in result.partitions(FETCH_SIZE) for row in rows)
+
+
+class MembershipIndex:
+    """playlist_song edges, keyed both ways."""
+
+    def __init__(self, active=False, max_age=DEFAULT_MAX_AGE):
+        self.active = active
+        self.max_age = max_age
+        self._lock = Lock()
+        self._songs = None
+        self._playlists = None
+        self.loaded_at = None
+
+    def init_app(self, app, session):
+        """Configure from app.config and hook commit-time syncing."""
+
+        self.active = app.config.setdefault('MEMBERSHIP_INDEX', False)
+        self.max_age = app.config.setdefault('MEMBERSHIP_MAX_AGE', DEFAULT_MAX_AGE)
+        self.clear()
+
+        if not event.contains(session, 'after_commit', self._after_commit):
+            event.listen(session, 'after_commit', self._after_commit)
+
+    def enabled(self):
+        """Whether the index is on; loads (or reloads) it when needed."""
+
+        if not self.active:
+            return False
+        if self._stale():
+            with self._lock:
+                # Another request may have reloaded it while we waited
+                if self._stale():
+                    self._load()
+        return True
+
+    def _stale(self):
+        return self.loaded_at is None or (
+            self.max_age and time.monotonic() - self.loaded_at > self.max_age)
+
+    def load(self, engine=None):
+        """(Re)read every edge; readers use the old index meanwhile."""
+
+        with self._lock:
+            self._load(engine)
+
+    def _load(self, engine=None):
+        engine = engine or db.get_engine()
+        with engine.connect() as connection:
+            started = time.monotonic()
+            songs = _scan(connection, _table.c.playlist_id, _table.c.song_id)
+            playlists = _scan(connection, _table.c.song_id, _table.c.playlist_id)
+            self._songs, self._playlists, self.loaded_at = songs, playlists, started
+
+    def contains(self, playlist_id, song_id):
+        """Whether song_id is on playlist_id."""
+
+        songs = self._songs.get(playlist_id, ())
+        i = bisect_left(songs, song_id)
+        return i < len(songs) and songs[i] == song_id
+
+    def songs_of(self, playlist_id):
+        """Sorted ids of the songs on playlist_id."""
+
+        return self._songs.get(playlist_id, array(TYPECODE))
+
+    def playlists_of(self, song_id):
+        """Sorted ids of the playlists song_id is on."""
+
+        return self._playlists.get(song_id, array(TYPECODE))
+
+    def sync(self, playlist_ids, engine=None):
+        """Re-read the edges of playlist_ids and update both directions."""
+
+        if self._songs is None:
+            return
+        playlist_ids = sorted(set(playlist_ids))
+        engine = engine or db.get_engine()
+
+        with self._lock, engine.connect() as connection:
+            current = {}
+            for start in range(0, len(playlist_ids), CHUNK_SIZE):
+                chunk = playlist_ids[start:start + CHUNK_SIZE]
+                current.update(_scan(connection, _table.c.playlist_id, _table.c.song_id,
+                                     _table.c.playlist_id.in_(chunk)))
+
+            # {song id: playlist ids}, added in ascending order
+            linked, unlinked = {}, {}
+            for playlist_id in playlist_ids:
+                old = self._songs.get(playlist_id, ())
+                new = current.get(playlist_id, array(TYPECODE))
+                for song_id in set(old).difference(new):
+                    unlinked.setdefault(song_id, set()).add(playlist_id)
+                for song_id in set(new).difference(old):
+                    linked.setdefault(song_id, []).append(playlist_id)
+                if new:
+                    self._songs[playlist_id] = new
+                else:
+                    self._songs.pop(playlist_id, None)
+
+            for song_id in linked.keys() | unlinked.keys():
+                self._relink(song_id, linked.get(song_id, ()), unlinked.get(song_id, ()))
+
+    def _relink(self, song_id, linked, unlinked):
+        """Rebuild song_id's playlist ids once, for all of a sync's changes.
+
+        The array is replaced, so a reader never sees one mid-change.
+        """
+
+        kept = (playlist_id for playlist_id in self._playlists.get(song_id, ())
+                if playlist_id not in unlinked)
+        playlists = array(TYPECODE, merge(kept, linked))
+        if playlists:
+            self._playlists[song_id] = playlists
+        else:
+            self._playlists.pop(song_id, None)
+
+    def _after_commit(self, session):
+        playlist_ids = changed_playlists(session)
+        if playlist_ids and self._songs is not None:
+            self.sync(playlist_ids)
+
+    def clear(self):
+        with self._lock:
+            self._songs = self._playlists = self.loaded_at = None
+
+    def stats(self):
+        """Edge and key counts and approximate memory use."""
+
+        if self._songs is None:
+            return {'loaded': False}
+        songs, playlists = self._songs, self._playlists
+        edges = sum(len(ids) for ids in songs.values())
+        size = sum(sys.getsizeof(d) + sum(sys.getsizeof(k) + sys.getsizeof(v)
+                                          for k, v in d.items())
+                   for d in (songs, playlists))
+        return {
+            'loaded': True,
+            'age': time.monotonic() - self.loaded_at,
+            'edges': edges,
+            'playlists': len(songs),
+            'songs': len(playlists),
+            'bytes': size,
+            'bytes_per_million_edges': size * 1000000 // edges if edges else 0,
+        }
+
+
+membership = MembershipIndex()
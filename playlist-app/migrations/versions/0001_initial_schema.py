@@ -0,0 +1,54 @@
+"""Initial playlist schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00
+
+Tables as db.create_all() built them before migrations existed. A
+database created that way can be brought under migrations with
+`flask db stamp 0001`.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'playlists',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('description', sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'songs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=100), nullable=False),
+        sa.Column('artist', sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'playlist_song',
+        sa.Column('playlist_id', sa.Integer(), nullable=False),
+        sa.Column('song_id', sa.Integer(), nullable=False),
+        # Named as PostgreSQL names them by default, so 0002 can find them
+        sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'],
+                                name='playlist_song_playlist_id_fkey'),
+        sa.ForeignKeyConstraint(['song_id'], ['songs.id'],
+                                name='playlist_song_song_id_fkey'),
+        sa.PrimaryKeyConstraint('playlist_id', 'song_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('playlist_song')
+    op.drop_table('songs')
+    op.drop_table('playlists')
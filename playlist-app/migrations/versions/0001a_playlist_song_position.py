@@ -0,0 +1,51 @@
+"""Gapped position column for playlist order
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-18 12:15:00
+
+playlist_song.position and its (playlist_id, position) index. Existing
+rows are numbered POSITION_GAP apart within each playlist, in song id
+order. A database that db.create_all() built after the column existed
+already has it, and is left as it is.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001a'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# models.POSITION_GAP when this revision was written
+POSITION_GAP = 1 << 16
+
+
+def upgrade():
+    columns = sa.inspect(op.get_bind()).get_columns('playlist_song')
+    if any(column['name'] == 'position' for column in columns):
+        return
+
+    with op.batch_alter_table('playlist_song') as batch_op:
+        batch_op.add_column(sa.Column('position', sa.BigInteger(), nullable=True))
+    op.execute(f"""
+        UPDATE playlist_song SET position = ranked.n * {POSITION_GAP}
+        FROM (SELECT playlist_id, song_id,
+                     row_number() OVER (PARTITION BY playlist_id ORDER BY song_id) AS n
+              FROM playlist_song) AS ranked
+        WHERE ranked.playlist_id = playlist_song.playlist_id
+          AND ranked.song_id = playlist_song.song_id
+    """)
+    with op.batch_alter_table('playlist_song') as batch_op:
+        batch_op.alter_column('position', existing_type=sa.BigInteger(), nullable=False)
+    op.create_index('ix_playlist_song_playlist_position', 'playlist_song',
+                    ['playlist_id', 'position'])
+
+
+def downgrade():
+    op.drop_index('ix_playlist_song_playlist_position', table_name='playlist_song')
+    with op.batch_alter_table('playlist_song') as batch_op:
+        batch_op.drop_column('position')
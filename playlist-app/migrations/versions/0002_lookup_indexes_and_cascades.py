@@ -0,0 +1,48 @@
+"""Lookup indexes and ON DELETE CASCADE foreign keys
+
+Revision ID: 0002
+Revises: 0001a
+Create Date: 2026-10-18 12:30:00
+
+- playlist_song(song_id, playlist_id): the primary key leads on
+  playlist_id, so Song.playlists lookups scanned the whole table
+- songs.title and songs.artist for lookup / prefix search
+- playlist_song rows go away with their playlist or song
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001a'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEYS = (
+    ('playlist_song_playlist_id_fkey', 'playlists', 'playlist_id'),
+    ('playlist_song_song_id_fkey', 'songs', 'song_id'),
+)
+
+
+def _replace_foreign_keys(ondelete):
+    with op.batch_alter_table('playlist_song') as batch_op:
+        for name, referred, column in FOREIGN_KEYS:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred, [column], ['id'],
+                                        ondelete=ondelete)
+
+
+def upgrade():
+    op.create_index('ix_playlist_song_song_playlist', 'playlist_song',
+                    ['song_id', 'playlist_id'])
+    op.create_index('ix_songs_title', 'songs', ['title'])
+    op.create_index('ix_songs_artist', 'songs', ['artist'])
+    _replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    _replace_foreign_keys(None)
+    op.drop_index('ix_songs_artist', table_name='songs')
+    op.drop_index('ix_songs_title', table_name='songs')
+    op.drop_index('ix_playlist_song_song_playlist', table_name='playlist_song')
@@ -0,0 +1,76 @@
+"""Full-text search over song title and artist
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 13:00:00
+
+PostgreSQL: a generated, weighted tsvector column with a GIN index.
+SQLite: an external-content FTS5 table kept in step by triggers, filled
+from the existing rows.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+UPGRADE = {
+    'postgresql': [
+        """ALTER TABLE songs ADD COLUMN search_vector tsvector
+           GENERATED ALWAYS AS (
+               setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+               setweight(to_tsvector('simple', coalesce(artist, '')), 'B')
+           ) STORED""",
+        "CREATE INDEX ix_songs_search_vector ON songs USING GIN (search_vector)",
+    ],
+    'sqlite': [
+        """CREATE VIRTUAL TABLE songs_fts USING fts5(
+               title, artist, content='songs', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2')""",
+        """CREATE TRIGGER songs_fts_insert AFTER INSERT ON songs BEGIN
+               INSERT INTO songs_fts (rowid, title, artist)
+               VALUES (new.id, new.title, new.artist);
+           END""",
+        """CREATE TRIGGER songs_fts_delete AFTER DELETE ON songs BEGIN
+               INSERT INTO songs_fts (songs_fts, rowid, title, artist)
+               VALUES ('delete', old.id, old.title, old.artist);
+           END""",
+        """CREATE TRIGGER songs_fts_update AFTER UPDATE OF title, artist ON songs BEGIN
+               INSERT INTO songs_fts (songs_fts, rowid, title, artist)
+               VALUES ('delete', old.id, old.title, old.artist);
+               INSERT INTO songs_fts (rowid, title, artist)
+               VALUES (new.id, new.title, new.artist);
+           END""",
+        "INSERT INTO songs_fts (songs_fts) VALUES ('rebuild')",
+    ],
+}
+
+DOWNGRADE = {
+    'postgresql': [
+        "DROP INDEX ix_songs_search_vector",
+        "ALTER TABLE songs DROP COLUMN search_vector",
+    ],
+    'sqlite': [
+        "DROP TRIGGER songs_fts_update",
+        "DROP TRIGGER songs_fts_delete",
+        "DROP TRIGGER songs_fts_insert",
+        "DROP TABLE songs_fts",
+    ],
+}
+
+
+def _run(statements):
+    for statement in statements.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def upgrade():
+    _run(UPGRADE)
+
+
+def downgrade():
+    _run(DOWNGRADE)
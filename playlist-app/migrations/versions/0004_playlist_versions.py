@@ -0,0 +1,36 @@
+"""Per-playlist version counters
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 15:00:00
+
+playlist_versions backs the JSON API's ETag / Last-Modified headers.
+Existing playlists start at version 1.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'playlist_versions',
+        sa.Column('playlist_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('playlist_id'),
+    )
+    op.execute("INSERT INTO playlist_versions (playlist_id, version, updated_at) "
+               "SELECT id, 1, CURRENT_TIMESTAMP FROM playlists")
+
+
+def downgrade():
+    op.drop_table('playlist_versions')
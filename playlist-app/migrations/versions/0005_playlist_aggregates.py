@@ -0,0 +1,55 @@
+"""Playlist track count and artist histogram
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 16:00:00
+
+playlist_stats and playlist_artist_counts, filled from the existing
+playlist_song rows; aggregates.py keeps them current from here on.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'playlist_stats',
+        sa.Column('playlist_id', sa.Integer(), nullable=False),
+        sa.Column('song_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('playlist_id'),
+    )
+    op.create_table(
+        'playlist_artist_counts',
+        sa.Column('playlist_id', sa.Integer(), nullable=False),
+        sa.Column('artist', sa.String(length=100), nullable=False),
+        sa.Column('song_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('playlist_id', 'artist'),
+    )
+
+    op.execute("""
+        INSERT INTO playlist_stats (playlist_id, song_count)
+        SELECT playlist_id, count(*)
+        FROM playlist_song
+        GROUP BY playlist_id
+    """)
+    op.execute("""
+        INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+        SELECT playlist_song.playlist_id, songs.artist, count(*)
+        FROM playlist_song JOIN songs ON songs.id = playlist_song.song_id
+        GROUP BY playlist_song.playlist_id, songs.artist
+    """)
+
+
+def downgrade():
+    op.drop_table('playlist_artist_counts')
+    op.drop_table('playlist_stats')
@@ -0,0 +1,31 @@
+"""Normalized (title, artist) key for duplicate songs
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 17:00:00
+
+songs.dedupe_key under a unique index. Existing rows are left NULL
+(which the index allows): run `flask dedupe-songs` afterwards to key
+them and merge the duplicates in short batches.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('songs', sa.Column('dedupe_key', sa.String(length=40), nullable=True))
+    op.create_index('uq_songs_dedupe_key', 'songs', ['dedupe_key'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_songs_dedupe_key', table_name='songs')
+    # Not batch mode: rebuilding songs on SQLite would lose its FTS triggers
+    op.drop_column('songs', 'dedupe_key')
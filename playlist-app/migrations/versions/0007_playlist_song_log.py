@@ -0,0 +1,76 @@
+"""Log of songs put on playlists, for recommendations
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 18:00:00
+
+playlist_song_log, filled by a trigger on playlist_song (a statement
+trigger over the inserted rows on PostgreSQL, a row trigger on SQLite).
+It starts empty: the first `flask build-recommendations` reads
+playlist_song itself.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+UPGRADE = {
+    'postgresql': [
+        """CREATE FUNCTION log_playlist_songs() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               INSERT INTO playlist_song_log (playlist_id, song_id)
+               SELECT playlist_id, song_id FROM inserted;
+               RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER playlist_song_log_insert AFTER INSERT ON playlist_song
+           REFERENCING NEW TABLE AS inserted
+           FOR EACH STATEMENT EXECUTE PROCEDURE log_playlist_songs()""",
+    ],
+    'sqlite': [
+        """CREATE TRIGGER playlist_song_log_insert AFTER INSERT ON playlist_song BEGIN
+               INSERT INTO playlist_song_log (playlist_id, song_id)
+               VALUES (new.playlist_id, new.song_id);
+           END""",
+    ],
+}
+
+DOWNGRADE = {
+    'postgresql': [
+        "DROP TRIGGER playlist_song_log_insert ON playlist_song",
+        "DROP FUNCTION log_playlist_songs()",
+    ],
+    'sqlite': [
+        "DROP TRIGGER playlist_song_log_insert",
+    ],
+}
+
+
+def _run(statements):
+    for statement in statements.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def upgrade():
+    op.create_table(
+        'playlist_song_log',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('playlist_id', sa.Integer(), nullable=False),
+        sa.Column('song_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_playlist_song_log_playlist_id', 'playlist_song_log', ['playlist_id'])
+    op.create_index('ix_playlist_song_log_song_id', 'playlist_song_log', ['song_id'])
+    _run(UPGRADE)
+
+
+def downgrade():
+    _run(DOWNGRADE)
+    op.drop_index('ix_playlist_song_log_song_id', table_name='playlist_song_log')
+    op.drop_index('ix_playlist_song_log_playlist_id', table_name='playlist_song_log')
+    op.drop_table('playlist_song_log')
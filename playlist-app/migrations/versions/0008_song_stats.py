@@ -0,0 +1,111 @@
+"""Per-song playlist counts
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 20:00:00
+
+song_stats.playlist_count, for "on N playlists" on song pages. Kept by
+triggers on playlist_song (statement triggers over the changed rows on
+PostgreSQL, row triggers on SQLite); filled here from playlist_song.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+UPGRADE = {
+    'postgresql': [
+        """CREATE FUNCTION count_song_playlists() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               IF TG_OP = 'INSERT' THEN
+                   INSERT INTO song_stats (song_id, playlist_count)
+                   SELECT song_id, count(*) FROM new_rows GROUP BY song_id
+                   ON CONFLICT (song_id) DO UPDATE
+                   SET playlist_count = song_stats.playlist_count + excluded.playlist_count;
+               ELSIF TG_OP = 'DELETE' THEN
+                   UPDATE song_stats SET playlist_count = playlist_count - removed.n
+                   FROM (SELECT song_id, count(*) AS n FROM old_rows GROUP BY song_id) removed
+                   WHERE song_stats.song_id = removed.song_id;
+               ELSE
+                   -- Moves change positions only: every song nets out to zero
+                   INSERT INTO song_stats (song_id, playlist_count)
+                   SELECT song_id, sum(n) FROM (
+                       SELECT song_id, 1 AS n FROM new_rows
+                       UNION ALL SELECT song_id, -1 FROM old_rows) changes
+                   GROUP BY song_id HAVING sum(n) <> 0
+                   ON CONFLICT (song_id) DO UPDATE
+                   SET playlist_count = song_stats.playlist_count + excluded.playlist_count;
+               END IF;
+               RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER song_stats_insert AFTER INSERT ON playlist_song
+           REFERENCING NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_song_playlists()""",
+        """CREATE TRIGGER song_stats_delete AFTER DELETE ON playlist_song
+           REFERENCING OLD TABLE AS old_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_song_playlists()""",
+        """CREATE TRIGGER song_stats_update AFTER UPDATE ON playlist_song
+           REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_song_playlists()""",
+    ],
+    'sqlite': [
+        """CREATE TRIGGER song_stats_insert AFTER INSERT ON playlist_song BEGIN
+               INSERT INTO song_stats (song_id, playlist_count) VALUES (new.song_id, 1)
+               ON CONFLICT (song_id) DO UPDATE SET playlist_count = playlist_count + 1;
+           END""",
+        """CREATE TRIGGER song_stats_delete AFTER DELETE ON playlist_song BEGIN
+               UPDATE song_stats SET playlist_count = playlist_count - 1
+               WHERE song_id = old.song_id;
+           END""",
+        """CREATE TRIGGER song_stats_update AFTER UPDATE OF song_id ON playlist_song
+           WHEN old.song_id <> new.song_id BEGIN
+               UPDATE song_stats SET playlist_count = playlist_count - 1
+               WHERE song_id = old.song_id;
+               INSERT INTO song_stats (song_id, playlist_count) VALUES (new.song_id, 1)
+               ON CONFLICT (song_id) DO UPDATE SET playlist_count = playlist_count + 1;
+           END""",
+    ],
+}
+
+DOWNGRADE = {
+    'postgresql': [
+        "DROP TRIGGER song_stats_update ON playlist_song",
+        "DROP TRIGGER song_stats_delete ON playlist_song",
+        "DROP TRIGGER song_stats_insert ON playlist_song",
+        "DROP FUNCTION count_song_playlists()",
+    ],
+    'sqlite': [
+        "DROP TRIGGER song_stats_update",
+        "DROP TRIGGER song_stats_delete",
+        "DROP TRIGGER song_stats_insert",
+    ],
+}
+
+
+def _run(statements):
+    for statement in statements.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def upgrade():
+    op.create_table(
+        'song_stats',
+        sa.Column('song_id', sa.Integer(), nullable=False),
+        sa.Column('playlist_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['song_id'], ['songs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('song_id'),
+    )
+    op.execute("""INSERT INTO song_stats (song_id, playlist_count)
+                  SELECT song_id, count(*) FROM playlist_song GROUP BY song_id""")
+    _run(UPGRADE)
+
+
+def downgrade():
+    _run(DOWNGRADE)
+    op.drop_table('song_stats')
@@ -0,0 +1,204 @@
+"""Playlist aggregates kept by triggers
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 23:00:00
+
+playlist_stats and playlist_artist_counts were recomputed per playlist
+at commit; from here on triggers on playlist_song and songs apply each
+write's changed rows as deltas (see models.PLAYLIST_AGGREGATES_DDL).
+Both tables are recounted once from playlist_song.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def _pg_apply_playlist_changes(changes):
+    by_playlist = (f"SELECT playlist_id, sum(n) AS n FROM ({changes}) c "
+                   f"GROUP BY playlist_id")
+    by_artist = (f"SELECT c.playlist_id, songs.artist, sum(c.n) AS n FROM ({changes}) c "
+                 f"JOIN songs ON songs.id = c.song_id GROUP BY c.playlist_id, songs.artist")
+    return f"""
+                   UPDATE playlist_stats SET song_count = playlist_stats.song_count + d.n
+                   FROM ({by_playlist} HAVING sum(n) < 0) d
+                   WHERE playlist_stats.playlist_id = d.playlist_id;
+                   INSERT INTO playlist_stats (playlist_id, song_count)
+                   {by_playlist} HAVING sum(n) > 0
+                   ON CONFLICT (playlist_id) DO UPDATE
+                   SET song_count = playlist_stats.song_count + excluded.song_count;
+                   UPDATE playlist_artist_counts
+                   SET song_count = playlist_artist_counts.song_count + d.n
+                   FROM ({by_artist} HAVING sum(c.n) < 0) d
+                   WHERE playlist_artist_counts.playlist_id = d.playlist_id
+                     AND playlist_artist_counts.artist = d.artist;
+                   INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+                   {by_artist} HAVING sum(c.n) > 0
+                   ON CONFLICT (playlist_id, artist) DO UPDATE
+                   SET song_count = playlist_artist_counts.song_count + excluded.song_count;
+                   DELETE FROM playlist_stats WHERE song_count <= 0
+                   AND playlist_id IN (SELECT playlist_id FROM ({changes}) c);
+                   DELETE FROM playlist_artist_counts WHERE song_count <= 0
+                   AND playlist_id IN (SELECT playlist_id FROM ({changes}) c);"""
+
+
+_SQLITE_ADD_TRACK = """
+               INSERT INTO playlist_stats (playlist_id, song_count) VALUES (new.playlist_id, 1)
+               ON CONFLICT (playlist_id) DO UPDATE SET song_count = song_count + 1;
+               INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+               SELECT new.playlist_id, artist, 1 FROM songs WHERE id = new.song_id
+               ON CONFLICT (playlist_id, artist) DO UPDATE SET song_count = song_count + 1;"""
+
+_SQLITE_REMOVE_TRACK = """
+               UPDATE playlist_stats SET song_count = song_count - 1
+               WHERE playlist_id = old.playlist_id;
+               UPDATE playlist_artist_counts SET song_count = song_count - 1
+               WHERE playlist_id = old.playlist_id
+                 AND artist = (SELECT artist FROM songs WHERE id = old.song_id);
+               DELETE FROM playlist_stats
+               WHERE playlist_id = old.playlist_id AND song_count <= 0;
+               DELETE FROM playlist_artist_counts
+               WHERE playlist_id = old.playlist_id AND song_count <= 0;"""
+
+_PLAYLIST_SONG_UPGRADE = {
+    'postgresql': [
+        f"""CREATE FUNCTION count_playlist_songs() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               IF TG_OP = 'INSERT' THEN{_pg_apply_playlist_changes(
+                   'SELECT playlist_id, song_id, 1 AS n FROM new_rows')}
+               ELSIF TG_OP = 'DELETE' THEN{_pg_apply_playlist_changes(
+                   'SELECT playlist_id, song_id, -1 AS n FROM old_rows')}
+               ELSE{_pg_apply_playlist_changes(
+                   'SELECT playlist_id, song_id, 1 AS n FROM new_rows '
+                   'UNION ALL SELECT playlist_id, song_id, -1 FROM old_rows')}
+               END IF;
+               RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER playlist_aggregates_insert AFTER INSERT ON playlist_song
+           REFERENCING NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_playlist_songs()""",
+        """CREATE TRIGGER playlist_aggregates_delete AFTER DELETE ON playlist_song
+           REFERENCING OLD TABLE AS old_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_playlist_songs()""",
+        """CREATE TRIGGER playlist_aggregates_update AFTER UPDATE ON playlist_song
+           REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_playlist_songs()""",
+    ],
+    'sqlite': [
+        f"""CREATE TRIGGER playlist_aggregates_insert AFTER INSERT ON playlist_song
+           BEGIN{_SQLITE_ADD_TRACK}
+           END""",
+        f"""CREATE TRIGGER playlist_aggregates_delete AFTER DELETE ON playlist_song
+           BEGIN{_SQLITE_REMOVE_TRACK}
+           END""",
+        f"""CREATE TRIGGER playlist_aggregates_update AFTER UPDATE OF playlist_id, song_id
+           ON playlist_song
+           WHEN old.playlist_id <> new.playlist_id OR old.song_id <> new.song_id
+           BEGIN{_SQLITE_REMOVE_TRACK}{_SQLITE_ADD_TRACK}
+           END""",
+    ],
+}
+
+_SONGS_UPGRADE = {
+    'postgresql': [
+        """CREATE FUNCTION remove_deleted_song() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               DELETE FROM playlist_song WHERE song_id = OLD.id;
+               RETURN OLD;
+           END $$""",
+        """CREATE TRIGGER playlist_aggregates_song_delete BEFORE DELETE ON songs
+           FOR EACH ROW EXECUTE PROCEDURE remove_deleted_song()""",
+        """CREATE FUNCTION recount_song_artist() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               UPDATE playlist_artist_counts SET song_count = song_count - 1
+               WHERE artist = OLD.artist AND playlist_id IN (
+                   SELECT playlist_id FROM playlist_song WHERE song_id = NEW.id);
+               DELETE FROM playlist_artist_counts
+               WHERE artist = OLD.artist AND song_count <= 0 AND playlist_id IN (
+                   SELECT playlist_id FROM playlist_song WHERE song_id = NEW.id);
+               INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+               SELECT playlist_id, NEW.artist, 1 FROM playlist_song WHERE song_id = NEW.id
+               ON CONFLICT (playlist_id, artist) DO UPDATE
+               SET song_count = playlist_artist_counts.song_count + 1;
+               RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER playlist_aggregates_song_artist AFTER UPDATE OF artist ON songs
+           FOR EACH ROW WHEN (OLD.artist IS DISTINCT FROM NEW.artist)
+           EXECUTE PROCEDURE recount_song_artist()""",
+    ],
+    'sqlite': [
+        """CREATE TRIGGER playlist_aggregates_song_delete BEFORE DELETE ON songs BEGIN
+               DELETE FROM playlist_song WHERE song_id = old.id;
+           END""",
+        """CREATE TRIGGER playlist_aggregates_song_artist AFTER UPDATE OF artist ON songs
+           WHEN old.artist IS NOT new.artist BEGIN
+               UPDATE playlist_artist_counts SET song_count = song_count - 1
+               WHERE artist = old.artist AND playlist_id IN (
+                   SELECT playlist_id FROM playlist_song WHERE song_id = new.id);
+               DELETE FROM playlist_artist_counts
+               WHERE artist = old.artist AND song_count <= 0 AND playlist_id IN (
+                   SELECT playlist_id FROM playlist_song WHERE song_id = new.id);
+               INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+               SELECT playlist_id, new.artist, 1 FROM playlist_song WHERE song_id = new.id
+               ON CONFLICT (playlist_id, artist) DO UPDATE SET song_count = song_count + 1;
+           END""",
+    ],
+}
+
+
+UPGRADE = {
+    dialect: _PLAYLIST_SONG_UPGRADE[dialect] + _SONGS_UPGRADE[dialect]
+    for dialect in ('postgresql', 'sqlite')
+}
+
+DOWNGRADE = {
+    'postgresql': [
+        "DROP TRIGGER playlist_aggregates_song_artist ON songs",
+        "DROP TRIGGER playlist_aggregates_song_delete ON songs",
+        "DROP TRIGGER playlist_aggregates_update ON playlist_song",
+        "DROP TRIGGER playlist_aggregates_delete ON playlist_song",
+        "DROP TRIGGER playlist_aggregates_insert ON playlist_song",
+        "DROP FUNCTION recount_song_artist()",
+        "DROP FUNCTION remove_deleted_song()",
+        "DROP FUNCTION count_playlist_songs()",
+    ],
+    'sqlite': [
+        "DROP TRIGGER playlist_aggregates_song_artist",
+        "DROP TRIGGER playlist_aggregates_song_delete",
+        "DROP TRIGGER playlist_aggregates_update",
+        "DROP TRIGGER playlist_aggregates_delete",
+        "DROP TRIGGER playlist_aggregates_insert",
+    ],
+}
+
+RECOUNT = [
+    "DELETE FROM playlist_stats",
+    "DELETE FROM playlist_artist_counts",
+    """INSERT INTO playlist_stats (playlist_id, song_count)
+       SELECT playlist_id, count(*) FROM playlist_song GROUP BY playlist_id""",
+    """INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+       SELECT playlist_song.playlist_id, songs.artist, count(*)
+       FROM playlist_song JOIN songs ON songs.id = playlist_song.song_id
+       GROUP BY playlist_song.playlist_id, songs.artist""",
+]
+
+
+def _run(statements):
+    for statement in statements.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def upgrade():
+    _run(UPGRADE)
+    for statement in RECOUNT:
+        op.execute(statement)
+
+
+def downgrade():
+    _run(DOWNGRADE)
@@ -1,173 +1,614 @@
-<<<<<<< HEAD
-from flask import Flask, redirect, render_template, request, flash
-from flask_sqlalchemy import SQLAlchemy
-from flask_debugtoolbar import DebugToolbarExtension
-import os
+"""Models for Playlist app."""
 
-from forms import NewSongForPlaylistForm, SongForm, PlaylistForm  # type: ignore
+import hashlib
+import unicodedata
+from datetime import datetime
 
-# Initialize the Flask app
-app = Flask(__name__)
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.engine import Engine
 
-# App config for database URI
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'postgresql:///playlist-app')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
-app.config['SECRET_KEY'] = "I'LL NEVER TELL!!"  # Set a secret key for sessions
 
-# Initialize the SQLAlchemy instance
-db = SQLAlchemy(app)  # Initialize db after configuring app
+class RoutingSession(SignallingSession):
+    """Session that sends reads to a replica bind when one is assigned.
 
-# Initialize Debug Toolbar
-debug = DebugToolbarExtension(app)
+    replicas.ReplicaRouter puts the bind key of a replica in
+    session.info['read_bind'] for read-only requests. Until then, and as
+    soon as the session flushes or runs an INSERT / UPDATE / DELETE,
+    everything goes to the primary; a session that has written stays
+    there so it reads its own writes.
+    """
 
-# Models for Playlist App
-=======
-"""Models for Playlist app."""
+    def get_bind(self, mapper=None, clause=None, **kw):
+        read_bind = self.info.get('read_bind')
+        if read_bind is not None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                del self.info['read_bind']
+            else:
+                return get_state(self.app).db.get_engine(self.app, bind=read_bind)
+        return super().get_bind(mapper, clause)
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose connection pool is tuned from DB_POOL_* config.
+
+    Size, overflow and timeout only apply to a QueuePool, so they are left
+    out where Flask-SQLAlchemy already picked another pool (SQLite).
+    """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        config = app.config
+
+        if 'poolclass' not in options:
+            for option, key in (('pool_size', 'DB_POOL_SIZE'),
+                                ('max_overflow', 'DB_MAX_OVERFLOW'),
+                                ('pool_timeout', 'DB_POOL_TIMEOUT')):
+                if config.get(key) is not None:
+                    options[option] = config[key]
 
-from flask_sqlalchemy import SQLAlchemy
+        if config.get('DB_POOL_RECYCLE') is not None:
+            options['pool_recycle'] = config['DB_POOL_RECYCLE']
+        options['pool_pre_ping'] = bool(config.get('DB_POOL_PRE_PING'))
+        return sa_url, options
 
-db = SQLAlchemy()
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = PooledSQLAlchemy()
+
+# Spacing between consecutive playlist_song.position values; a track can
+# be moved between two others ~log2(POSITION_GAP) times before the
+# playlist needs rebalancing (see ordering.py)
+POSITION_GAP = 1 << 16
+
+# Loader strategies routes can ask for on a relationship, by name
+LOADER_STRATEGIES = {
+    'select': orm.lazyload,
+    'selectin': orm.selectinload,
+    'joined': orm.joinedload,
+    'subquery': orm.subqueryload,
+    'raise': orm.raiseload,
+}
 
->>>>>>> fdfed954150e02c990de45cb7f20c98a66cad5cc
 
 class Playlist(db.Model):
     """Playlist."""
 
-<<<<<<< HEAD
     __tablename__ = 'playlists'
-    
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(255), nullable=True)
-    
-    songs = db.relationship('Song', secondary='playlist_song', back_populates='playlists')
+
+    songs = db.relationship('Song', secondary='playlist_song', back_populates='playlists',
+                            order_by='PlaylistSong.position, PlaylistSong.song_id',
+                            passive_deletes=True)
 
     def __repr__(self):
         return f'<Playlist {self.name}>'
-=======
-    # ADD THE NECESSARY CODE HERE
->>>>>>> fdfed954150e02c990de45cb7f20c98a66cad5cc
+
+    def serialize(self):
+        """Return a plain dict of this playlist's columns."""
+
+        return {'id': self.id, 'name': self.name, 'description': self.description}
+
+
+def normalize(text):
+    """Fold case, diacritics and runs of whitespace: ' Beyoncé ' -> 'beyonce'."""
+
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+def dedupe_key(title, artist):
+    """Fixed-width hash of a song's normalized (title, artist).
+
+    None if either is missing; the NOT NULL constraints reject such rows.
+    """
+
+    if title is None or artist is None:
+        return None
+    normalized = f'{normalize(title)}\x1f{normalize(artist)}'
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def _default_dedupe_key(context):
+    parameters = context.get_current_parameters()
+    return dedupe_key(parameters.get('title'), parameters.get('artist'))
 
 
 class Song(db.Model):
     """Song."""
 
-<<<<<<< HEAD
     __tablename__ = 'songs'
-    
+    __table_args__ = (
+        # NULL until `flask dedupe-songs` has keyed (or merged) older rows
+        db.Index('uq_songs_dedupe_key', 'dedupe_key', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(100), nullable=False)
-    artist = db.Column(db.String(100), nullable=False)
-    
-    playlists = db.relationship('Playlist', secondary='playlist_song', back_populates='songs')
+    title = db.Column(db.String(100), nullable=False, index=True)
+    artist = db.Column(db.String(100), nullable=False, index=True)
+    dedupe_key = db.Column(db.String(40), nullable=True, default=_default_dedupe_key)
+
+    playlists = db.relationship('Playlist', secondary='playlist_song', back_populates='songs',
+                                passive_deletes=True)
 
     def __repr__(self):
         return f'<Song {self.title} by {self.artist}>'
-=======
-    # ADD THE NECESSARY CODE HERE
->>>>>>> fdfed954150e02c990de45cb7f20c98a66cad5cc
+
+    def serialize(self):
+        """Return a plain dict of this song's columns."""
+
+        return {'id': self.id, 'title': self.title, 'artist': self.artist}
+
+
+@event.listens_for(Song, 'before_update')
+def _update_dedupe_key(mapper, connection, target):
+    target.dedupe_key = dedupe_key(target.title, target.artist)
+
+
+def _append_position(context):
+    """Default position: after the last song already on the playlist.
+
+    Rows of one executemany are all defaulted before any is inserted, so
+    the running position per playlist is kept on the execution context.
+    """
+
+    table = PlaylistSong.__table__
+    playlist_id = context.get_current_parameters()['playlist_id']
+    last_positions = context.__dict__.setdefault('_last_positions', {})
+
+    if playlist_id not in last_positions:
+        last_positions[playlist_id] = context.connection.execute(
+            db.select(db.func.coalesce(db.func.max(table.c.position), 0))
+            .where(table.c.playlist_id == playlist_id)).scalar()
+
+    last_positions[playlist_id] += POSITION_GAP
+    return last_positions[playlist_id]
+
+
+# Full-text search over songs.title / songs.artist (queried in search.py).
+# Neither structure is mapped: PostgreSQL maintains a generated tsvector
+# column with a GIN index; SQLite keeps an FTS5 shadow table in step via
+# triggers. migrations/versions/0003 adds the same to existing databases.
+
+SONG_SEARCH_DDL = {
+    'postgresql': [
+        """ALTER TABLE songs ADD COLUMN search_vector tsvector
+           GENERATED ALWAYS AS (
+               setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+               setweight(to_tsvector('simple', coalesce(artist, '')), 'B')
+           ) STORED""",
+        "CREATE INDEX ix_songs_search_vector ON songs USING GIN (search_vector)",
+    ],
+    'sqlite': [
+        """CREATE VIRTUAL TABLE songs_fts USING fts5(
+               title, artist, content='songs', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2')""",
+        """CREATE TRIGGER songs_fts_insert AFTER INSERT ON songs BEGIN
+               INSERT INTO songs_fts (rowid, title, artist)
+               VALUES (new.id, new.title, new.artist);
+           END""",
+        """CREATE TRIGGER songs_fts_delete AFTER DELETE ON songs BEGIN
+               INSERT INTO songs_fts (songs_fts, rowid, title, artist)
+               VALUES ('delete', old.id, old.title, old.artist);
+           END""",
+        """CREATE TRIGGER songs_fts_update AFTER UPDATE OF title, artist ON songs BEGIN
+               INSERT INTO songs_fts (songs_fts, rowid, title, artist)
+               VALUES ('delete', old.id, old.title, old.artist);
+               INSERT INTO songs_fts (rowid, title, artist)
+               VALUES (new.id, new.title, new.artist);
+           END""",
+    ],
+}
+
+for _dialect, _statements in SONG_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Song.__table__, 'after_create',
+                     db.DDL(_statement).execute_if(dialect=_dialect))
+
+event.listen(Song.__table__, 'before_drop',
+             db.DDL('DROP TABLE IF EXISTS songs_fts').execute_if(dialect='sqlite'))
 
 
 class PlaylistSong(db.Model):
     """Mapping of a playlist to a song."""
 
-<<<<<<< HEAD
     __tablename__ = 'playlist_song'
-    
-    playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id'), primary_key=True)
-    song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), primary_key=True)
-    
-    playlist = db.relationship(Playlist, back_populates='songs')
-    song = db.relationship(Song, back_populates='playlists')
+    __table_args__ = (
+        db.Index('ix_playlist_song_playlist_position', 'playlist_id', 'position'),
+        # The primary key leads on playlist_id; this serves Song.playlists
+        db.Index('ix_playlist_song_song_playlist', 'song_id', 'playlist_id'),
+    )
+
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id', ondelete='CASCADE'),
+                            primary_key=True)
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.id', ondelete='CASCADE'),
+                        primary_key=True)
+    position = db.Column(db.BigInteger, nullable=False, default=_append_position)
+
+    # Writes go through Playlist.songs / Song.playlists; these are read-only views
+    playlist = db.relationship('Playlist', viewonly=True)
+    song = db.relationship('Song', viewonly=True)
 
     def __repr__(self):
         return f'<PlaylistSong playlist_id={self.playlist_id} song_id={self.song_id}>'
 
-# Initialize the database (migrate)
-@app.before_first_request
-def create_tables():
-    db.create_all()
-
-# Routes for the Flask application
-
-@app.route('/')
-def home():
-    """Homepage."""
-    return 'Welcome to the Playlist App!'
-
-@app.route('/playlists')
-def show_all_playlists():
-    """Return a list of playlists."""
-    playlists = Playlist.query.all()
-    return render_template('playlists.html', playlists=playlists)
-
-@app.route('/playlists/<int:playlist_id>')
-def show_playlist(playlist_id):
-    """Show details of a specific playlist."""
-    playlist = Playlist.query.get_or_404(playlist_id)
-    songs = playlist.songs
-    return render_template('playlist_detail.html', playlist=playlist, songs=songs)
-
-@app.route('/playlists/add', methods=['GET', 'POST'])
-def add_playlist():
-    """Handle add-playlist form."""
-    form = PlaylistForm()
-    if form.validate_on_submit():
-        new_playlist = Playlist(name=form.name.data, description=form.description.data)
-        db.session.add(new_playlist)
-        db.session.commit()
-        flash('Playlist added successfully!')
-        return redirect('/playlists')
-    return render_template('add_playlist.html', form=form)
-
-@app.route('/songs')
-def show_all_songs():
-    """Return a list of songs."""
-    songs = Song.query.all()
-    return render_template('songs.html', songs=songs)
-
-@app.route('/songs/<int:song_id>')
-def show_song(song_id):
-    """Show details of a specific song."""
-    song = Song.query.get_or_404(song_id)
-    return render_template('song_detail.html', song=song)
-
-@app.route('/songs/add', methods=['GET', 'POST'])
-def add_song():
-    """Handle add-song form."""
-    form = SongForm()
-    if form.validate_on_submit():
-        new_song = Song(title=form.title.data, artist=form.artist.data)
-        db.session.add(new_song)
-        db.session.commit()
-        flash('Song added successfully!')
-        return redirect('/songs')
-    return render_template('add_song.html', form=form)
-
-@app.route('/playlists/<int:playlist_id>/add-song', methods=['GET', 'POST'])
-def add_song_to_playlist(playlist_id):
-    """Add a song to a playlist."""
-    playlist = Playlist.query.get_or_404(playlist_id)
-    form = NewSongForPlaylistForm()
-
-    # Restrict form to songs not already on this playlist
-    existing_song_ids = [song.id for song in playlist.songs]
-    form.song.choices = [(song.id, song.title) for song in Song.query.all() if song.id not in existing_song_ids]
-
-    if form.validate_on_submit():
-        song = Song.query.get(form.song.data)
-        playlist.songs.append(song)
-        db.session.commit()
-        flash(f"Song '{song.title}' added to playlist '{playlist.name}'!")
-        return redirect(f"/playlists/{playlist_id}")
-
-    return render_template("add_song_to_playlist.html", playlist=playlist, form=form)
-
-if __name__ == "__main__":
-    app.run(debug=True)
-=======
-    # ADD THE NECESSARY CODE HERE
+
+class PlaylistSongLog(db.Model):
+    """Songs put on playlists, in order: the recommendations' change feed.
+
+    Filled by a trigger on playlist_song (below), so every writer is
+    covered. recommend.py overlays the entries newer than its last build
+    on the built index; the build then deletes the ones it folded in.
+    """
+
+    __tablename__ = 'playlist_song_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    playlist_id = db.Column(db.Integer, nullable=False, index=True)
+    song_id = db.Column(db.Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return (f'<PlaylistSongLog id={self.id} playlist_id={self.playlist_id} '
+                f'song_id={self.song_id}>')
+
+
+# migrations/versions/0007 adds the same to existing databases
+PLAYLIST_SONG_LOG_DDL = {
+    'postgresql': [
+        """CREATE FUNCTION log_playlist_songs() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               INSERT INTO playlist_song_log (playlist_id, song_id)
+               SELECT playlist_id, song_id FROM inserted;
+               RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER playlist_song_log_insert AFTER INSERT ON playlist_song
+           REFERENCING NEW TABLE AS inserted
+           FOR EACH STATEMENT EXECUTE PROCEDURE log_playlist_songs()""",
+    ],
+    'sqlite': [
+        """CREATE TRIGGER playlist_song_log_insert AFTER INSERT ON playlist_song BEGIN
+               INSERT INTO playlist_song_log (playlist_id, song_id)
+               VALUES (new.playlist_id, new.song_id);
+           END""",
+    ],
+}
+
+for _dialect, _statements in PLAYLIST_SONG_LOG_DDL.items():
+    for _statement in _statements:
+        event.listen(PlaylistSong.__table__, 'after_create',
+                     db.DDL(_statement).execute_if(dialect=_dialect))
+
+event.listen(PlaylistSong.__table__, 'after_drop',
+             db.DDL('DROP FUNCTION IF EXISTS log_playlist_songs()')
+             .execute_if(dialect='postgresql'))
+
+
+class PlaylistVersion(db.Model):
+    """Change counter for a playlist, behind the API's ETag / Last-Modified.
+
+    Bumped (see versions.py) by every write that changes what the
+    playlist serializes to.
+    """
+
+    __tablename__ = 'playlist_versions'
+
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id', ondelete='CASCADE'),
+                            primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PlaylistVersion playlist_id={self.playlist_id} version={self.version}>'
+
+
+class PlaylistStats(db.Model):
+    """Denormalized track count of a playlist.
+
+    Kept by triggers on playlist_song and songs (PLAYLIST_AGGREGATES_DDL,
+    SONG_AGGREGATES_DDL), which apply each write's changes as deltas.
+    Playlists without songs have no row.
+    """
+
+    __tablename__ = 'playlist_stats'
+
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id', ondelete='CASCADE'),
+                            primary_key=True)
+    song_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<PlaylistStats playlist_id={self.playlist_id} song_count={self.song_count}>'
+
+
+class PlaylistArtistCount(db.Model):
+    """How many of a playlist's songs are by an artist; kept like PlaylistStats."""
+
+    __tablename__ = 'playlist_artist_counts'
+
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id', ondelete='CASCADE'),
+                            primary_key=True)
+    artist = db.Column(db.String(100), primary_key=True)
+    song_count = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return (f'<PlaylistArtistCount playlist_id={self.playlist_id} '
+                f'artist={self.artist!r} song_count={self.song_count}>')
+
+
+class SongStats(db.Model):
+    """How many playlists a song is on, kept by triggers on playlist_song.
+
+    Like the playlist aggregates, counts are adjusted by the changed rows
+    only: a popular song is on far too many playlists to recount. On
+    PostgreSQL they are statement triggers, so a bulk insert does one
+    upsert per distinct song. Songs on no playlist have no row, or a zero
+    one.
+    """
+
+    __tablename__ = 'song_stats'
+
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.id', ondelete='CASCADE'),
+                        primary_key=True)
+    playlist_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SongStats song_id={self.song_id} playlist_count={self.playlist_count}>'
+
+
+# migrations/versions/0008 adds the same to existing databases
+SONG_STATS_DDL = {
+    'postgresql': [
+        """CREATE FUNCTION count_song_playlists() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               IF TG_OP = 'INSERT' THEN
+                   INSERT INTO song_stats (song_id, playlist_count)
+                   SELECT song_id, count(*) FROM new_rows GROUP BY song_id
+                   ON CONFLICT (song_id) DO UPDATE
+                   SET playlist_count = song_stats.playlist_count + excluded.playlist_count;
+               ELSIF TG_OP = 'DELETE' THEN
+                   UPDATE song_stats SET playlist_count = playlist_count - removed.n
+                   FROM (SELECT song_id, count(*) AS n FROM old_rows GROUP BY song_id) removed
+                   WHERE song_stats.song_id = removed.song_id;
+               ELSE
+                   -- Moves change positions only: every song nets out to zero
+                   INSERT INTO song_stats (song_id, playlist_count)
+                   SELECT song_id, sum(n) FROM (
+                       SELECT song_id, 1 AS n FROM new_rows
+                       UNION ALL SELECT song_id, -1 FROM old_rows) changes
+                   GROUP BY song_id HAVING sum(n) <> 0
+                   ON CONFLICT (song_id) DO UPDATE
+                   SET playlist_count = song_stats.playlist_count + excluded.playlist_count;
+               END IF;
+               RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER song_stats_insert AFTER INSERT ON playlist_song
+           REFERENCING NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_song_playlists()""",
+        """CREATE TRIGGER song_stats_delete AFTER DELETE ON playlist_song
+           REFERENCING OLD TABLE AS old_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_song_playlists()""",
+        """CREATE TRIGGER song_stats_update AFTER UPDATE ON playlist_song
+           REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_song_playlists()""",
+    ],
+    'sqlite': [
+        """CREATE TRIGGER song_stats_insert AFTER INSERT ON playlist_song BEGIN
+               INSERT INTO song_stats (song_id, playlist_count) VALUES (new.song_id, 1)
+               ON CONFLICT (song_id) DO UPDATE SET playlist_count = playlist_count + 1;
+           END""",
+        """CREATE TRIGGER song_stats_delete AFTER DELETE ON playlist_song BEGIN
+               UPDATE song_stats SET playlist_count = playlist_count - 1
+               WHERE song_id = old.song_id;
+           END""",
+        """CREATE TRIGGER song_stats_update AFTER UPDATE OF song_id ON playlist_song
+           WHEN old.song_id <> new.song_id BEGIN
+               UPDATE song_stats SET playlist_count = playlist_count - 1
+               WHERE song_id = old.song_id;
+               INSERT INTO song_stats (song_id, playlist_count) VALUES (new.song_id, 1)
+               ON CONFLICT (song_id) DO UPDATE SET playlist_count = playlist_count + 1;
+           END""",
+    ],
+}
+
+for _dialect, _statements in SONG_STATS_DDL.items():
+    for _statement in _statements:
+        event.listen(PlaylistSong.__table__, 'after_create',
+                     db.DDL(_statement).execute_if(dialect=_dialect))
+
+event.listen(PlaylistSong.__table__, 'after_drop',
+             db.DDL('DROP FUNCTION IF EXISTS count_song_playlists()')
+             .execute_if(dialect='postgresql'))
+
+
+# playlist_stats and playlist_artist_counts deltas from `changes`, a query
+# of (playlist_id, song_id, n) rows: n is 1 per playlist_song row added
+# and -1 per row removed. Counts only ever go down by UPDATE, so the
+# cascade from a deleted playlist (whose aggregate rows are gone too)
+# can't put rows back; rows that reach zero are deleted.
+
+def _pg_apply_playlist_changes(changes):
+    by_playlist = (f"SELECT playlist_id, sum(n) AS n FROM ({changes}) c "
+                   f"GROUP BY playlist_id")
+    by_artist = (f"SELECT c.playlist_id, songs.artist, sum(c.n) AS n FROM ({changes}) c "
+                 f"JOIN songs ON songs.id = c.song_id GROUP BY c.playlist_id, songs.artist")
+    return f"""
+                   UPDATE playlist_stats SET song_count = playlist_stats.song_count + d.n
+                   FROM ({by_playlist} HAVING sum(n) < 0) d
+                   WHERE playlist_stats.playlist_id = d.playlist_id;
+                   INSERT INTO playlist_stats (playlist_id, song_count)
+                   {by_playlist} HAVING sum(n) > 0
+                   ON CONFLICT (playlist_id) DO UPDATE
+                   SET song_count = playlist_stats.song_count + excluded.song_count;
+                   UPDATE playlist_artist_counts
+                   SET song_count = playlist_artist_counts.song_count + d.n
+                   FROM ({by_artist} HAVING sum(c.n) < 0) d
+                   WHERE playlist_artist_counts.playlist_id = d.playlist_id
+                     AND playlist_artist_counts.artist = d.artist;
+                   INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+                   {by_artist} HAVING sum(c.n) > 0
+                   ON CONFLICT (playlist_id, artist) DO UPDATE
+                   SET song_count = playlist_artist_counts.song_count + excluded.song_count;
+                   DELETE FROM playlist_stats WHERE song_count <= 0
+                   AND playlist_id IN (SELECT playlist_id FROM ({changes}) c);
+                   DELETE FROM playlist_artist_counts WHERE song_count <= 0
+                   AND playlist_id IN (SELECT playlist_id FROM ({changes}) c);"""
+
+
+_SQLITE_ADD_TRACK = """
+               INSERT INTO playlist_stats (playlist_id, song_count) VALUES (new.playlist_id, 1)
+               ON CONFLICT (playlist_id) DO UPDATE SET song_count = song_count + 1;
+               INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+               SELECT new.playlist_id, artist, 1 FROM songs WHERE id = new.song_id
+               ON CONFLICT (playlist_id, artist) DO UPDATE SET song_count = song_count + 1;"""
+
+_SQLITE_REMOVE_TRACK = """
+               UPDATE playlist_stats SET song_count = song_count - 1
+               WHERE playlist_id = old.playlist_id;
+               UPDATE playlist_artist_counts SET song_count = song_count - 1
+               WHERE playlist_id = old.playlist_id
+                 AND artist = (SELECT artist FROM songs WHERE id = old.song_id);
+               DELETE FROM playlist_stats
+               WHERE playlist_id = old.playlist_id AND song_count <= 0;
+               DELETE FROM playlist_artist_counts
+               WHERE playlist_id = old.playlist_id AND song_count <= 0;"""
+
+# migrations/versions/0009 adds the same to existing databases
+PLAYLIST_AGGREGATES_DDL = {
+    'postgresql': [
+        f"""CREATE FUNCTION count_playlist_songs() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               IF TG_OP = 'INSERT' THEN{_pg_apply_playlist_changes(
+                   'SELECT playlist_id, song_id, 1 AS n FROM new_rows')}
+               ELSIF TG_OP = 'DELETE' THEN{_pg_apply_playlist_changes(
+                   'SELECT playlist_id, song_id, -1 AS n FROM old_rows')}
+               ELSE{_pg_apply_playlist_changes(
+                   'SELECT playlist_id, song_id, 1 AS n FROM new_rows '
+                   'UNION ALL SELECT playlist_id, song_id, -1 FROM old_rows')}
+               END IF;
+               RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER playlist_aggregates_insert AFTER INSERT ON playlist_song
+           REFERENCING NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_playlist_songs()""",
+        """CREATE TRIGGER playlist_aggregates_delete AFTER DELETE ON playlist_song
+           REFERENCING OLD TABLE AS old_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_playlist_songs()""",
+        """CREATE TRIGGER playlist_aggregates_update AFTER UPDATE ON playlist_song
+           REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE count_playlist_songs()""",
+    ],
+    'sqlite': [
+        f"""CREATE TRIGGER playlist_aggregates_insert AFTER INSERT ON playlist_song
+           BEGIN{_SQLITE_ADD_TRACK}
+           END""",
+        f"""CREATE TRIGGER playlist_aggregates_delete AFTER DELETE ON playlist_song
+           BEGIN{_SQLITE_REMOVE_TRACK}
+           END""",
+        f"""CREATE TRIGGER playlist_aggregates_update AFTER UPDATE OF playlist_id, song_id
+           ON playlist_song
+           WHEN old.playlist_id <> new.playlist_id OR old.song_id <> new.song_id
+           BEGIN{_SQLITE_REMOVE_TRACK}{_SQLITE_ADD_TRACK}
+           END""",
+    ],
+}
+
+# A deleted song first leaves its playlists, while its artist can still
+# be looked up (a cascade would run after the song is gone); a renamed
+# artist moves the song's counts over
+SONG_AGGREGATES_DDL = {
+    'postgresql': [
+        """CREATE FUNCTION remove_deleted_song() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               DELETE FROM playlist_song WHERE song_id = OLD.id;
+               RETURN OLD;
+           END $$""",
+        """CREATE TRIGGER playlist_aggregates_song_delete BEFORE DELETE ON songs
+           FOR EACH ROW EXECUTE PROCEDURE remove_deleted_song()""",
+        """CREATE FUNCTION recount_song_artist() RETURNS trigger LANGUAGE plpgsql AS $$
+           BEGIN
+               UPDATE playlist_artist_counts SET song_count = song_count - 1
+               WHERE artist = OLD.artist AND playlist_id IN (
+                   SELECT playlist_id FROM playlist_song WHERE song_id = NEW.id);
+               DELETE FROM playlist_artist_counts
+               WHERE artist = OLD.artist AND song_count <= 0 AND playlist_id IN (
+                   SELECT playlist_id FROM playlist_song WHERE song_id = NEW.id);
+               INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+               SELECT playlist_id, NEW.artist, 1 FROM playlist_song WHERE song_id = NEW.id
+               ON CONFLICT (playlist_id, artist) DO UPDATE
+               SET song_count = playlist_artist_counts.song_count + 1;
+               RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER playlist_aggregates_song_artist AFTER UPDATE OF artist ON songs
+           FOR EACH ROW WHEN (OLD.artist IS DISTINCT FROM NEW.artist)
+           EXECUTE PROCEDURE recount_song_artist()""",
+    ],
+    'sqlite': [
+        """CREATE TRIGGER playlist_aggregates_song_delete BEFORE DELETE ON songs BEGIN
+               DELETE FROM playlist_song WHERE song_id = old.id;
+           END""",
+        """CREATE TRIGGER playlist_aggregates_song_artist AFTER UPDATE OF artist ON songs
+           WHEN old.artist IS NOT new.artist BEGIN
+               UPDATE playlist_artist_counts SET song_count = song_count - 1
+               WHERE artist = old.artist AND playlist_id IN (
+                   SELECT playlist_id FROM playlist_song WHERE song_id = new.id);
+               DELETE FROM playlist_artist_counts
+               WHERE artist = old.artist AND song_count <= 0 AND playlist_id IN (
+                   SELECT playlist_id FROM playlist_song WHERE song_id = new.id);
+               INSERT INTO playlist_artist_counts (playlist_id, artist, song_count)
+               SELECT playlist_id, new.artist, 1 FROM playlist_song WHERE song_id = new.id
+               ON CONFLICT (playlist_id, artist) DO UPDATE SET song_count = song_count + 1;
+           END""",
+    ],
+}
+
+for _table, _ddl, _functions in (
+        (PlaylistSong.__table__, PLAYLIST_AGGREGATES_DDL, 'count_playlist_songs()'),
+        (Song.__table__, SONG_AGGREGATES_DDL,
+         'remove_deleted_song(), recount_song_artist()')):
+    for _dialect, _statements in _ddl.items():
+        for _statement in _statements:
+            event.listen(_table, 'after_create',
+                         db.DDL(_statement).execute_if(dialect=_dialect))
+    event.listen(_table, 'after_drop',
+                 db.DDL(f'DROP FUNCTION IF EXISTS {_functions}')
+                 .execute_if(dialect='postgresql'))
+
+
+@event.listens_for(Playlist, 'after_insert')
+def _start_playlist_version(mapper, connection, target):
+    """Every playlist created through the ORM starts at version 1."""
+
+    connection.execute(PlaylistVersion.__table__.insert(),
+                       {'playlist_id': target.id})
+
+
+def load_strategy(relationship, strategy):
+    """Return a query option that loads relationship using strategy.
+
+    e.g. Playlist.query.options(load_strategy(Playlist.songs, 'selectin'))
+    """
+
+    try:
+        loader = LOADER_STRATEGIES[strategy]
+    except KeyError:
+        raise ValueError(f"Unknown loader strategy {strategy!r}") from None
+    return loader(relationship)
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite ignores FOREIGN KEY / ON DELETE CASCADE unless asked."""
+
+    if type(dbapi_connection).__module__.startswith('sqlite3'):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
 
 # DO NOT MODIFY THIS FUNCTION
@@ -176,4 +617,3 @@ def connect_db(app):
 
     db.app = app
     db.init_app(app)
->>>>>>> fdfed954150e02c990de45cb7f20c98a66cad5cc
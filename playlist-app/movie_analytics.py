@@ -0,0 +1,435 @@
+"""Reports over movies_db (see ../movies.sql and ../queries.md).
+
+    flask movies install          # rollup tables, triggers, role indexes
+    flask movies refresh [--full]
+    flask movies report NAME [--limit N]
+
+The aggregate reports are served from rollup tables instead of
+re-scanning roles and movies each time:
+
+- analytics_movies: a movie's rating, year, runtime and star count
+- analytics_ratings: movies per rating
+- analytics_years: movie count and average runtime per release year
+- analytics_stars: a star's movie count and average runtime
+
+Refresh is incremental. Triggers on movies, roles and stars record the
+ids of changed movies and stars in analytics_dirty_movies /
+analytics_dirty_stars; refresh() recomputes just those rows, plus the
+ratings and years they were or now are in, and clears them. `--full`
+recomputes everything.
+
+The "without" reports are NOT EXISTS anti-joins against roles, which
+install indexes on movie_id and star_id.
+
+The database is MOVIES_DATABASE_URL, default postgresql:///movies_db.
+"""
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import (DDL, Column, Float, ForeignKey, Index, Integer, MetaData, Table,
+                        Text, create_engine, exists, func, null, select, union_all)
+
+# Keep IN-lists under SQLite's bound-parameter limit
+CHUNK_SIZE = 900
+TOP_STARS = 5
+
+# The movies_db schema, as far as the reports read it
+source = MetaData()
+
+movies = Table('movies', source,
+               Column('id', Integer, primary_key=True),
+               Column('title', Text, nullable=False),
+               Column('release_year', Integer, nullable=False),
+               Column('runtime', Integer, nullable=False),
+               Column('rating', Text, nullable=False))
+
+stars = Table('stars', source,
+              Column('id', Integer, primary_key=True),
+              Column('first_name', Text, nullable=False),
+              Column('last_name', Text))
+
+roles = Table('roles', source,
+              Column('id', Integer, primary_key=True),
+              Column('movie_id', Integer, ForeignKey('movies.id', ondelete='CASCADE')),
+              Column('star_id', Integer, ForeignKey('stars.id', ondelete='CASCADE')),
+              # Added by install: the anti-joins probe these
+              Index('ix_roles_movie_id', 'movie_id'),
+              Index('ix_roles_star_id', 'star_id'))
+
+# Rollups and change tracking, owned by this module
+rollups = MetaData()
+
+movie_rollup = Table('analytics_movies', rollups,
+                     Column('movie_id', Integer, primary_key=True),
+                     Column('title', Text, nullable=False),
+                     Column('rating', Text, nullable=False, index=True),
+                     Column('release_year', Integer, nullable=False, index=True),
+                     Column('runtime', Integer, nullable=False),
+                     Column('star_count', Integer, nullable=False, index=True))
+
+rating_rollup = Table('analytics_ratings', rollups,
+                      Column('rating', Text, primary_key=True),
+                      Column('total', Integer, nullable=False))
+
+year_rollup = Table('analytics_years', rollups,
+                    Column('release_year', Integer, primary_key=True),
+                    Column('movie_count', Integer, nullable=False),
+                    Column('average_runtime', Float, nullable=False))
+
+star_rollup = Table('analytics_stars', rollups,
+                    Column('star_id', Integer, primary_key=True),
+                    Column('first_name', Text, nullable=False),
+                    Column('last_name', Text),
+                    Column('movie_count', Integer, nullable=False, index=True),
+                    # NULL for stars without movies
+                    Column('average_runtime', Float, index=True))
+
+dirty_movies = Table('analytics_dirty_movies', rollups,
+                     Column('movie_id', Integer, primary_key=True))
+
+dirty_stars = Table('analytics_dirty_stars', rollups,
+                    Column('star_id', Integer, primary_key=True))
+
+
+# Change-tracking triggers: every write to movies / roles / stars marks
+# the movies and stars whose rollup rows it may change. A movie's
+# runtime feeds its stars' averages, so updating a movie marks them too.
+
+_PG_FUNCTIONS = {
+    'analytics_mark_movie': """
+        IF TG_OP <> 'INSERT' THEN
+            INSERT INTO analytics_dirty_movies VALUES (OLD.id) ON CONFLICT DO NOTHING;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            INSERT INTO analytics_dirty_movies VALUES (NEW.id) ON CONFLICT DO NOTHING;
+        END IF;
+        IF TG_OP = 'UPDATE' THEN
+            INSERT INTO analytics_dirty_stars
+            SELECT star_id FROM roles WHERE movie_id = NEW.id AND star_id IS NOT NULL
+            ON CONFLICT DO NOTHING;
+        END IF;""",
+    'analytics_mark_role': """
+        IF TG_OP <> 'INSERT' THEN
+            INSERT INTO analytics_dirty_movies SELECT OLD.movie_id
+            WHERE OLD.movie_id IS NOT NULL ON CONFLICT DO NOTHING;
+            INSERT INTO analytics_dirty_stars SELECT OLD.star_id
+            WHERE OLD.star_id IS NOT NULL ON CONFLICT DO NOTHING;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            INSERT INTO analytics_dirty_movies SELECT NEW.movie_id
+            WHERE NEW.movie_id IS NOT NULL ON CONFLICT DO NOTHING;
+            INSERT INTO analytics_dirty_stars SELECT NEW.star_id
+            WHERE NEW.star_id IS NOT NULL ON CONFLICT DO NOTHING;
+        END IF;""",
+    'analytics_mark_star': """
+        IF TG_OP <> 'INSERT' THEN
+            INSERT INTO analytics_dirty_stars VALUES (OLD.id) ON CONFLICT DO NOTHING;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            INSERT INTO analytics_dirty_stars VALUES (NEW.id) ON CONFLICT DO NOTHING;
+        END IF;""",
+}
+
+_TRIGGERS = {'movies': 'analytics_mark_movie',
+             'roles': 'analytics_mark_role',
+             'stars': 'analytics_mark_star'}
+
+_SQLITE_MARKS = {
+    ('movies', 'new'): ["INSERT OR IGNORE INTO analytics_dirty_movies VALUES (new.id)"],
+    ('movies', 'old'): ["INSERT OR IGNORE INTO analytics_dirty_movies VALUES (old.id)"],
+    ('roles', 'new'): ["INSERT OR IGNORE INTO analytics_dirty_movies "
+                       "SELECT new.movie_id WHERE new.movie_id IS NOT NULL",
+                       "INSERT OR IGNORE INTO analytics_dirty_stars "
+                       "SELECT new.star_id WHERE new.star_id IS NOT NULL"],
+    ('roles', 'old'): ["INSERT OR IGNORE INTO analytics_dirty_movies "
+                       "SELECT old.movie_id WHERE old.movie_id IS NOT NULL",
+                       "INSERT OR IGNORE INTO analytics_dirty_stars "
+                       "SELECT old.star_id WHERE old.star_id IS NOT NULL"],
+    ('stars', 'new'): ["INSERT OR IGNORE INTO analytics_dirty_stars VALUES (new.id)"],
+    ('stars', 'old'): ["INSERT OR IGNORE INTO analytics_dirty_stars VALUES (old.id)"],
+}
+
+_SQLITE_MOVIE_STARS = ("INSERT OR IGNORE INTO analytics_dirty_stars "
+                       "SELECT star_id FROM roles WHERE movie_id = new.id "
+                       "AND star_id IS NOT NULL")
+
+
+def trigger_ddl(dialect):
+    """(drop statements, create statements) for the change-tracking triggers."""
+
+    drop, create = [], []
+    if dialect == 'postgresql':
+        for function, body in _PG_FUNCTIONS.items():
+            create.append(f"CREATE OR REPLACE FUNCTION {function}() RETURNS trigger "
+                          f"LANGUAGE plpgsql AS $$ BEGIN {body} RETURN NULL; END $$")
+        for table, function in _TRIGGERS.items():
+            drop.append(f"DROP TRIGGER IF EXISTS {function} ON {table}")
+            create.append(f"CREATE TRIGGER {function} AFTER INSERT OR UPDATE OR DELETE "
+                          f"ON {table} FOR EACH ROW EXECUTE PROCEDURE {function}()")
+    elif dialect == 'sqlite':
+        for table in _TRIGGERS:
+            for operation, rows in (('insert', ['new']), ('update', ['old', 'new']),
+                                    ('delete', ['old'])):
+                name = f"analytics_{table}_{operation}"
+                marks = [mark for row in rows for mark in _SQLITE_MARKS[table, row]]
+                if (table, operation) == ('movies', 'update'):
+                    marks.append(_SQLITE_MOVIE_STARS)
+                drop.append(f"DROP TRIGGER IF EXISTS {name}")
+                create.append(f"CREATE TRIGGER {name} AFTER {operation.upper()} ON {table} "
+                              f"BEGIN {'; '.join(marks)}; END")
+    else:
+        raise ValueError(f"No change-tracking triggers for {dialect!r} databases")
+    return drop, create
+
+
+def install(connection):
+    """Create rollups, triggers and role indexes, then fill the rollups."""
+
+    rollups.create_all(connection)
+    for index in roles.indexes:
+        index.create(connection, checkfirst=True)
+
+    drop, create = trigger_ddl(connection.dialect.name)
+    for statement in drop + create:
+        connection.execute(DDL(statement))
+
+    return refresh(connection, full=True)
+
+
+# Rollup rows, for some keys or (keys=None) all of them
+
+def _movie_rows(movie_ids):
+    stmt = (select(movies.c.id, movies.c.title, movies.c.rating, movies.c.release_year,
+                   movies.c.runtime, func.count(roles.c.id))
+            .select_from(movies.outerjoin(roles, roles.c.movie_id == movies.c.id))
+            .group_by(movies.c.id, movies.c.title, movies.c.rating,
+                      movies.c.release_year, movies.c.runtime))
+    return stmt if movie_ids is None else stmt.where(movies.c.id.in_(movie_ids))
+
+
+def _rating_rows(ratings):
+    stmt = (select(movie_rollup.c.rating, func.count())
+            .group_by(movie_rollup.c.rating))
+    return stmt if ratings is None else stmt.where(movie_rollup.c.rating.in_(ratings))
+
+
+def _year_rows(years):
+    stmt = (select(movie_rollup.c.release_year, func.count(),
+                   func.avg(movie_rollup.c.runtime))
+            .group_by(movie_rollup.c.release_year))
+    return stmt if years is None else stmt.where(movie_rollup.c.release_year.in_(years))
+
+
+def _star_rows(star_ids):
+    stmt = (select(stars.c.id, stars.c.first_name, stars.c.last_name,
+                   func.count(movies.c.id), func.avg(movies.c.runtime))
+            .select_from(stars
+                         .outerjoin(roles, roles.c.star_id == stars.c.id)
+                         .outerjoin(movies, movies.c.id == roles.c.movie_id))
+            .group_by(stars.c.id, stars.c.first_name, stars.c.last_name))
+    return stmt if star_ids is None else stmt.where(stars.c.id.in_(star_ids))
+
+
+def _chunks(keys):
+    keys = sorted(keys)
+    for start in range(0, len(keys), CHUNK_SIZE):
+        yield keys[start:start + CHUNK_SIZE]
+
+
+def _rebuild(connection, table, rows, keys=None):
+    """Replace table's rows for keys (all of them when None) with rows(keys)."""
+
+    key = table.primary_key.columns.values()[0]
+    columns = [column.name for column in table.columns]
+
+    if keys is None:
+        connection.execute(table.delete())
+        connection.execute(table.insert().from_select(columns, rows(None)))
+        return
+
+    for chunk in _chunks(keys):
+        connection.execute(table.delete().where(key.in_(chunk)))
+        connection.execute(table.insert().from_select(columns, rows(chunk)))
+
+
+def _groups(connection, movie_ids):
+    """The ratings and release years analytics_movies has for movie_ids."""
+
+    ratings, years = set(), set()
+    for chunk in _chunks(movie_ids):
+        for rating, year in connection.execute(
+                select(movie_rollup.c.rating, movie_rollup.c.release_year)
+                .where(movie_rollup.c.movie_id.in_(chunk))):
+            ratings.add(rating)
+            years.add(year)
+    return ratings, years
+
+
+def refresh(connection, full=False):
+    """Bring the rollups up to date; return {'movies': n, 'stars': n} refreshed.
+
+    Counts are None after a full refresh.
+    """
+
+    if full:
+        for table, rows in ((movie_rollup, _movie_rows), (rating_rollup, _rating_rows),
+                            (year_rollup, _year_rows), (star_rollup, _star_rows)):
+            _rebuild(connection, table, rows)
+        connection.execute(dirty_movies.delete())
+        connection.execute(dirty_stars.delete())
+        return {'movies': None, 'stars': None}
+
+    movie_ids = connection.execute(select(dirty_movies.c.movie_id)).scalars().all()
+    star_ids = connection.execute(select(dirty_stars.c.star_id)).scalars().all()
+
+    if movie_ids:
+        # The groups a changed movie left, and the ones it is in now
+        old_ratings, old_years = _groups(connection, movie_ids)
+        _rebuild(connection, movie_rollup, _movie_rows, movie_ids)
+        new_ratings, new_years = _groups(connection, movie_ids)
+
+        _rebuild(connection, rating_rollup, _rating_rows, old_ratings | new_ratings)
+        _rebuild(connection, year_rollup, _year_rows, old_years | new_years)
+
+    if star_ids:
+        _rebuild(connection, star_rollup, _star_rows, star_ids)
+
+    for chunk in _chunks(movie_ids):
+        connection.execute(dirty_movies.delete().where(dirty_movies.c.movie_id.in_(chunk)))
+    for chunk in _chunks(star_ids):
+        connection.execute(dirty_stars.delete().where(dirty_stars.c.star_id.in_(chunk)))
+
+    return {'movies': len(movie_ids), 'stars': len(star_ids)}
+
+
+# Reports: name -> (description, statement factory)
+
+def _stars_by_average_runtime(min_movies):
+    return (select(star_rollup.c.first_name, star_rollup.c.last_name,
+                   star_rollup.c.average_runtime)
+            .where(star_rollup.c.movie_count >= min_movies)
+            .order_by(star_rollup.c.average_runtime.desc(), star_rollup.c.star_id)
+            .limit(TOP_STARS))
+
+
+def _movies_without_stars():
+    return (select(movies.c.title)
+            .where(~exists().where(roles.c.movie_id == movies.c.id))
+            .order_by(movies.c.id))
+
+
+def _stars_without_movies():
+    return (select(stars.c.first_name, stars.c.last_name)
+            .where(~exists().where(roles.c.star_id == stars.c.id))
+            .order_by(stars.c.id))
+
+
+def _roles_and_orphans():
+    cast = (select(stars.c.first_name, stars.c.last_name, movies.c.title)
+            .select_from(roles
+                         .join(stars, stars.c.id == roles.c.star_id)
+                         .join(movies, movies.c.id == roles.c.movie_id)))
+    uncast = (select(null().label('first_name'), null().label('last_name'), movies.c.title)
+              .where(~exists().where(roles.c.movie_id == movies.c.id)))
+    idle = (select(stars.c.first_name, stars.c.last_name, null().label('title'))
+            .where(~exists().where(roles.c.star_id == stars.c.id)))
+    return union_all(cast, uncast, idle)
+
+
+REPORTS = {
+    'ratings': (
+        "Number of movies per rating.",
+        lambda: (select(rating_rollup.c.rating, rating_rollup.c.total)
+                 .order_by(rating_rollup.c.rating))),
+    'runtime-by-year': (
+        "Average runtime per release year, most recent first.",
+        lambda: (select(year_rollup.c.release_year, year_rollup.c.average_runtime)
+                 .order_by(year_rollup.c.release_year.desc()))),
+    'star-movie-counts': (
+        "Stars with the number of movies they have been in, most first.",
+        lambda: (select(star_rollup.c.first_name, star_rollup.c.last_name,
+                        star_rollup.c.movie_count.label('total_movies'))
+                 .where(star_rollup.c.movie_count > 0)
+                 .order_by(star_rollup.c.movie_count.desc(), star_rollup.c.star_id))),
+    'movie-star-counts': (
+        "Movies with their number of stars, most first.",
+        lambda: (select(movie_rollup.c.title, movie_rollup.c.star_count)
+                 .order_by(movie_rollup.c.star_count.desc(), movie_rollup.c.movie_id))),
+    'longest-average-runtime': (
+        f"The {TOP_STARS} stars whose movies have the longest average runtime.",
+        lambda: _stars_by_average_runtime(1)),
+    'longest-average-runtime-repeat-stars': (
+        "The same, among stars with more than one movie.",
+        lambda: _stars_by_average_runtime(2)),
+    'movies-without-stars': (
+        "Movies that don't feature any star in the database.",
+        _movies_without_stars),
+    'stars-without-movies': (
+        "Stars that don't appear in any movie in the database.",
+        _stars_without_movies),
+    'roles-and-orphans': (
+        "Every role, plus movies without stars and stars without movies.",
+        _roles_and_orphans),
+}
+
+
+def report(connection, name, limit=None):
+    """Return (column names, rows) of report `name`."""
+
+    stmt = REPORTS[name][1]()
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    result = connection.execute(stmt)
+    return list(result.keys()), result.all()
+
+
+def movies_engine():
+    """The movies_db engine of the current app, created on first use."""
+
+    engines = current_app.extensions.setdefault('movie_analytics', {})
+    url = current_app.config['MOVIES_DATABASE_URL']
+    if url not in engines:
+        engines[url] = create_engine(url)
+    return engines[url]
+
+
+movies_cli = AppGroup('movies', help='Reports over movies_db, served from rollup tables.')
+
+
+@movies_cli.command('install')
+def install_command():
+    """Create the rollups and change triggers, and fill the rollups."""
+
+    with movies_engine().begin() as connection:
+        install(connection)
+    click.echo("Installed and filled the movie rollups.")
+
+
+@movies_cli.command('refresh')
+@click.option('--full', is_flag=True, help='Recompute everything, not just what changed.')
+def refresh_command(full):
+    """Apply changes made since the last refresh to the rollups."""
+
+    with movies_engine().begin() as connection:
+        refreshed = refresh(connection, full)
+
+    if full:
+        click.echo("Rebuilt every rollup.")
+    else:
+        click.echo(f"Refreshed {refreshed['movies']} movie(s) and "
+                   f"{refreshed['stars']} star(s).")
+
+
+@movies_cli.command('report')
+@click.argument('name', type=click.Choice(sorted(REPORTS)))
+@click.option('--limit', type=int)
+def report_command(name, limit):
+    """Print a report as tab-separated rows with a header."""
+
+    with movies_engine().connect() as connection:
+        columns, rows = report(connection, name, limit)
+
+    click.echo('\t'.join(columns))
+    for row in rows:
+        click.echo('\t'.join('' if value is None else str(value) for value in row))
@@ -0,0 +1,147 @@
+"""Track order within a playlist.
+
+playlist_song.position holds gapped integer ranks, POSITION_GAP apart
+when freshly appended or rebalanced. Moving a track gives it the midpoint
+of its new neighbours, so a move is a single-row UPDATE. When two
+neighbours end up adjacent (no integer left between them) the playlist
+is rebalanced back to even spacing; `flask compact-positions` does the
+same ahead of time for playlists whose gaps are running low.
+"""
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from models import db, POSITION_GAP, PlaylistSong
+
+# Playlists with any gap below this are rebalanced by compact-positions
+MIN_GAP = 8
+
+_table = PlaylistSong.__table__
+
+
+class SongNotOnPlaylist(LookupError):
+    """The song to move (or to move next to) isn't on the playlist."""
+
+
+def _position(connection, playlist_id, song_id):
+    position = connection.execute(
+        select(_table.c.position)
+        .where(_table.c.playlist_id == playlist_id,
+               _table.c.song_id == song_id)).scalar()
+    if position is None:
+        raise SongNotOnPlaylist(song_id)
+    return position
+
+
+def _neighbour_gap(connection, playlist_id, song_id, after):
+    """Return (lo, hi) positions the moving song should land between."""
+
+    others = ((_table.c.playlist_id == playlist_id)
+              & (_table.c.song_id != song_id))
+
+    if after is None:
+        lo = None
+        hi = connection.execute(select(func.min(_table.c.position))
+                                .where(others)).scalar()
+    else:
+        lo = _position(connection, playlist_id, after)
+        hi = connection.execute(select(func.min(_table.c.position))
+                                .where(others, _table.c.position > lo)).scalar()
+    return lo, hi
+
+
+def _between(lo, hi):
+    """Return an integer strictly between lo and hi, or None if there's none.
+
+    Either side may be None, meaning the start / end of the playlist.
+    """
+
+    if lo is None and hi is None:
+        return POSITION_GAP
+    if lo is None:
+        return hi - POSITION_GAP if hi > POSITION_GAP else (hi // 2 if hi > 1 else None)
+    if hi is None:
+        return lo + POSITION_GAP
+    if hi - lo < 2:
+        return None
+    return (lo + hi) // 2
+
+
+def move_song(playlist_id, song_id, after=None):
+    """Move song to just after song `after` (or to the top if None).
+
+    Normally updates the one row; if there is no room between the new
+    neighbours the playlist is rebalanced first. The caller commits.
+    """
+
+    connection = db.session.connection()
+    _position(connection, playlist_id, song_id)
+    if after == song_id:
+        return
+
+    lo, hi = _neighbour_gap(connection, playlist_id, song_id, after)
+    position = _between(lo, hi)
+
+    if position is None:
+        rebalance(playlist_id)
+        lo, hi = _neighbour_gap(connection, playlist_id, song_id, after)
+        position = _between(lo, hi)
+
+    connection.execute(_table.update()
+                       .where(_table.c.playlist_id == playlist_id,
+                              _table.c.song_id == song_id)
+                       .values(position=position))
+
+
+def rebalance(playlist_id):
+    """Respace a playlist's positions POSITION_GAP apart, keeping order.
+
+    The caller commits.
+    """
+
+    connection = db.session.connection()
+    song_ids = connection.execute(
+        select(_table.c.song_id)
+        .where(_table.c.playlist_id == playlist_id)
+        .order_by(_table.c.position, _table.c.song_id)).scalars().all()
+
+    if song_ids:
+        connection.execute(
+            _table.update()
+            .where(_table.c.playlist_id == playlist_id,
+                   _table.c.song_id == db.bindparam('b_song_id'))
+            .values(position=db.bindparam('b_position')),
+            [{'b_song_id': song_id, 'b_position': i * POSITION_GAP}
+             for i, song_id in enumerate(song_ids, 1)])
+
+
+def crowded_playlists(min_gap=MIN_GAP):
+    """Return ids of playlists with two neighbours less than min_gap apart."""
+
+    gap = (_table.c.position
+           - func.lag(_table.c.position).over(partition_by=_table.c.playlist_id,
+                                              order_by=(_table.c.position,
+                                                        _table.c.song_id)))
+    gaps = select(_table.c.playlist_id, gap.label('gap')).subquery()
+
+    return db.session.execute(
+        select(gaps.c.playlist_id)
+        .where(gaps.c.gap < min_gap)
+        .group_by(gaps.c.playlist_id)
+        .order_by(gaps.c.playlist_id)).scalars().all()
+
+
+@click.command('compact-positions')
+@click.option('--min-gap', default=MIN_GAP, show_default=True,
+              help='Rebalance playlists with any gap smaller than this.')
+@with_appcontext
+def compact_positions_command(min_gap):
+    """Rebalance playlists whose position gaps are running out."""
+
+    playlist_ids = crowded_playlists(min_gap)
+    for playlist_id in playlist_ids:
+        rebalance(playlist_id)
+        db.session.commit()
+
+    click.echo(f"Rebalanced {len(playlist_ids)} playlist(s).")
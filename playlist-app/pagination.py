@@ -0,0 +1,67 @@
+"""Keyset (seek-method) pagination for playlist app listings."""
+
+from flask import Response, current_app, request, stream_with_context
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 1000
+
+
+def get_page_args():
+    """Return (after, limit) from the ?after= and ?limit= query args."""
+
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1:
+        limit = DEFAULT_PAGE_SIZE
+    return after, min(limit, MAX_PAGE_SIZE)
+
+
+def wants_stream():
+    """Did the client ask for the streamed (whole table) listing?"""
+
+    return bool(request.args.get('stream', 0, type=int))
+
+
+def keyset_page(query, key, after=None, limit=DEFAULT_PAGE_SIZE):
+    """Return (rows, next_after) for the page of query following `after`.
+
+    Rows are ordered by `key`, which must be unique. One extra row is
+    fetched so we know whether there is a next page without a COUNT(*).
+    """
+
+    rows = keyset_query(query, key, after, limit).all()
+    return split_page(rows, key, limit)
+
+
+def keyset_query(query, key, after=None, limit=DEFAULT_PAGE_SIZE):
+    """query (a Query or select()) narrowed to the page after `after`, plus one row."""
+
+    if after is not None:
+        query = query.filter(key > after)
+    return query.order_by(key).limit(limit + 1)
+
+
+def split_page(rows, key, limit):
+    """Return (rows, next_after) from the limit + 1 rows keyset_query fetched."""
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = getattr(rows[-1], key.key)
+    return rows, next_after
+
+
+def stream_rows(query, key, batch_size=STREAM_BATCH_SIZE):
+    """Yield every row of query in `key` order from a server-side cursor."""
+
+    return query.order_by(key).yield_per(batch_size)
+
+
+def stream_template(template_name, **context):
+    """Render a template to a streamed response, chunk by chunk."""
+
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return Response(stream_with_context(template.generate(context)))
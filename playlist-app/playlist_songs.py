@@ -0,0 +1,87 @@
+"""Set-at-a-time changes to which songs are on a playlist.
+
+Adding goes through a single INSERT ... SELECT ... ON CONFLICT DO NOTHING
+per chunk of ids: unknown song ids fall out of the SELECT and songs
+already on the playlist hit the composite primary key and are skipped.
+New songs are appended in song id order, POSITION_GAP apart.
+Removal is one DELETE ... WHERE song_id IN (...) per chunk. Neither
+loads Playlist.songs; the playlist's aggregates follow by trigger, and
+it is reported to changed_playlists() listeners when anything changed.
+"""
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from aggregates import changed_on_commit
+from models import db, POSITION_GAP, Song, PlaylistSong
+
+# Keep IN-lists under SQLite's bound-parameter limit
+CHUNK_SIZE = 900
+
+_INSERT_IGNORE = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _chunks(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _insert_chunk(connection, playlist_id, song_ids):
+    table = PlaylistSong.__table__
+    last = (select(func.coalesce(func.max(table.c.position), 0))
+            .where(table.c.playlist_id == playlist_id)
+            .scalar_subquery())
+    position = last + POSITION_GAP * func.row_number().over(order_by=Song.id)
+    rows = (select(literal(playlist_id), Song.id, position)
+            .where(Song.id.in_(song_ids)))
+    columns = ['playlist_id', 'song_id', 'position']
+
+    insert = _INSERT_IGNORE.get(connection.dialect.name)
+    if insert is not None:
+        stmt = (insert(table)
+                .from_select(columns, rows)
+                .on_conflict_do_nothing(index_elements=['playlist_id', 'song_id']))
+    else:
+        on_playlist = (select(PlaylistSong.song_id)
+                       .where(PlaylistSong.playlist_id == playlist_id,
+                              PlaylistSong.song_id == Song.id))
+        stmt = table.insert().from_select(columns,
+                                          rows.where(~on_playlist.exists()))
+
+    return connection.execute(stmt).rowcount
+
+
+def add_songs(playlist_id, song_ids):
+    """Put songs on a playlist; return how many were actually added.
+
+    Runs in the current session transaction; the caller commits.
+    """
+
+    connection = db.session.connection()
+    added = sum(_insert_chunk(connection, playlist_id, chunk)
+                for chunk in _chunks(song_ids))
+    if added:
+        changed_on_commit(db.session, playlist_id)
+    return added
+
+
+def remove_songs(playlist_id, song_ids):
+    """Take songs off a playlist; return how many were removed.
+
+    Runs in the current session transaction; the caller commits.
+    """
+
+    table = PlaylistSong.__table__
+    connection = db.session.connection()
+    removed = 0
+    for chunk in _chunks(song_ids):
+        stmt = table.delete().where(table.c.playlist_id == playlist_id,
+                                    table.c.song_id.in_(chunk))
+        removed += connection.execute(stmt).rowcount
+    if removed:
+        changed_on_commit(db.session, playlist_id)
+    return removed
@@ -0,0 +1,426 @@
+"""'Songs that go with this playlist', from playlist co-occurrence.
+
+Two songs co-occur once for every playlist they are both on. The index
+is the song x song co-occurrence matrix, built with SciPy sparse
+products from playlist_song: a playlist x song incidence matrix A gives
+A.T @ A, computed a block of songs at a time so a build of tens of
+millions of playlist_song rows stays within memory. Each song keeps
+only its NEIGHBOURS strongest co-occurrences (by count / sqrt(the other
+song's playlist count), so hits don't crowd out everything else).
+
+A build is a directory of .npy arrays (CSR layout plus the song ids and
+their playlist counts) under RECOMMENDATIONS_PATH, switched to by
+rewriting the CURRENT file there. Workers memory-map the current build,
+so a query is a few array slices and a bincount over the songs of one
+playlist, not a database scan.
+
+Between builds the index is kept current by playlist_song_log: every
+song put on a playlist is logged (by a trigger, see models.py), and the
+entries newer than the build are added on top at query time with two
+indexed queries. Removals show up at the next build; run
+`flask build-recommendations` nightly.
+
+A long playlist is represented by at most RECOMMENDATIONS_SEEDS of its
+songs, spread evenly over it, so the array work and the IN-lists of
+those queries stay the same size however long it gets. Every song on it
+is still left out of the results.
+
+numpy / scipy are imported on first use, so they don't weigh on the
+app's start-up (see benchmarks/cold_start.py).
+"""
+
+import json
+import os
+import shutil
+import time
+from threading import Lock
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from async_db import async_db
+from models import db, PlaylistSong, PlaylistSongLog, Song
+
+DEFAULT_K = 10
+DEFAULT_SEEDS = 200
+NEIGHBOURS = 200
+BLOCK_SIZE = 4096
+FETCH_SIZE = 100000
+ARRAYS = ('songs', 'degrees', 'indptr', 'indices', 'counts')
+CURRENT = 'CURRENT'
+
+_log = PlaylistSongLog.__table__
+_playlist_song = PlaylistSong.__table__
+
+
+def _read_pairs(connection):
+    """(playlist ids, song ids) of every playlist_song row, as int arrays."""
+
+    import numpy as np
+
+    result = (connection.execution_options(stream_results=True)
+              .execute(select(_playlist_song.c.playlist_id, _playlist_song.c.song_id)))
+    chunks = [np.array(rows, dtype=np.int64).reshape(-1, 2)
+              for rows in result.partitions(FETCH_SIZE)]
+    if not chunks:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    pairs = np.concatenate(chunks)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _top_neighbours(block, first_row, degrees, neighbours):
+    """Prune a CSR block of co-occurrence rows to each row's strongest entries.
+
+    Returns (row lengths, columns, counts), each row sorted strongest first.
+    """
+
+    import numpy as np
+
+    rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+    columns, counts = block.indices, block.data
+
+    keep = columns != rows + first_row
+    rows, columns, counts = rows[keep], columns[keep], counts[keep]
+
+    score = counts / np.sqrt(degrees[columns])
+    order = np.lexsort((-score, rows))
+    rows, columns, counts = rows[order], columns[order], counts[order]
+
+    starts = np.searchsorted(rows, np.arange(block.shape[0]))
+    rank = np.arange(len(rows)) - starts[rows]
+    keep = rank < neighbours
+    return (np.bincount(rows[keep], minlength=block.shape[0]),
+            columns[keep], counts[keep])
+
+
+def build_index(connection, path, neighbours=NEIGHBOURS, block_size=BLOCK_SIZE):
+    """Build the co-occurrence index into a new directory under path.
+
+    Returns (build directory, number of songs, number of entries). The
+    build is not current until publish() is called with it.
+    """
+
+    import numpy as np
+    from scipy import sparse
+
+    log_id = connection.execute(select(func.coalesce(func.max(_log.c.id), 0))).scalar()
+    playlist_ids, song_ids = _read_pairs(connection)
+
+    songs, song_index = np.unique(song_ids, return_inverse=True)
+    _, playlist_index = np.unique(playlist_ids, return_inverse=True)
+    degrees = np.bincount(song_index, minlength=len(songs)).astype(np.int32)
+
+    incidence = sparse.csr_matrix(
+        (np.ones(len(song_index), dtype=np.int32), (playlist_index, song_index)),
+        shape=(playlist_index.max(initial=-1) + 1, len(songs)))
+    by_song = incidence.T.tocsr()
+
+    lengths, indices, counts = [np.zeros(0, np.int64)], [], []
+    for first_row in range(0, len(songs), block_size):
+        block = by_song[first_row:first_row + block_size] @ incidence
+        block_lengths, block_indices, block_counts = _top_neighbours(
+            block.tocsr(), first_row, degrees, neighbours)
+        lengths.append(block_lengths)
+        indices.append(block_indices)
+        counts.append(block_counts)
+
+    arrays = {
+        'songs': songs.astype(np.int64),
+        'degrees': degrees,
+        'indptr': np.cumsum(np.concatenate(lengths)).astype(np.int64),
+        'indices': np.concatenate(indices or [np.zeros(0)]).astype(np.int32),
+        'counts': np.concatenate(counts or [np.zeros(0)]).astype(np.int32),
+    }
+    arrays['indptr'] = np.concatenate([[0], arrays['indptr']])
+
+    build = os.path.join(path, f'build-{time.time_ns()}')
+    os.makedirs(build)
+    for name, array in arrays.items():
+        np.save(os.path.join(build, f'{name}.npy'), array)
+    with open(os.path.join(build, 'meta.json'), 'w') as f:
+        json.dump({'log_id': log_id, 'neighbours': neighbours}, f)
+
+    return build, len(songs), len(arrays['indices'])
+
+
+def publish(path, build):
+    """Make `build` the current index and remove all but it and the previous one."""
+
+    previous = _current_build(path)
+    tmp = os.path.join(path, CURRENT + '.tmp')
+    with open(tmp, 'w') as f:
+        f.write(os.path.basename(build))
+    os.replace(tmp, os.path.join(path, CURRENT))
+
+    # Workers may still be mapping the previous build; older ones are unused
+    keep = {os.path.basename(build), previous}
+    for name in os.listdir(path):
+        if name.startswith('build-') and name not in keep:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def _current_build(path):
+    try:
+        with open(os.path.join(path, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class CooccurrenceIndex:
+    """One build, memory-mapped."""
+
+    def __init__(self, build):
+        import numpy as np
+
+        self.build = build
+        with open(os.path.join(build, 'meta.json')) as f:
+            self.log_id = json.load(f)['log_id']
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(build, f'{name}.npy'), mmap_mode='r'))
+
+    def rows(self, song_ids):
+        """(row numbers, found mask) of song_ids, an int64 array."""
+
+        import numpy as np
+
+        rows = np.searchsorted(self.songs, song_ids)
+        found = rows < len(self.songs)
+        found[found] = self.songs[rows[found]] == song_ids[found]
+        return rows, found
+
+    def cooccurrences(self, song_ids):
+        """(song ids, summed co-occurrence counts) with the given songs."""
+
+        import numpy as np
+
+        rows, found = self.rows(song_ids)
+        rows = rows[found]
+
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        positions = (np.arange(lengths.sum())
+                     + np.repeat(starts - np.cumsum(lengths) + lengths, lengths))
+
+        columns, inverse = np.unique(self.indices[positions], return_inverse=True)
+        totals = np.bincount(inverse, weights=self.counts[positions],
+                             minlength=len(columns))
+        return self.songs[columns], totals
+
+    def degrees_of(self, song_ids):
+        """Playlists each of song_ids was on at build time (0 if unknown)."""
+
+        import numpy as np
+
+        rows, found = self.rows(song_ids)
+        degrees = np.zeros(len(song_ids), dtype=np.int64)
+        degrees[found] = self.degrees[rows[found]]
+        return degrees
+
+
+def _recent_cooccurrences(log_id, song_ids):
+    """Two statements of (song id, co-occurrences with song_ids) added
+    since log entry log_id; see _add_counts()."""
+
+    recent = (select(_log.c.playlist_id, _log.c.song_id)
+              .where(_log.c.id > log_id)
+              .distinct()
+              .subquery())
+    other = _playlist_song.alias('other')
+
+    # A song put on a playlist that has some of song_ids on it
+    joined = (select(recent.c.song_id, func.count())
+              .select_from(recent.join(other, other.c.playlist_id == recent.c.playlist_id))
+              .where(other.c.song_id.in_(song_ids), recent.c.song_id != other.c.song_id)
+              .group_by(recent.c.song_id))
+
+    # The songs already on a playlist one of song_ids was put on (songs
+    # put there since the build are counted by the query above)
+    also_recent = (select(_log.c.id)
+                   .where(_log.c.id > log_id,
+                          _log.c.playlist_id == other.c.playlist_id,
+                          _log.c.song_id == other.c.song_id)
+                   .exists())
+    joining = (select(other.c.song_id, func.count())
+               .select_from(recent.join(other, other.c.playlist_id == recent.c.playlist_id))
+               .where(recent.c.song_id.in_(song_ids), recent.c.song_id != other.c.song_id,
+                      ~also_recent)
+               .group_by(other.c.song_id))
+    return joined, joining
+
+
+def _add_counts(results):
+    """{song id: count} summed over row lists of (song id, count)."""
+
+    counts = {}
+    for rows in results:
+        for song_id, count in rows:
+            counts[song_id] = counts.get(song_id, 0) + count
+    return counts
+
+
+def _songs(song_ids):
+    return select(Song.id, Song.title, Song.artist).where(Song.id.in_(song_ids))
+
+
+def _in_order(rows, song_ids, k):
+    """The first k (id, title, artist) of rows, in song_ids order."""
+
+    found = {row.id: tuple(row) for row in rows}
+    return [found[song_id] for song_id in song_ids if song_id in found][:k]
+
+
+class Recommender:
+    """Per-process access to the current index of RECOMMENDATIONS_PATH."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._index = None
+
+    def init_app(self, app):
+        app.config.setdefault('RECOMMENDATIONS_PATH',
+                              os.path.join(app.instance_path, 'recommendations'))
+        app.config.setdefault('RECOMMENDATIONS_K', DEFAULT_K)
+        app.config.setdefault('RECOMMENDATIONS_SEEDS', DEFAULT_SEEDS)
+        app.extensions['recommender'] = self
+
+    def index(self):
+        """The current build, (re)mapped when it changed; None if there is none."""
+
+        path = current_app.config['RECOMMENDATIONS_PATH']
+        name = _current_build(path)
+        if name is None:
+            return None
+
+        build = os.path.join(path, name)
+        with self._lock:
+            if self._index is None or self._index.build != build:
+                self._index = CooccurrenceIndex(build)
+            return self._index
+
+    def _query(self, song_ids, k):
+        """(index, seed ids, unique song_ids, k), or None if there is
+        nothing to rank."""
+
+        import numpy as np
+
+        index = self.index()
+        if index is None or not song_ids:
+            return None
+        k = k or current_app.config['RECOMMENDATIONS_K']
+        song_ids = np.unique(np.asarray(list(song_ids), dtype=np.int64))
+        seeds = song_ids
+        limit = current_app.config['RECOMMENDATIONS_SEEDS']
+        if len(song_ids) > limit:
+            seeds = song_ids[np.linspace(0, len(song_ids) - 1, limit).astype(np.int64)]
+        return index, seeds, song_ids, k
+
+    def _rank(self, index, seeds, song_ids, recent, k):
+        """Ids of the best candidates, best first, with a few spare."""
+
+        import numpy as np
+
+        ids, totals = index.cooccurrences(seeds)
+        if recent:
+            ids = np.concatenate([ids, np.fromiter(recent, np.int64, len(recent))])
+            totals = np.concatenate([totals, np.fromiter(recent.values(), float, len(recent))])
+            ids, inverse = np.unique(ids, return_inverse=True)
+            totals = np.bincount(inverse, weights=totals, minlength=len(ids))
+
+        candidates = ~np.isin(ids, song_ids)
+        ids, totals = ids[candidates], totals[candidates]
+        if not len(ids):
+            return []
+
+        scores = totals / np.sqrt(np.maximum(index.degrees_of(ids), 1))
+        # A few spare in case some songs were deleted since
+        top = min(len(ids), k * 2)
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.lexsort((ids[best], -scores[best]))]
+        return ids[best].tolist()
+
+    def recommend(self, song_ids, k=None):
+        """Up to k (id, title, artist) songs that go with song_ids, best first.
+
+        Songs in song_ids are never recommended; at most
+        RECOMMENDATIONS_SEEDS of them are looked up. Empty without an index.
+        """
+
+        query = self._query(song_ids, k)
+        if query is None:
+            return []
+        index, seeds, song_ids, k = query
+
+        recent = _add_counts(db.session.execute(stmt) for stmt in
+                             _recent_cooccurrences(index.log_id, seeds.tolist()))
+        top_ids = self._rank(index, seeds, song_ids, recent, k)
+        if not top_ids:
+            return []
+        return _in_order(db.session.execute(_songs(top_ids)), top_ids, k)
+
+    async def recommend_async(self, engine, song_ids, k=None):
+        """recommend(), querying through async_db on an asyncio engine."""
+
+        query = self._query(song_ids, k)
+        if query is None:
+            return []
+        index, seeds, song_ids, k = query
+
+        recent = _add_counts(await async_db.fetch(
+            engine, *_recent_cooccurrences(index.log_id, seeds.tolist())))
+        top_ids = self._rank(index, seeds, song_ids, recent, k)
+        if not top_ids:
+            return []
+        [rows] = await async_db.fetch(engine, _songs(top_ids))
+        return _in_order(rows, top_ids, k)
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+
+
+recommender = Recommender()
+
+
+def recommend_for_playlist(playlist_id, song_ids=None, k=None):
+    """recommender.recommend() for a playlist's songs (looked up if not given)."""
+
+    if recommender.index() is None:
+        return []
+    if song_ids is None:
+        song_ids = db.session.execute(
+            select(_playlist_song.c.song_id)
+            .where(_playlist_song.c.playlist_id == playlist_id)).scalars().all()
+    return recommender.recommend(song_ids, k)
+
+
+@click.command('build-recommendations')
+@click.option('--neighbours', default=NEIGHBOURS, show_default=True,
+              help='Co-occurring songs kept per song.')
+@click.option('--block-size', default=BLOCK_SIZE, show_default=True,
+              help='Songs per sparse product; bounds the memory used.')
+@with_appcontext
+def build_recommendations_command(neighbours, block_size):
+    """Rebuild the co-occurrence index and make it current."""
+
+    path = current_app.config['RECOMMENDATIONS_PATH']
+    os.makedirs(path, exist_ok=True)
+    started = time.perf_counter()
+
+    engine = db.get_engine()
+    isolation = {'isolation_level': 'REPEATABLE READ'} \
+        if engine.dialect.name == 'postgresql' else {}
+    # One snapshot for the log position and the pairs it covers
+    with engine.connect().execution_options(**isolation) as connection:
+        with connection.begin():
+            build, songs, entries = build_index(connection, path, neighbours, block_size)
+            log_id = CooccurrenceIndex(build).log_id
+    publish(path, build)
+
+    with engine.begin() as connection:
+        connection.execute(_log.delete().where(_log.c.id <= log_id))
+
+    click.echo(f"Built recommendations for {songs} songs ({entries} pairs) "
+               f"in {time.perf_counter() - started:.1f}s.")
@@ -0,0 +1,106 @@
+"""Send read-only requests to read replicas.
+
+SQLALCHEMY_REPLICA_URIS lists the replicas; each becomes a bind named
+replica_<n>. A GET / HEAD request is given one of them at random and
+its session reads from it (see models.RoutingSession); every other
+request, and any session that writes, uses the primary.
+
+Replicas lag, so a client that has just written would not see its own
+change on the page it is redirected to. After a request commits, a
+short-lived cookie pins that client's reads to the primary for
+READ_YOUR_WRITES_SECONDS.
+
+That covers the writer only. Anything cached is loaded from the primary
+(see primary()): a write invalidates its cache keys on commit, and a
+replica still behind that commit would put the old page straight back,
+for every client and for the whole CACHE_TTL.
+"""
+
+import random
+from contextlib import contextmanager
+from time import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+BIND_PREFIX = 'replica_'
+STICKY_COOKIE = 'read_primary_until'
+DEFAULT_READ_YOUR_WRITES_SECONDS = 5
+
+READ_METHODS = frozenset(('GET', 'HEAD'))
+
+
+class ReplicaRouter:
+    """Assigns each read-only request's session a replica bind."""
+
+    def __init__(self):
+        self.session = None
+
+    def init_app(self, app, session):
+        """Register the replica binds and the request / commit hooks.
+
+        Call after connect_db(), which sets SQLALCHEMY_BINDS' default.
+        """
+
+        uris = app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('READ_YOUR_WRITES_SECONDS',
+                              DEFAULT_READ_YOUR_WRITES_SECONDS)
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.update((f'{BIND_PREFIX}{i}', uri) for i, uri in enumerate(uris))
+        app.config['SQLALCHEMY_BINDS'] = binds or None
+        app.extensions['replicas'] = [f'{BIND_PREFIX}{i}' for i in range(len(uris))]
+
+        self.session = session
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+        if not event.contains(session, 'after_commit', self._after_commit):
+            event.listen(session, 'after_commit', self._after_commit)
+
+    def read_bind(self):
+        """Pick the replica bind for a read-only request, or None for the primary."""
+
+        binds = current_app.extensions.get('replicas')
+        if not binds or request.method not in READ_METHODS:
+            return None
+
+        pinned_until = request.cookies.get(STICKY_COOKIE, type=float)
+        if pinned_until is not None and pinned_until > time():
+            return None
+
+        return random.choice(binds)
+
+    @contextmanager
+    def primary(self):
+        """Send the session's reads to the primary for the duration."""
+
+        read_bind = self.session.info.pop('read_bind', None)
+        try:
+            yield
+        finally:
+            if read_bind is not None:
+                self.session.info['read_bind'] = read_bind
+
+    # Flask request hooks
+
+    def _before_request(self):
+        bind = self.read_bind()
+        if bind is not None:
+            self.session.info['read_bind'] = bind
+
+    def _after_request(self, response):
+        if g.pop('_committed', False) and current_app.extensions.get('replicas'):
+            seconds = current_app.config['READ_YOUR_WRITES_SECONDS']
+            response.set_cookie(STICKY_COOKIE, str(time() + seconds),
+                                max_age=seconds, httponly=True)
+        return response
+
+    # SQLAlchemy session listener
+
+    def _after_commit(self, session):
+        if has_request_context():
+            g._committed = True
+
+
+replicas = ReplicaRouter()
@@ -0,0 +1,131 @@
+"""Ranked full-text song search.
+
+Every word of the query must match the start of a word in the title or
+artist ("hold li" finds "Hold the Line"). PostgreSQL ranks with
+ts_rank_cd over the weighted songs.search_vector; SQLite with bm25()
+over songs_fts. Other databases fall back to an unranked prefix LIKE.
+
+Results come back best first and are keyset-paginated on (score, id),
+where a lower score is a better match. The cursor is passed around as
+the string '<score>:<id>'. Scores are double precision, so the float
+the cursor holds compares equal to the row it came from; ts_rank_cd's
+real would not, and songs tied on score would be skipped or repeated.
+"""
+
+import re
+
+from sqlalchemy import text
+
+from models import db, Song
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+_WORDS = re.compile(r'\w+', re.UNICODE)
+
+_MATCHES = {
+    'postgresql': """
+        SELECT songs.id, songs.title, songs.artist,
+               CAST(-ts_rank_cd(songs.search_vector, query) AS double precision) AS score
+        FROM songs, to_tsquery('simple', :query) AS query
+        WHERE songs.search_vector @@ query
+    """,
+    'sqlite': """
+        SELECT songs.id, songs.title, songs.artist,
+               bm25(songs_fts, 10.0, 5.0) AS score
+        FROM songs_fts JOIN songs ON songs.id = songs_fts.rowid
+        WHERE songs_fts MATCH :query
+    """,
+}
+
+
+def search_terms(q):
+    """Split a user query into lower-cased words; punctuation is dropped."""
+
+    return _WORDS.findall((q or '').lower())
+
+
+def _match_query(dialect, terms):
+    if dialect == 'postgresql':
+        return ' & '.join(f'{term}:*' for term in terms)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def parse_cursor(after):
+    """Turn a '<score>:<id>' cursor back into (score, id); None if invalid."""
+
+    try:
+        score, song_id = (after or '').rsplit(':', 1)
+        return float(score), int(song_id)
+    except ValueError:
+        return None
+
+
+def _fallback(terms, cursor, limit):
+    """Unranked prefix match for databases without full-text search."""
+
+    query = db.session.query(Song.id, Song.title, Song.artist)
+    for term in terms:
+        pattern = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.filter(db.or_(Song.title.ilike(pattern, escape='\\'),
+                                    Song.artist.ilike(pattern, escape='\\')))
+    if cursor is not None:
+        query = query.filter(Song.id > cursor[1])
+    rows = query.order_by(Song.id).limit(limit + 1).all()
+    return [(row.id, row.title, row.artist, 0.0) for row in rows]
+
+
+def search_songs(q, after=None, limit=DEFAULT_LIMIT):
+    """Return (results, next_after) for a search query.
+
+    results is a list of (id, title, artist, score), best match first;
+    next_after is the cursor for the following page, or None.
+    """
+
+    terms = search_terms(q)
+    if not terms:
+        return [], None
+
+    limit = max(1, min(limit, MAX_LIMIT))
+    cursor = parse_cursor(after)
+    dialect = db.session.connection().dialect.name
+
+    if dialect not in _MATCHES:
+        rows = _fallback(terms, cursor, limit)
+    else:
+        sql = f"SELECT * FROM ({_MATCHES[dialect]}) AS matches"
+        params = {'query': _match_query(dialect, terms), 'limit': limit + 1}
+        if cursor is not None:
+            sql += " WHERE score > :score OR (score = :score AND id > :id)"
+            params['score'], params['id'] = cursor
+        sql += " ORDER BY score, id LIMIT :limit"
+        rows = [tuple(row) for row in db.session.execute(text(sql), params)]
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = f'{rows[-1][3]!r}:{rows[-1][0]}'
+    return rows, next_after
+
+
+def matching_song_ids(q):
+    """A SELECT of the ids of songs matching q, for use in IN (...).
+
+    Returns None when q has no searchable words.
+    """
+
+    terms = search_terms(q)
+    if not terms:
+        return None
+
+    dialect = db.session.connection().dialect.name
+    match = _match_query(dialect, terms)
+
+    if dialect == 'postgresql':
+        return text("SELECT id FROM songs "
+                    "WHERE search_vector @@ to_tsquery('simple', :match)"
+                    ).bindparams(match=match).columns(Song.id)
+    if dialect == 'sqlite':
+        return text("SELECT rowid AS id FROM songs_fts WHERE songs_fts MATCH :match"
+                    ).bindparams(match=match).columns(Song.id)
+    return None
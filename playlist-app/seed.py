@@ -0,0 +1,203 @@
+"""Deterministic synthetic data for profiling: `flask seed`.
+
+    flask seed --songs 1000000 --playlists 10000 --avg-len 50 [--seed 0]
+
+Popularity is skewed the way real catalogs are: artists are assigned to
+songs, and songs to playlists, with Zipf-distributed probabilities
+(rank k drawn with weight 1 / k ** skew), so a few artists have most of
+the songs and a few songs are on most of the playlists. Playlist lengths
+are exponentially distributed around --avg-len.
+
+The same options and --seed always produce the same rows (given the same
+starting ids). Rows are appended after whatever is already there with
+explicit ids and written through the bulk paths: COPY on PostgreSQL, a
+multi-row executemany INSERT elsewhere, all in one transaction. Playlist
+versions are written alongside the playlists; the aggregates follow by
+trigger.
+"""
+
+import csv
+import io
+import random
+from collections import namedtuple
+from datetime import datetime
+from itertools import accumulate
+from time import perf_counter
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select, text
+
+from models import (db, dedupe_key, Playlist, PlaylistSong, PlaylistVersion,
+                    POSITION_GAP, Song)
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_SKEW = 1.1
+SONGS_PER_ARTIST = 10
+# Distinct-song draws per playlist before topping up uniformly
+ZIPF_ROUNDS = 8
+
+WORDS = ('love', 'night', 'heart', 'fire', 'rain', 'summer', 'blue', 'dance',
+         'dream', 'road', 'light', 'river', 'gold', 'wild', 'home', 'city',
+         'moon', 'electric', 'paper', 'ghost', 'sweet', 'lonely', 'stone', 'radio')
+
+SeedResult = namedtuple('SeedResult', 'songs playlists tracks')
+
+
+def batches(rows, size=DEFAULT_BATCH_SIZE):
+    """Group an iterable of rows into lists of at most `size`."""
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_batch(connection, table, columns, batch):
+    """Load a batch with PostgreSQL COPY ... FROM STDIN."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(row[column] for column in columns)
+    buffer.seek(0)
+
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer)
+
+
+def bulk_insert(connection, table, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Insert an iterable of row dicts in batches; returns the row count."""
+
+    count = 0
+    for batch in batches(rows, batch_size):
+        if connection.dialect.name == 'postgresql':
+            _copy_batch(connection, table, list(batch[0]), batch)
+        else:
+            connection.execute(table.insert(), batch)
+        count += len(batch)
+    return count
+
+
+def _reset_sequences(connection, *tables):
+    """Move PostgreSQL id sequences past explicitly inserted ids."""
+
+    if connection.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT max(id) FROM {table.name}))"))
+
+
+class Zipf:
+    """Draws ranks 0..n-1, rank k with weight 1 / (k + 1) ** skew."""
+
+    def __init__(self, n, skew, rng):
+        self.ranks = range(n)
+        self.cum_weights = list(accumulate((k + 1) ** -skew for k in self.ranks))
+        self.rng = rng
+
+    def draw(self, k=1):
+        return self.rng.choices(self.ranks, cum_weights=self.cum_weights, k=k)
+
+
+def _pick_songs(length, popular, song_ids, rng):
+    """`length` distinct song ids, favouring the popular ones."""
+
+    picked = {}
+    for _ in range(ZIPF_ROUNDS):
+        if len(picked) == length:
+            break
+        for rank in popular.draw(length - len(picked)):
+            picked.setdefault(song_ids[rank], None)
+    # The tail is too rare to fill a long playlist by Zipf draws alone
+    while len(picked) < length:
+        picked.setdefault(song_ids[rng.randrange(len(song_ids))], None)
+    return list(picked)[:length]
+
+
+def seed_database(connection, songs, playlists, avg_len, artists=None,
+                  skew=DEFAULT_SKEW, seed=0, batch_size=DEFAULT_BATCH_SIZE):
+    """Append a synthetic catalog to the database; returns a SeedResult."""
+
+    rng = random.Random(seed)
+    artists = artists or max(1, songs // SONGS_PER_ARTIST)
+
+    first_song = (connection.execute(select(func.max(Song.id))).scalar() or 0) + 1
+    first_playlist = (connection.execute(select(func.max(Playlist.id))).scalar() or 0) + 1
+    song_ids = range(first_song, first_song + songs)
+    playlist_ids = range(first_playlist, first_playlist + playlists)
+
+    by_artist = Zipf(artists, skew, rng)
+
+    def song_rows():
+        for song_id, rank in zip(song_ids, by_artist.draw(songs)):
+            title = f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {song_id}"
+            artist = f"Artist {rank + 1}"
+            # Spelled out: COPY doesn't run column defaults
+            yield {'id': song_id, 'title': title, 'artist': artist,
+                   'dedupe_key': dedupe_key(title, artist)}
+
+    bulk_insert(connection, Song.__table__, song_rows(), batch_size)
+
+    now = datetime.utcnow()
+    bulk_insert(connection, Playlist.__table__,
+                ({'id': playlist_id, 'name': f"Playlist {playlist_id}", 'description': None}
+                 for playlist_id in playlist_ids),
+                batch_size)
+    bulk_insert(connection, PlaylistVersion.__table__,
+                ({'playlist_id': playlist_id, 'version': 1, 'updated_at': now}
+                 for playlist_id in playlist_ids),
+                batch_size)
+
+    tracks = 0
+    if songs:
+        # Popularity is independent of id order
+        by_popularity = list(song_ids)
+        rng.shuffle(by_popularity)
+        popular = Zipf(songs, skew, rng)
+
+        def rows():
+            for playlist_id in playlist_ids:
+                length = min(songs, max(1, round(rng.expovariate(1 / avg_len))))
+                for position, song_id in enumerate(
+                        _pick_songs(length, popular, by_popularity, rng), 1):
+                    yield {'playlist_id': playlist_id, 'song_id': song_id,
+                           'position': position * POSITION_GAP}
+
+        tracks = bulk_insert(connection, PlaylistSong.__table__, rows(), batch_size)
+
+    _reset_sequences(connection, Song.__table__, Playlist.__table__)
+    return SeedResult(songs, playlists, tracks)
+
+
+@click.command('seed')
+@click.option('--songs', default=1000, show_default=True)
+@click.option('--playlists', default=100, show_default=True)
+@click.option('--avg-len', default=25, show_default=True,
+              help='Mean number of songs per playlist.')
+@click.option('--artists', type=int,
+              help=f'Defaults to one per {SONGS_PER_ARTIST} songs.')
+@click.option('--skew', default=DEFAULT_SKEW, show_default=True,
+              help='Zipf exponent of artist and song popularity.')
+@click.option('--seed', 'seed', default=0, show_default=True,
+              help='Random seed; the same seed gives the same data.')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+@with_appcontext
+def seed_command(songs, playlists, avg_len, artists, skew, seed, batch_size):
+    """Append reproducible, Zipf-skewed songs and playlists."""
+
+    started = perf_counter()
+    with db.engine.begin() as connection:
+        result = seed_database(connection, songs, playlists, avg_len, artists,
+                               skew, seed, batch_size)
+
+    click.echo(f"Seeded {result.songs} songs, {result.playlists} playlists and "
+               f"{result.tracks} playlist tracks in {perf_counter() - started:.1f}s.")
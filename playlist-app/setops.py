@@ -0,0 +1,203 @@
+"""New playlists made from existing ones: clone, union, intersect, difference.
+
+Each creates the new playlist and fills it with one INSERT ... SELECT
+over playlist_song, so the songs never leave the database however long
+the playlists are:
+
+- clone: the source's songs, at the source's positions
+- union: every song on any of the playlists, in order of the playlist
+  it is first found on (the playlists in the order given), then position
+- intersect: the songs on all of the playlists, in the first one's order
+- difference: the songs on the first playlist and on none of the
+  others, in the first one's order
+
+Positions are renumbered POSITION_GAP apart, as playlist_songs.add_songs
+does. The new playlist's aggregates follow by trigger; it needs no
+version bump, as nobody can have seen it empty. Its songs' cached
+detail pages, which count and list their playlists, are invalidated
+once the transaction commits: one key per song for up to SONG_KEYS_LIMIT
+songs, every song page at once past that, rather than reading back and
+deleting a key for each song of a huge result.
+"""
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, distinct, func, literal, select
+
+from aggregates import changed_on_commit
+from cache import cache, playlist_key, song_key, SONG_PREFIX
+from models import db, Playlist, PlaylistSong, POSITION_GAP
+
+OPERATIONS = ('union', 'intersect', 'difference')
+SONG_KEYS_LIMIT = 1000
+
+_table = PlaylistSong.__table__
+_COLUMNS = ['playlist_id', 'song_id', 'position']
+
+
+class UnknownPlaylists(LookupError):
+    """Some of the source playlists don't exist; args[0] lists their ids."""
+
+
+def _check_exist(playlist_ids):
+    found = set(db.session.execute(
+        select(Playlist.id).where(Playlist.id.in_(playlist_ids))).scalars())
+    missing = [playlist_id for playlist_id in playlist_ids if playlist_id not in found]
+    if missing:
+        raise UnknownPlaylists(missing)
+
+
+def _create(name, description):
+    playlist = Playlist(name=name, description=description)
+    db.session.add(playlist)
+    db.session.flush()
+    return playlist.id
+
+
+def _created(playlist_id, songs):
+    """Queue the commit-time work for a new playlist holding `songs` songs."""
+
+    cache.invalidate_on_commit(db.session, playlist_key(playlist_id))
+    if not songs:
+        return
+    changed_on_commit(db.session, playlist_id)
+    if songs > SONG_KEYS_LIMIT:
+        cache.invalidate_prefix_on_commit(db.session, SONG_PREFIX)
+        return
+    song_ids = db.session.execute(
+        select(_table.c.song_id).where(_table.c.playlist_id == playlist_id)).scalars()
+    cache.invalidate_on_commit(db.session, *(song_key(song_id) for song_id in song_ids))
+
+
+def _fill(playlist_id, rows):
+    """INSERT rows (song_id, order columns...) into playlist_id, renumbered."""
+
+    ranked = rows.subquery()
+    order = [column for column in ranked.c if column.key != 'song_id']
+    stmt = _table.insert().from_select(_COLUMNS, select(
+        literal(playlist_id), ranked.c.song_id,
+        POSITION_GAP * func.row_number().over(order_by=order + [ranked.c.song_id])))
+    return db.session.execute(stmt).rowcount
+
+
+def _union(playlist_ids):
+    source = case({playlist_id: i for i, playlist_id in enumerate(playlist_ids)},
+                  value=_table.c.playlist_id)
+    first = func.row_number().over(partition_by=_table.c.song_id,
+                                   order_by=(source, _table.c.position))
+    occurrences = (select(_table.c.song_id, source.label('source'),
+                          _table.c.position, first.label('first'))
+                   .where(_table.c.playlist_id.in_(playlist_ids))
+                   .subquery())
+    return (select(occurrences.c.song_id, occurrences.c.source, occurrences.c.position)
+            .where(occurrences.c.first == 1))
+
+
+def _intersect(playlist_ids):
+    on_all = (select(_table.c.song_id)
+              .where(_table.c.playlist_id.in_(playlist_ids))
+              .group_by(_table.c.song_id)
+              .having(func.count(distinct(_table.c.playlist_id)) == len(playlist_ids)))
+    return (select(_table.c.song_id, _table.c.position)
+            .where(_table.c.playlist_id == playlist_ids[0],
+                   _table.c.song_id.in_(on_all)))
+
+
+def _difference(playlist_ids):
+    other = _table.alias('other')
+    on_others = (select(other.c.song_id)
+                 .where(other.c.playlist_id.in_(playlist_ids[1:]),
+                        other.c.song_id == _table.c.song_id)
+                 .exists())
+    return (select(_table.c.song_id, _table.c.position)
+            .where(_table.c.playlist_id == playlist_ids[0], ~on_others))
+
+
+_QUERIES = {
+    'union': _union,
+    'intersect': _intersect,
+    'difference': _difference,
+}
+
+
+def clone_playlist(source_id, name, description=None):
+    """Copy a playlist; return (new playlist id, number of songs).
+
+    Raises UnknownPlaylists if there is no such playlist. Runs in the
+    current session transaction; the caller commits.
+    """
+
+    _check_exist([source_id])
+    playlist_id = _create(name, description)
+    copied = db.session.execute(_table.insert().from_select(_COLUMNS, select(
+        literal(playlist_id), _table.c.song_id, _table.c.position)
+        .where(_table.c.playlist_id == source_id))).rowcount
+    _created(playlist_id, copied)
+    return playlist_id, copied
+
+
+def combine_playlists(operation, playlist_ids, name, description=None):
+    """Make a playlist from two or more others; return (its id, number of songs).
+
+    `operation` is one of OPERATIONS. Raises ValueError for an unknown
+    operation or fewer than two distinct playlists, UnknownPlaylists if
+    some don't exist. Runs in the current session transaction; the
+    caller commits.
+    """
+
+    if operation not in _QUERIES:
+        raise ValueError(f"Unknown operation {operation!r}")
+    playlist_ids = list(dict.fromkeys(playlist_ids))
+    if len(playlist_ids) < 2:
+        raise ValueError("Need at least two different playlists")
+
+    _check_exist(playlist_ids)
+    playlist_id = _create(name, description)
+    added = _fill(playlist_id, _QUERIES[operation](playlist_ids))
+    _created(playlist_id, added)
+    return playlist_id, added
+
+
+playlists_cli = AppGroup('playlists', help='Make playlists out of existing ones.')
+
+
+def _report(playlist_id, songs):
+    click.echo(f"Created playlist {playlist_id} with {songs} song(s).")
+
+
+@playlists_cli.command('clone')
+@click.argument('source_id', type=int)
+@click.option('--name', required=True, help='Name of the new playlist.')
+@click.option('--description')
+def clone_command(source_id, name, description):
+    """Copy playlist SOURCE_ID into a new playlist."""
+
+    try:
+        playlist_id, songs = clone_playlist(source_id, name, description)
+    except UnknownPlaylists:
+        raise click.BadParameter(f"No playlist {source_id}", param_hint='SOURCE_ID')
+    db.session.commit()
+    _report(playlist_id, songs)
+
+
+@playlists_cli.command('combine')
+@click.argument('operation', type=click.Choice(OPERATIONS))
+@click.argument('playlist_ids', metavar='PLAYLIST_ID...', type=int, nargs=-1, required=True)
+@click.option('--name', required=True, help='Name of the new playlist.')
+@click.option('--description')
+def combine_command(operation, playlist_ids, name, description):
+    """Combine two or more playlists into a new one.
+
+    difference keeps the first playlist's songs that are on none of the
+    others.
+    """
+
+    try:
+        playlist_id, songs = combine_playlists(operation, playlist_ids, name, description)
+    except UnknownPlaylists as exc:
+        raise click.BadParameter(f"No playlist {', '.join(map(str, exc.args[0]))}",
+                                 param_hint='PLAYLIST_ID')
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+    db.session.commit()
+    _report(playlist_id, songs)
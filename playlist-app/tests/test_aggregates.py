@@ -0,0 +1,199 @@
+import pytest
+from app import app
+from aggregates import drifted_playlists, rebuild_aggregates_command, refresh, top_artists
+from cache import cache
+from instrumentation import count_queries
+from models import Playlist, PlaylistSong, PlaylistStats, Song, db
+from playlist_songs import add_songs, remove_songs
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def catalog(client):
+    playlist = Playlist(name="Mix")
+    songs = [Song(title="Africa", artist="Toto"),
+             Song(title="Rosanna", artist="Toto"),
+             Song(title="Roxanne", artist="The Police")]
+    db.session.add_all([playlist] + songs)
+    db.session.commit()
+    return playlist.id, [song.id for song in songs]
+
+
+def song_count(playlist_id):
+    stats = PlaylistStats.query.get(playlist_id)
+    return stats.song_count if stats else 0
+
+
+class TestIncrementalMaintenance:
+    def test_set_at_a_time_add_and_remove(self, catalog):
+        playlist_id, song_ids = catalog
+
+        add_songs(playlist_id, song_ids)
+        db.session.commit()
+        assert song_count(playlist_id) == 3
+        assert top_artists([playlist_id]) == {playlist_id: [("Toto", 2), ("The Police", 1)]}
+
+        remove_songs(playlist_id, song_ids[:1])
+        db.session.commit()
+        assert song_count(playlist_id) == 2
+        assert top_artists([playlist_id]) == {playlist_id: [("The Police", 1), ("Toto", 1)]}
+
+    def test_orm_writes(self, catalog):
+        playlist_id, song_ids = catalog
+
+        db.session.add(PlaylistSong(playlist_id=playlist_id, song_id=song_ids[0]))
+        db.session.commit()
+        assert song_count(playlist_id) == 1
+
+        playlist = Playlist.query.get(playlist_id)
+        playlist.songs.append(Song.query.get(song_ids[2]))
+        db.session.commit()
+        assert song_count(playlist_id) == 2
+
+    def test_artist_change_and_song_delete(self, catalog):
+        playlist_id, song_ids = catalog
+        add_songs(playlist_id, song_ids)
+        db.session.commit()
+
+        Song.query.get(song_ids[2]).artist = "Toto"
+        db.session.commit()
+        assert top_artists([playlist_id]) == {playlist_id: [("Toto", 3)]}
+
+        db.session.delete(Song.query.get(song_ids[0]))
+        db.session.commit()
+        assert song_count(playlist_id) == 2
+        assert top_artists([playlist_id]) == {playlist_id: [("Toto", 2)]}
+
+    def test_plain_sql_writes(self, catalog):
+        playlist_id, song_ids = catalog
+        table = PlaylistSong.__table__
+
+        db.session.execute(table.insert(),
+                           [{'playlist_id': playlist_id, 'song_id': song_id, 'position': i}
+                            for i, song_id in enumerate(song_ids, 1)])
+        db.session.commit()
+        assert song_count(playlist_id) == 3
+
+        # A merge repoints a row at another song (and artist)
+        db.session.execute(table.delete().where(table.c.song_id == song_ids[1]))
+        db.session.execute(table.update().where(table.c.song_id == song_ids[2])
+                           .values(song_id=song_ids[1]))
+        db.session.commit()
+        assert song_count(playlist_id) == 2
+        assert top_artists([playlist_id]) == {playlist_id: [("Toto", 2)]}
+        assert drifted_playlists(db.session.connection()) == []
+
+    def test_emptied_and_deleted_playlists_leave_no_rows(self, catalog):
+        playlist_id, song_ids = catalog
+        add_songs(playlist_id, song_ids)
+        db.session.commit()
+
+        remove_songs(playlist_id, song_ids)
+        db.session.commit()
+        assert PlaylistStats.query.count() == 0
+        assert top_artists([playlist_id]) == {}
+
+        add_songs(playlist_id, song_ids)
+        db.session.commit()
+        db.session.delete(Playlist.query.get(playlist_id))
+        db.session.commit()
+        assert PlaylistStats.query.count() == 0
+        assert drifted_playlists(db.session.connection()) == []
+
+    def test_one_track_edit_does_not_recount(self, catalog):
+        playlist_id, song_ids = catalog
+        add_songs(playlist_id, song_ids[1:])
+        db.session.commit()
+
+        with count_queries() as statements:
+            add_songs(playlist_id, song_ids[:1])
+            db.session.commit()
+
+        assert song_count(playlist_id) == 3
+        assert not any('GROUP BY' in statement for statement in statements)
+
+    def test_rollback_forgets_pending_refresh(self, catalog):
+        playlist_id, song_ids = catalog
+
+        add_songs(playlist_id, song_ids)
+        db.session.rollback()
+        db.session.commit()
+
+        assert song_count(playlist_id) == 0
+        assert drifted_playlists(db.session.connection()) == []
+
+
+class TestPages:
+    def test_list_shows_counts_and_top_artists_without_loading_songs(self, client, catalog):
+        playlist_id, song_ids = catalog
+        add_songs(playlist_id, song_ids)
+        db.session.add(Playlist(name="Empty"))
+        db.session.commit()
+
+        with count_queries() as statements:
+            page = client.get('/playlists').data
+
+        assert b'3 songs<' in page
+        assert b'0 songs<' in page
+        assert b'Toto (2), The Police (1)' in page
+        assert len(statements) == 2
+        assert not any('FROM songs' in statement for statement in statements)
+
+    def test_top_artists_are_capped(self, catalog):
+        playlist_id, song_ids = catalog
+        add_songs(playlist_id, song_ids)
+        db.session.commit()
+
+        assert top_artists([playlist_id], limit=1) == {playlist_id: [("Toto", 2)]}
+
+
+class TestRebuild:
+    def test_drift_is_found_and_repaired(self, client, catalog):
+        playlist_id, song_ids = catalog
+        add_songs(playlist_id, song_ids)
+        db.session.commit()
+
+        # Behind the triggers' back
+        db.session.execute(PlaylistStats.__table__.update()
+                           .where(PlaylistStats.playlist_id == playlist_id)
+                           .values(song_count=7))
+        db.session.commit()
+        assert drifted_playlists(db.session.connection()) == [playlist_id]
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(rebuild_aggregates_command, ['--check'])
+        assert result.exit_code == 1
+        assert '1 playlist(s) had drifted' in result.output
+
+        result = runner.invoke(rebuild_aggregates_command)
+        assert result.exit_code == 0
+        assert drifted_playlists(db.session.connection()) == []
+        assert song_count(playlist_id) == 3
+
+    def test_refresh_everything(self, catalog):
+        playlist_id, song_ids = catalog
+        db.session.execute(PlaylistSong.__table__.insert(),
+                           [{'playlist_id': playlist_id, 'song_id': song_id, 'position': i}
+                            for i, song_id in enumerate(song_ids, 1)])
+        db.session.commit()
+
+        refresh(db.session.connection())
+        assert drifted_playlists(db.session.connection()) == []
@@ -0,0 +1,118 @@
+import pytest
+from app import app
+from cache import cache
+from instrumentation import count_queries
+from models import Playlist, Song, PlaylistSong, PlaylistVersion, db
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def playlist_id(client):
+    playlist = Playlist(name="Road Trip", description="Long drives")
+    songs = [Song(title="Africa", artist="Toto"),
+             Song(title="Roxanne", artist="The Police")]
+    db.session.add_all([playlist] + songs)
+    db.session.flush()
+    db.session.add_all([PlaylistSong(playlist_id=playlist.id, song_id=song.id)
+                        for song in songs])
+    db.session.commit()
+    return playlist.id
+
+
+class TestPlaylistDetail:
+    def test_body_and_validators(self, client, playlist_id):
+        response = client.get(f'/api/v1/playlists/{playlist_id}')
+
+        assert response.status_code == 200
+        assert response.json['name'] == "Road Trip"
+        assert [s['title'] for s in response.json['songs']] == ["Africa", "Roxanne"]
+        assert response.headers['ETag'] == f'"playlist-{playlist_id}-v1"'
+        assert 'Last-Modified' in response.headers
+
+    def test_matching_etag_is_304_from_the_version_row_alone(self, client, playlist_id):
+        etag = client.get(f'/api/v1/playlists/{playlist_id}').headers['ETag']
+
+        with count_queries() as statements:
+            response = client.get(f'/api/v1/playlists/{playlist_id}',
+                                  headers={'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.data == b''
+        assert len(statements) == 1
+        assert 'playlist_versions' in statements[0]
+
+    def test_if_modified_since(self, client, playlist_id):
+        last_modified = client.get(f'/api/v1/playlists/{playlist_id}').headers['Last-Modified']
+
+        response = client.get(f'/api/v1/playlists/{playlist_id}',
+                              headers={'If-Modified-Since': last_modified})
+        assert response.status_code == 304
+
+    def test_writes_bump_the_version(self, client, playlist_id):
+        etag = client.get(f'/api/v1/playlists/{playlist_id}').headers['ETag']
+        song_ids = [song.id for song in Song.query.order_by(Song.id)]
+
+        client.post(f'/playlists/{playlist_id}/songs/{song_ids[0]}/move',
+                    json={'after': song_ids[1]})
+
+        response = client.get(f'/api/v1/playlists/{playlist_id}',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] == f'"playlist-{playlist_id}-v2"'
+        assert [s['title'] for s in response.json['songs']] == ["Roxanne", "Africa"]
+
+    def test_noop_batch_keeps_the_version(self, client, playlist_id):
+        client.post(f'/playlists/{playlist_id}/songs/batch', json={'add': [], 'remove': [999]})
+
+        assert PlaylistVersion.query.get(playlist_id).version == 1
+
+    def test_missing_playlist(self, client):
+        assert client.get('/api/v1/playlists/999').status_code == 404
+
+    def test_new_playlists_start_at_version_one(self, client):
+        playlist = Playlist(name='Fresh')
+        db.session.add(playlist)
+        db.session.commit()
+        playlist_id = playlist.id
+
+        assert PlaylistVersion.query.get(playlist_id).version == 1
+
+
+class TestLists:
+    def test_playlists_page(self, client, playlist_id):
+        response = client.get('/api/v1/playlists')
+
+        assert response.json == {'playlists': [{'id': playlist_id,
+                                                'name': "Road Trip",
+                                                'description': "Long drives"}],
+                                 'next_after': None}
+
+        again = client.get('/api/v1/playlists',
+                           headers={'If-None-Match': response.headers['ETag']})
+        assert again.status_code == 304
+
+    def test_songs_are_keyset_paged(self, client, playlist_id):
+        first = client.get('/api/v1/songs?limit=1').json
+        assert [s['title'] for s in first['songs']] == ["Africa"]
+
+        second = client.get(f"/api/v1/songs?limit=1&after={first['next_after']}").json
+        assert [s['title'] for s in second['songs']] == ["Roxanne"]
+        assert second['next_after'] is None
@@ -0,0 +1,120 @@
+import pytest
+from app import app as default_app, create_app
+from async_db import async_db, async_url
+from cache import cache
+from models import Playlist, Song, db
+from playlist_songs import add_songs
+from recommend import build_index, publish, recommender
+from sqlalchemy.engine import make_url
+
+
+def build_app(tmp_path, async_views):
+    return create_app({'TESTING': True,
+                       'ASYNC_VIEWS': async_views,
+                       'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+                       'RECOMMENDATIONS_PATH': str(tmp_path / 'recommendations')})
+
+
+@pytest.fixture
+def apps(tmp_path):
+    """A sync and an async app over the same database file."""
+
+    sync_app = build_app(tmp_path, False)
+    async_app = build_app(tmp_path, True)
+
+    with sync_app.app_context():
+        db.create_all()
+        playlist = Playlist(name="Road Trip", description="Long drives")
+        songs = [Song(title="Africa", artist="Toto"),
+                 Song(title="Rosanna", artist="Toto"),
+                 Song(title="Roxanne", artist="The Police")]
+        db.session.add_all([playlist] + songs)
+        db.session.commit()
+        add_songs(playlist.id, [song.id for song in songs[:2]])
+        db.session.commit()
+        ids = {'playlist': playlist.id, 'song': songs[0].id}
+
+    try:
+        yield sync_app, async_app, ids
+    finally:
+        async_db.dispose()
+        cache.clear()
+        recommender.clear()
+        with sync_app.app_context():
+            db.session.remove()
+            db.get_engine(sync_app).dispose()
+        db.app = default_app
+
+
+class TestAsyncUrl:
+    def test_drivers(self):
+        assert async_url(make_url('sqlite:////tmp/x.db')).drivername == 'sqlite+aiosqlite'
+        assert async_url(make_url('postgresql:///playlist-app')).drivername == 'postgresql+asyncpg'
+        assert (async_url(make_url('postgresql+psycopg2://h/db')).drivername
+                == 'postgresql+asyncpg')
+
+    def test_unsupported(self):
+        with pytest.raises(ValueError):
+            async_url(make_url('mysql://h/db'))
+
+
+class TestAsyncViews:
+    def test_views_are_swapped_in(self, apps):
+        sync_app, async_app, ids = apps
+
+        assert async_app.view_functions['main.show_playlist'].__name__ == 'show_playlist_async'
+        assert sync_app.view_functions['main.show_playlist'].__name__ == 'show_playlist'
+
+    @pytest.mark.parametrize('path', ['/playlists', '/playlists?limit=1', '/songs',
+                                      '/songs?limit=2', '/playlists/{playlist}',
+                                      '/songs/{song}', '/playlists?stream=1'])
+    def test_same_pages_as_sync(self, apps, path):
+        sync_app, async_app, ids = apps
+        path = path.format(**ids)
+
+        cache.clear()
+        expected = sync_app.test_client().get(path)
+        cache.clear()
+        actual = async_app.test_client().get(path)
+
+        assert actual.status_code == expected.status_code == 200
+        assert actual.data == expected.data
+
+    def test_missing_rows_404(self, apps):
+        sync_app, async_app, ids = apps
+        client = async_app.test_client()
+
+        assert client.get('/playlists/999').status_code == 404
+        assert client.get('/songs/999').status_code == 404
+
+    def test_shares_the_detail_cache(self, apps):
+        sync_app, async_app, ids = apps
+        cache.clear()
+
+        async_app.test_client().get(f"/playlists/{ids['playlist']}")
+        sync_app.test_client().get(f"/playlists/{ids['playlist']}")
+
+        assert cache.stats()['hits'] == 1
+
+    def test_recommendations(self, apps, tmp_path):
+        sync_app, async_app, ids = apps
+        path = f"/playlists/{ids['playlist']}"
+
+        with sync_app.app_context():
+            other = Playlist(name="Radio")
+            db.session.add(other)
+            db.session.flush()
+            roxanne = Song.query.filter_by(title="Roxanne").one()
+            add_songs(other.id, [ids['song'], roxanne.id])
+            db.session.commit()
+            with db.engine.connect() as connection:
+                directory, _, _ = build_index(connection, str(tmp_path / 'recommendations'))
+            publish(str(tmp_path / 'recommendations'), directory)
+
+        cache.clear()
+        expected = sync_app.test_client().get(path)
+        cache.clear()
+        actual = async_app.test_client().get(path)
+
+        assert b'Roxanne by The Police' in actual.data
+        assert actual.data == expected.data
@@ -0,0 +1,132 @@
+from app import app as default_app, create_app
+from benchmarks.catalog import MIN_TRACKS, playlist_lengths
+from benchmarks.gate import compare
+from benchmarks.membership import run as run_membership
+from benchmarks.setops import run as run_setops
+from benchmarks.statements import run as run_statements
+from benchmarks.suite import run
+from cache import cache
+from membership import membership
+from models import db
+from seed import seed_database
+from statements import statements
+import random
+
+
+def report(**routes):
+    return {'routes': {route: dict({'queries': 1, 'p95_ms': 10.0, 'peak_rss_kb': 1000}, **metrics)
+                       for route, metrics in routes.items()}}
+
+
+class TestGate:
+    def test_within_thresholds(self):
+        baseline = report(a={}, b={})
+        current = report(a={'p95_ms': 13.0}, b={'peak_rss_kb': 1050}, c={'queries': 9})
+
+        assert compare(current, baseline) == []
+
+    def test_any_extra_query_regresses(self):
+        regressions = compare(report(a={'queries': 2}), report(a={}))
+        assert [(r.route, r.metric) for r in regressions] == [('a', 'queries')]
+
+    def test_latency_and_rss(self):
+        regressions = compare(report(a={'p95_ms': 14.0, 'peak_rss_kb': 1200}), report(a={}),
+                              latency_tolerance=0.25, latency_slack_ms=1.0,
+                              rss_tolerance=0.10)
+        assert [r.metric for r in regressions] == ['p95_ms', 'peak_rss_kb']
+
+
+class TestCatalog:
+    def test_lengths_cover_both_extremes(self):
+        lengths = playlist_lengths(50, 10000, random.Random(0))
+
+        assert lengths[:2] == [10000, MIN_TRACKS]
+        assert all(MIN_TRACKS <= n <= 10000 for n in lengths)
+
+
+class TestSuite:
+    def test_every_route_is_measured(self, tmp_path):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'bench.db'}",
+                          'CACHE_BACKEND': 'null',
+                          'TESTING': True})
+        try:
+            result = run(app, 'tiny', iterations=1)
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.get_engine(app).dispose()
+            db.app = default_app
+            cache.init_app(default_app, db.session)
+            membership.init_app(default_app, db.session)
+
+        routes = result['routes']
+        assert 'GET /playlists' in routes
+        assert 'GET /playlists/<int:playlist_id> [largest]' in routes
+        assert 'POST /playlists/<int:playlist_id>/songs/<int:song_id>/move [smallest]' in routes
+        assert routes['GET /playlists/<int:playlist_id> [largest]']['queries'] == 1
+
+
+class TestMembership:
+    def test_reports_memory_per_million_edges(self, tmp_path):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'bench.db'}",
+                          'TESTING': True})
+        try:
+            with app.app_context():
+                db.create_all()
+                with db.get_engine(app).begin() as connection:
+                    seed = seed_database(connection, songs=200, playlists=20, avg_len=10)
+            result = run_membership(app, lookups=10)
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.get_engine(app).dispose()
+            db.app = default_app
+            cache.init_app(default_app, db.session)
+            membership.init_app(default_app, db.session)
+
+        assert result['edges'] == seed.tracks
+        assert result['bytes_per_million_edges'] > 0
+        assert set(result['contains_us']) == {'index', 'query'}
+
+
+class TestSetops:
+    def test_times_every_operation(self, tmp_path):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'bench.db'}",
+                          'TESTING': True})
+        try:
+            result = run_setops(app, tracks=20, playlists=3, by_hand=True)
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.get_engine(app).dispose()
+            db.app = default_app
+            cache.init_app(default_app, db.session)
+            membership.init_app(default_app, db.session)
+
+        songs = {name: count for name, (_, count) in result.items()}
+        assert songs == {'clone': 20, 'union': 40, 'intersect': 0, 'difference': 10,
+                         'clone by hand': 20}
+
+
+class TestStatements:
+    def test_times_every_read_both_ways(self, tmp_path):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'bench.db'}",
+                          'TESTING': True})
+        try:
+            with app.app_context():
+                db.create_all()
+                with db.get_engine(app).begin() as connection:
+                    seed_database(connection, songs=200, playlists=20, avg_len=10)
+            result = run_statements(app, calls=5)
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.get_engine(app).dispose()
+            db.app = default_app
+            cache.init_app(default_app, db.session)
+            membership.init_app(default_app, db.session)
+            statements.init_app(default_app)
+
+        assert set(result) == {'playlist by id', 'songs page', 'song choices'}
+        for timings in result.values():
+            assert set(timings) == {'query', 'statement', 'cpu_saved_per_second'}
@@ -0,0 +1,187 @@
+import pytest
+from app import app
+from cache import Cache, MemoryBackend, RedisBackend, cache, playlist_key, song_key
+from models import Playlist, Song, db
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LocalRedis:
+    """Dict-backed stand-in for the handful of Redis commands we use."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in self.data if key.startswith(match.rstrip('*'))]
+
+
+class TestMemoryBackend:
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        backend = MemoryBackend(clock=clock)
+        backend.set('a', 1, ttl=10)
+
+        clock.now = 9
+        assert backend.get('a') == 1
+        clock.now = 10
+        assert backend.get('a') is None
+        assert len(backend) == 0
+
+    def test_least_recently_used_is_evicted(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', 1, ttl=10)
+        backend.set('b', 2, ttl=10)
+        backend.get('a')
+        backend.set('c', 3, ttl=10)
+
+        assert backend.get('a') == 1
+        assert backend.get('b') is None
+        assert backend.get('c') == 3
+
+
+class TestRedisBackend:
+    def test_round_trips_json(self):
+        backend = RedisBackend(client=LocalRedis())
+        backend.set('playlist:1', {'id': 1, 'songs': []}, ttl=10)
+
+        assert backend.get('playlist:1') == {'id': 1, 'songs': []}
+        backend.delete('playlist:1')
+        assert backend.get('playlist:1') is None
+
+    def test_clear_only_touches_prefix(self):
+        client = LocalRedis()
+        client.set('other', 'x')
+        backend = RedisBackend(client=client)
+        backend.set('song:1', {}, ttl=10)
+        backend.clear()
+
+        assert client.data == {'other': 'x'}
+
+    def test_delete_prefix(self):
+        client = LocalRedis()
+        backend = RedisBackend(client=client)
+        for key in ('song:1', 'song:2', 'playlist:1'):
+            backend.set(key, {}, ttl=10)
+        backend.delete_prefix('song:')
+
+        assert list(client.data) == ['playlist-app:playlist:1']
+
+
+class TestCache:
+    def test_read_through_counts_hits_and_misses(self):
+        c = Cache(MemoryBackend())
+        calls = []
+
+        def load():
+            calls.append(1)
+            return {'id': 1}
+
+        assert c.get_or_set('k', load) == {'id': 1}
+        assert c.get_or_set('k', load) == {'id': 1}
+        assert len(calls) == 1
+        assert c.stats() == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+
+
+class TestDetailPageCaching:
+    def test_playlist_page_is_served_from_cache(self, client):
+        playlist = Playlist(name="Chill")
+        db.session.add(playlist)
+        db.session.commit()
+        playlist_id = playlist.id
+
+        assert b'Chill' in client.get(f'/playlists/{playlist_id}').data
+        assert b'Chill' in client.get(f'/playlists/{playlist_id}').data
+        assert cache.stats()['hits'] == 1
+
+    def test_adding_song_to_playlist_invalidates_both_pages(self, client):
+        playlist = Playlist(name="Chill")
+        song = Song(title="Teardrop", artist="Massive Attack")
+        db.session.add_all([playlist, song])
+        db.session.commit()
+        playlist_id, song_id = playlist.id, song.id
+
+        client.get(f'/playlists/{playlist_id}')
+        client.get(f'/songs/{song_id}')
+        assert cache.backend.get(playlist_key(playlist_id)) is not None
+
+        client.post(f'/playlists/{playlist_id}/add-song', data={'song': song_id})
+        assert cache.backend.get(playlist_key(playlist_id)) is None
+        assert cache.backend.get(song_key(song_id)) is None
+
+        assert b'Teardrop' in client.get(f'/playlists/{playlist_id}').data
+        assert b'Chill' in client.get(f'/songs/{song_id}').data
+
+    def test_rollback_keeps_cached_entries(self, client):
+        cache.backend.set(playlist_key(1), {'id': 1}, ttl=10)
+        db.session.add(Playlist(name="Never saved"))
+        db.session.flush()
+        cache.invalidate_on_commit(db.session, playlist_key(1))
+        db.session.rollback()
+        db.session.commit()
+
+        assert cache.backend.get(playlist_key(1)) == {'id': 1}
+
+    def test_prefix_is_dropped_on_commit_only(self, client):
+        for key in (song_key(1), song_key(2), playlist_key(1)):
+            cache.backend.set(key, {'id': 1}, ttl=10)
+        db.session.add(Playlist(name="Never saved"))
+        db.session.flush()
+        cache.invalidate_prefix_on_commit(db.session, 'song:')
+        db.session.rollback()
+        db.session.commit()
+        assert cache.backend.get(song_key(1)) == {'id': 1}
+
+        db.session.add(Playlist(name="Saved"))
+        cache.invalidate_prefix_on_commit(db.session, 'song:')
+        db.session.commit()
+        assert cache.backend.get(song_key(1)) is cache.backend.get(song_key(2)) is None
+        assert cache.backend.get(playlist_key(1)) == {'id': 1}
+
+    def test_add_routes_create_rows(self, client):
+        response = client.post('/playlists/add', data={'name': 'Gym', 'description': ''})
+        assert response.status_code == 302
+        response = client.post('/songs/add', data={'title': 'Eye of the Tiger', 'artist': 'Survivor'})
+        assert response.status_code == 302
+
+        assert Playlist.query.filter_by(name='Gym').count() == 1
+        assert Song.query.filter_by(title='Eye of the Tiger').count() == 1
+
+    def test_metrics_endpoint(self, client):
+        assert client.get('/metrics/cache').json == {'hits': 0, 'misses': 0, 'hit_ratio': 0.0}
@@ -0,0 +1,110 @@
+import pytest
+from app import app
+from choices import song_choice, song_choices
+from models import Playlist, Song, PlaylistSong, db
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def catalog(client):
+    playlist = Playlist(name="Road Trip")
+    songs = [Song(title="Africa", artist="Toto"),
+             Song(title="Hold the Line", artist="Toto"),
+             Song(title="Roxanne", artist="The Police")]
+    db.session.add_all([playlist, *songs])
+    db.session.commit()
+
+    db.session.add(PlaylistSong(playlist_id=playlist.id, song_id=songs[0].id))
+    db.session.commit()
+
+    return playlist.id, [song.id for song in songs]
+
+
+class TestSongChoices:
+    def test_excludes_songs_already_on_playlist(self, catalog):
+        playlist_id, song_ids = catalog
+
+        choices = song_choices(playlist_id)
+        assert [song_id for song_id, _ in choices] == [song_ids[1], song_ids[2]]
+
+    def test_returns_plain_tuples(self, catalog):
+        playlist_id, song_ids = catalog
+
+        song_id, title = song_choices(playlist_id)[0]
+        assert (song_id, title) == (song_ids[1], "Hold the Line")
+
+    def test_search_matches_title_or_artist_prefix(self, catalog):
+        playlist_id, song_ids = catalog
+
+        assert [c[0] for c in song_choices(playlist_id, "rox")] == [song_ids[2]]
+        assert [c[0] for c in song_choices(playlist_id, "toto")] == [song_ids[1]]
+        assert song_choices(playlist_id, "%") == []
+
+    def test_limit(self, catalog):
+        playlist_id, _ = catalog
+
+        assert len(song_choices(playlist_id, limit=1)) == 1
+
+    def test_single_choice(self, catalog):
+        playlist_id, song_ids = catalog
+
+        assert song_choice(playlist_id, song_ids[0]) == []
+        assert song_choice(playlist_id, song_ids[1]) == [(song_ids[1], "Hold the Line")]
+        assert song_choice(playlist_id, None) == []
+
+
+class TestAddSongToPlaylistRoute:
+    def test_form_lists_only_missing_songs(self, client, catalog):
+        playlist_id, _ = catalog
+
+        response = client.get(f'/playlists/{playlist_id}/add-song')
+        assert response.status_code == 200
+        assert b'Hold the Line' in response.data
+        assert b'Africa' not in response.data
+
+    def test_search_narrows_the_select(self, client, catalog):
+        playlist_id, _ = catalog
+
+        response = client.get(f'/playlists/{playlist_id}/add-song?q=Rox')
+        assert b'Roxanne' in response.data
+        assert b'Hold the Line' not in response.data
+
+    def test_post_adds_song(self, client, catalog):
+        playlist_id, song_ids = catalog
+
+        response = client.post(f'/playlists/{playlist_id}/add-song',
+                               data={'song': song_ids[2]})
+        assert response.status_code == 302
+        assert PlaylistSong.query.get((playlist_id, song_ids[2])) is not None
+
+    def test_post_rejects_song_already_on_playlist(self, client, catalog):
+        playlist_id, song_ids = catalog
+
+        response = client.post(f'/playlists/{playlist_id}/add-song',
+                               data={'song': song_ids[0]})
+        assert response.status_code == 200
+        assert PlaylistSong.query.filter_by(playlist_id=playlist_id).count() == 1
+
+    def test_typeahead_json(self, client, catalog):
+        playlist_id, song_ids = catalog
+
+        response = client.get(f'/playlists/{playlist_id}/add-song/choices?q=h')
+        assert response.json == [{"id": song_ids[1], "title": "Hold the Line"}]
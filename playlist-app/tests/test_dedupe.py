@@ -0,0 +1,132 @@
+import io
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from app import app
+from aggregates import drifted_playlists
+from dedupe import dedupe_songs_command, upsert_song
+from importer import import_songs
+from models import Playlist, PlaylistSong, Song, db, dedupe_key, normalize
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+        app.config['WTF_CSRF_ENABLED'] = True
+
+
+def legacy_songs(*pairs):
+    """Insert songs the way they were before the key existed (NULL key)."""
+
+    db.session.execute(Song.__table__.insert(),
+                       [{'title': title, 'artist': artist, 'dedupe_key': None}
+                        for title, artist in pairs])
+    db.session.commit()
+    return db.session.execute(select(Song.id).order_by(Song.id)).scalars().all()[-len(pairs):]
+
+
+class TestKey:
+    def test_normalize_folds_case_accents_and_spaces(self):
+        assert normalize('  Beyoncé \t Knowles ') == 'beyonce knowles'
+        assert dedupe_key('Halo', 'Beyoncé') == dedupe_key(' HALO ', 'beyonce')
+        assert dedupe_key('Halo', 'Beyoncé') != dedupe_key('Halo 2', 'Beyoncé')
+
+    def test_orm_inserts_and_updates_are_keyed(self, client):
+        song = Song(title="Africa", artist="Toto")
+        db.session.add(song)
+        db.session.commit()
+        assert song.dedupe_key == dedupe_key("africa", "toto")
+
+        song.title = "Rosanna"
+        db.session.commit()
+        assert song.dedupe_key == dedupe_key("Rosanna", "Toto")
+
+    @pytest.mark.parametrize('title, artist', [(None, "Toto"), ("Africa", None)])
+    def test_missing_title_or_artist_hits_not_null(self, client, title, artist):
+        assert dedupe_key(title, artist) is None
+        db.session.add(Song(title=title, artist=artist))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        song = Song(title="Africa", artist="Toto")
+        db.session.add(song)
+        db.session.commit()
+        song.title, song.artist = title, artist
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+class TestUpsert:
+    def test_upsert_returns_the_existing_song(self, client):
+        first, created = upsert_song("Africa", "Toto")
+        assert created
+
+        again, created = upsert_song("AFRICA ", "toto")
+        assert (again, created) == (first, False)
+        assert Song.query.count() == 1
+
+    def test_add_song_form_does_not_duplicate(self, client):
+        client.post('/songs/add', data={'title': 'Africa', 'artist': 'Toto'})
+        response = client.post('/songs/add', data={'title': 'africa', 'artist': 'TOTO'})
+
+        assert response.status_code == 302
+        assert Song.query.count() == 1
+
+    def test_import_skips_duplicates(self, client):
+        stream = io.StringIO("title,artist\nAfrica,Toto\nafrica,toto\nRosanna,Toto\n")
+        result = import_songs(stream, 'csv')
+
+        assert result.inserted == 2
+        assert Song.query.count() == 2
+
+
+class TestDedupeCommand:
+    def test_merges_duplicates_and_rewrites_playlists(self, client):
+        keep, copy, other_copy = legacy_songs(("Africa", "Toto"), ("africa", "TOTO"),
+                                              ("Africa ", "Toto"))
+        both, only_copy = Playlist(name="Both"), Playlist(name="Only copy")
+        db.session.add_all([both, only_copy])
+        db.session.commit()
+        both, only_copy = both.id, only_copy.id
+        db.session.execute(PlaylistSong.__table__.insert(), [
+            {'playlist_id': both, 'song_id': keep, 'position': 1},
+            {'playlist_id': both, 'song_id': copy, 'position': 2},
+            {'playlist_id': only_copy, 'song_id': other_copy, 'position': 1},
+        ])
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(dedupe_songs_command, ['--batch-size', '2'])
+        assert result.exit_code == 0, result.output
+        assert 'Done: 1 songs keyed, 2 duplicates merged.' in result.output
+
+        assert db.session.execute(select(Song.id)).scalars().all() == [keep]
+        assert Song.query.get(keep).dedupe_key == dedupe_key("Africa", "Toto")
+        assert sorted(db.session.query(PlaylistSong.playlist_id, PlaylistSong.song_id)) == \
+            sorted([(both, keep), (only_copy, keep)])
+        assert drifted_playlists(db.session.connection()) == []
+
+    def test_keyed_song_wins_over_older_unkeyed_copy(self, client):
+        old, = legacy_songs(("Africa", "Toto"))
+        new, _ = upsert_song("Africa", "Toto")
+        db.session.commit()
+
+        app.test_cli_runner().invoke(dedupe_songs_command)
+
+        assert db.session.execute(select(Song.id)).scalars().all() == [new]
+        assert old != new
@@ -0,0 +1,109 @@
+import csv
+import gzip
+import io
+import itertools
+import json
+
+import pytest
+from app import app
+from export import encode, export_command
+from models import Playlist, Song, db
+from playlist_songs import add_songs
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def playlist_id(client):
+    playlist = Playlist(name="Mix")
+    songs = [Song(title="Africa", artist="Toto"),
+             Song(title="Roxanne", artist="The Police"),
+             Song(title="Hello, Goodbye", artist="The Beatles")]
+    db.session.add_all([playlist] + songs)
+    db.session.commit()
+    add_songs(playlist.id, [songs[1].id, songs[0].id])
+    db.session.commit()
+    return playlist.id
+
+
+class TestRoutes:
+    def test_csv(self, client, playlist_id):
+        response = client.get(f'/playlists/{playlist_id}/export.csv')
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert 'attachment' in response.headers['Content-Disposition']
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert [row['title'] for row in rows] == ['Africa', 'Roxanne']
+
+    def test_jsonl(self, client, playlist_id):
+        response = client.get(f'/playlists/{playlist_id}/export.jsonl')
+
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert rows[0]['artist'] == 'Toto'
+        assert set(rows[0]) == {'position', 'song_id', 'title', 'artist'}
+
+    def test_m3u(self, client, playlist_id):
+        text = client.get(f'/playlists/{playlist_id}/export.m3u').get_data(as_text=True)
+
+        assert text.startswith('#EXTM3U\n#PLAYLIST:Mix\n')
+        assert '#EXTINF:-1,Toto - Africa\nhttp://localhost/songs/' in text
+
+    def test_catalog(self, client, playlist_id):
+        text = client.get('/songs/export.csv').get_data(as_text=True)
+
+        assert len(text.splitlines()) == 4
+        assert '"Hello, Goodbye"' in text
+
+    def test_gzip_when_accepted(self, client, playlist_id):
+        response = client.get(f'/playlists/{playlist_id}/export.csv',
+                              headers={'Accept-Encoding': 'gzip'})
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert b'Africa' in gzip.decompress(response.get_data())
+
+    def test_unknown_playlist_and_format(self, client):
+        assert client.get('/playlists/999/export.csv').status_code == 404
+        assert client.get('/songs/export.xml').status_code == 404
+
+
+class TestEncode:
+    def test_encodes_lazily_chunk_by_chunk(self):
+        rows = ((i, i, f'Song {i}', 'X') for i in itertools.count())
+        chunks = encode(rows, 'jsonl', chunk_rows=10)
+
+        assert next(chunks).count('\n') == 10
+        assert json.loads(next(chunks).splitlines()[0])['song_id'] == 10
+
+
+class TestCommand:
+    def test_writes_gzipped_playlist(self, client, playlist_id, tmp_path):
+        path = tmp_path / 'mix.m3u.gz'
+        result = app.test_cli_runner().invoke(
+            export_command, ['m3u', '--playlist', str(playlist_id), '--gzip',
+                             '--output', str(path), '--base-url', 'https://music.example/'])
+
+        assert result.exit_code == 0, result.output
+        text = gzip.decompress(path.read_bytes()).decode()
+        assert 'https://music.example/songs/' in text
+
+    def test_unknown_playlist(self, client):
+        result = app.test_cli_runner().invoke(export_command, ['csv', '--playlist', '999'])
+        assert result.exit_code == 2
+        assert 'No playlist 999' in result.output
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.engine import make_url
+from app import app as default_app, create_app
+from models import db
+
+
+@pytest.fixture
+def restore_default_app():
+    """create_app() points db.app at the new app; put the shared one back."""
+
+    yield
+    db.app = default_app
+
+
+class TestCreateApp:
+    def test_config_overrides_environment(self, restore_default_app):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                          'DB_POOL_SIZE': 2,
+                          'TESTING': True})
+
+        assert app.config['DB_POOL_SIZE'] == 2
+        assert app.config['TESTING'] is True
+        assert 'main.show_all_playlists' in app.view_functions
+
+    def test_building_the_app_creates_no_tables(self, tmp_path, restore_default_app):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'fresh.db'}"})
+
+        with app.app_context():
+            assert inspect(db.engine).get_table_names() == []
+
+
+class TestPoolOptions:
+    def options(self, uri, **config):
+        app = create_app(dict(config, SQLALCHEMY_DATABASE_URI=uri))
+        return db.apply_driver_hacks(app, make_url(uri), {})[1]
+
+    def test_queue_pool_settings_for_server_databases(self, restore_default_app):
+        options = self.options('postgresql://localhost/playlist-app',
+                               DB_POOL_SIZE=7, DB_MAX_OVERFLOW=3,
+                               DB_POOL_TIMEOUT=5, DB_POOL_RECYCLE=600,
+                               DB_POOL_PRE_PING=True)
+
+        assert options == {'pool_size': 7, 'max_overflow': 3, 'pool_timeout': 5,
+                           'pool_recycle': 600, 'pool_pre_ping': True}
+
+    def test_sqlite_keeps_its_own_pool(self, restore_default_app):
+        options = self.options('sqlite:///:memory:', DB_POOL_SIZE=7, DB_POOL_PRE_PING=False)
+
+        assert 'pool_size' not in options
+        assert 'max_overflow' not in options
+        assert options['pool_pre_ping'] is False
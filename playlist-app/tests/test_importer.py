@@ -0,0 +1,126 @@
+import io
+import json
+
+import pytest
+from app import app
+from importer import import_songs, iter_rows, validate_row
+from models import Song, db
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+CSV = """title,artist
+Blue Monday,New Order
+,Nobody
+Ceremony,New Order
+""" + f"{'x' * 101},Too Long\n"
+
+JSONL = """{"title": "Karma Police", "artist": "Radiohead"}
+not json
+
+{"title": "Airbag"}
+{"title": "No Surprises", "artist": "Radiohead"}
+"""
+
+
+class TestRowHandling:
+    def test_csv_rows_carry_line_numbers(self):
+        rows = list(iter_rows(io.StringIO(CSV), 'csv'))
+        assert rows[0] == (2, {'title': 'Blue Monday', 'artist': 'New Order'})
+        assert len(rows) == 4
+
+    def test_validation_matches_song_form(self):
+        assert validate_row({'title': 'A', 'artist': 'B'}) == ({'title': 'A', 'artist': 'B'}, None)
+
+        values, errors = validate_row({'title': '', 'artist': 'x' * 101})
+        assert values is None
+        assert set(errors) == {'title', 'artist'}
+
+
+class TestImportSongs:
+    def test_csv_import_inserts_valid_rows_and_reports_bad_ones(self, client):
+        errors = io.StringIO()
+        result = import_songs(io.StringIO(CSV), 'csv', errors=errors)
+
+        assert result == (4, 2, 2)
+        assert [s.title for s in Song.query.order_by(Song.id)] == ['Blue Monday', 'Ceremony']
+
+        rejected = [json.loads(line) for line in errors.getvalue().splitlines()]
+        assert [r['line'] for r in rejected] == [3, 5]
+        assert 'title' in rejected[0]['errors']
+
+    def test_jsonl_import(self, client):
+        errors = io.StringIO()
+        result = import_songs(io.StringIO(JSONL), 'jsonl', errors=errors)
+
+        assert result == (4, 2, 2)
+        assert Song.query.filter_by(artist='Radiohead').count() == 2
+
+    def test_batches_report_progress(self, client):
+        seen = []
+        rows = "title,artist\n" + "".join(f"Song {i},Band\n" for i in range(5))
+
+        import_songs(io.StringIO(rows), 'csv', batch_size=2, progress=seen.append)
+
+        assert [r.inserted for r in seen] == [2, 4, 5]
+        assert Song.query.count() == 5
+
+
+class TestImportCommand:
+    def test_cli_writes_error_file(self, client, tmp_path):
+        source = tmp_path / 'catalog.csv'
+        source.write_text(CSV)
+        error_file = tmp_path / 'errors.jsonl'
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['import-songs', str(source), '--errors', str(error_file)])
+
+        assert result.exit_code == 0, result.output
+        assert '2 songs imported, 2 rows rejected' in result.output
+        assert len(error_file.read_text().splitlines()) == 2
+
+    def test_cli_needs_a_format(self, client, tmp_path):
+        source = tmp_path / 'catalog.txt'
+        source.write_text(CSV)
+
+        result = app.test_cli_runner().invoke(args=['import-songs', str(source)])
+        assert result.exit_code != 0
+
+
+class TestImportEndpoint:
+    def test_upload(self, client):
+        response = client.post('/songs/import', data={
+            'file': (io.BytesIO(JSONL.encode()), 'catalog.jsonl')})
+
+        assert response.status_code == 200
+        assert response.json['inserted'] == 2
+        assert response.json['failed'] == 2
+        assert response.json['errors'][0]['line'] == 2
+
+    def test_csv_upload(self, client):
+        body = ('title,artist\r\n"Mötley\r\nCrüe",Band\r\n' + CSV.split('\n', 1)[1]).encode()
+        response = client.post('/songs/import', content_type='multipart/form-data', data={
+            'file': (io.BytesIO(body), 'catalog.csv')})
+
+        assert response.status_code == 200
+        assert (response.json['inserted'], response.json['failed']) == (3, 2)
+        assert Song.query.filter_by(artist='Band').one().title == 'Mötley\r\nCrüe'
+
+    def test_upload_requires_file(self, client):
+        assert client.post('/songs/import').status_code == 400
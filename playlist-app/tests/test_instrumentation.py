@@ -0,0 +1,96 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+from cache import cache
+from instrumentation import Instrumentation, instrumentation, normalize_sql
+from models import Playlist, Song, db
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+        instrumentation.reset()
+        instrumentation.set_sample_rate(1.0)
+
+        yield client
+
+        instrumentation.set_sample_rate(0.0)
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+class TestNormalizeSql:
+    def test_literals_and_params_collapse(self):
+        assert (normalize_sql("SELECT * FROM songs\n  WHERE id = 42 AND title = 'x'")
+                == "SELECT * FROM songs WHERE id = ? AND title = ?")
+        assert (normalize_sql("SELECT 1 FROM t WHERE a = %(a_1)s AND b = :b")
+                == "SELECT ? FROM t WHERE a = ? AND b = ?")
+
+    def test_in_lists_of_any_length_match(self):
+        assert (normalize_sql("SELECT * FROM songs WHERE id IN (?, ?, ?)")
+                == normalize_sql("SELECT * FROM songs WHERE id IN (?)")
+                == "SELECT * FROM songs WHERE id IN (...)")
+
+
+class TestInstrumentation:
+    def test_records_per_route_queries_and_latency(self, client):
+        playlist = Playlist(name="Focus")
+        db.session.add(playlist)
+        db.session.commit()
+        playlist_id = playlist.id
+        db.session.remove()
+
+        client.get(f'/playlists/{playlist_id}')
+        client.get(f'/playlists/{playlist_id}')
+
+        route = instrumentation.report()['routes']['main.show_playlist']
+        assert route['requests'] == 2
+        assert route['queries'] == 1  # second request is a cache hit
+        assert route['sql_time'] > 0
+        assert sum(route['latency_histogram'].values()) == 2
+
+    def test_slowest_statements_are_normalized(self, client):
+        db.session.add_all([Song(title="A", artist="B"), Song(title="C", artist="D")])
+        db.session.commit()
+
+        client.get('/songs?limit=1')
+        client.get('/songs?limit=1&after=1')
+
+        statements = instrumentation.report()['slowest_statements']
+        assert len(statements) == 2
+        assert all('?' in s['statement'] for s in statements)
+        assert sum(s['count'] for s in statements) == 2
+
+    def test_metrics_endpoint(self, client):
+        client.get('/songs')
+
+        body = client.get('/metrics').json
+        assert body['sample_rate'] == 1.0
+        assert 'main.show_all_songs' in body['routes']
+        assert 'hit_ratio' in body['cache']
+
+
+class TestSamplingOff:
+    def test_no_listeners_and_no_data(self, client):
+        instrumentation.set_sample_rate(0.0)
+
+        assert not event.contains(Engine, 'before_cursor_execute',
+                                  instrumentation._before_cursor_execute)
+        client.get('/songs')
+        assert instrumentation.report()['routes'] == {}
+
+    def test_listeners_toggle(self):
+        instr = Instrumentation(sample_rate=0.5)
+        assert event.contains(Engine, 'after_cursor_execute', instr._after_cursor_execute)
+        instr.set_sample_rate(0)
+        assert not event.contains(Engine, 'after_cursor_execute', instr._after_cursor_execute)
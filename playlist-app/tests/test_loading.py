@@ -0,0 +1,89 @@
+import pytest
+from app import app
+from cache import cache
+from instrumentation import count_queries
+from models import Playlist, Song, PlaylistSong, db, load_strategy
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+def make_playlist(n_songs, first=0):
+    playlist = Playlist(name="Big Playlist", description="Lots of songs")
+    playlist.songs = [Song(title=f"Song {i}", artist=f"Artist {i}")
+                      for i in range(first, first + n_songs)]
+    db.session.add(playlist)
+    db.session.commit()
+    playlist_id = playlist.id
+    db.session.remove()
+    return playlist_id
+
+
+class TestShowPlaylistQueries:
+    @pytest.mark.parametrize('strategy, expected', [('selectin', 2),
+                                                    ('joined', 1)])
+    def test_query_count_is_bounded(self, client, strategy, expected):
+        app.config['PLAYLIST_SONGS_LOADER'] = strategy
+        try:
+            playlist_id = make_playlist(25)
+
+            with count_queries() as statements:
+                response = client.get(f'/playlists/{playlist_id}')
+
+            assert response.status_code == 200
+            assert b'Song 24 by Artist 24' in response.data
+            assert len(statements) == expected
+        finally:
+            app.config['PLAYLIST_SONGS_LOADER'] = 'joined'
+
+    def test_query_count_does_not_grow_with_songs(self, client):
+        small = make_playlist(1)
+        large = make_playlist(50, first=1)
+
+        with count_queries() as small_statements:
+            client.get(f'/playlists/{small}')
+        with count_queries() as large_statements:
+            client.get(f'/playlists/{large}')
+
+        assert len(small_statements) == len(large_statements)
+
+    def test_missing_playlist_is_404(self, client):
+        assert client.get('/playlists/999').status_code == 404
+
+
+class TestShowSongQueries:
+    def test_song_page_is_two_queries(self, client):
+        playlist_id = make_playlist(1)
+        song_id = PlaylistSong.query.filter_by(playlist_id=playlist_id).one().song_id
+        db.session.remove()
+
+        with count_queries() as statements:
+            response = client.get(f'/songs/{song_id}')
+
+        assert response.status_code == 200
+        assert b'Big Playlist' in response.data
+        # The song with its playlist count, then a page of its playlists
+        assert len(statements) == 2
+        assert not any('count(' in statement.lower() for statement in statements)
+
+
+class TestLoadStrategy:
+    def test_unknown_strategy(self, client):
+        with pytest.raises(ValueError):
+            load_strategy(Playlist.songs, 'eager-ish')
@@ -0,0 +1,200 @@
+import threading
+import time
+
+import pytest
+from app import app
+from choices import song_choices
+from instrumentation import count_queries
+from membership import membership
+from models import Playlist, PlaylistSong, Song, db
+from playlist_songs import add_songs, remove_songs
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    membership.active = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+    membership.active = False
+    membership.clear()
+
+
+@pytest.fixture
+def catalog(client):
+    """Playlists 'ab' and 'bc' over songs a, b, c, d."""
+
+    songs = {name: Song(title=name, artist='X') for name in 'abcd'}
+    playlists = {name: Playlist(name=name) for name in ('ab', 'bc')}
+    db.session.add_all([*songs.values(), *playlists.values()])
+    db.session.commit()
+    for name, playlist in playlists.items():
+        add_songs(playlist.id, [songs[song].id for song in name])
+    db.session.commit()
+
+    ids = {name: song.id for name, song in songs.items()}
+    ids.update((name, playlist.id) for name, playlist in playlists.items())
+    return ids
+
+
+class TestIndex:
+    def test_loads_both_ways(self, catalog):
+        assert membership.enabled()
+
+        assert membership.contains(catalog['ab'], catalog['a'])
+        assert not membership.contains(catalog['ab'], catalog['c'])
+        assert not membership.contains(999, catalog['a'])
+        assert list(membership.songs_of(catalog['bc'])) == [catalog['b'], catalog['c']]
+        assert list(membership.playlists_of(catalog['b'])) == [catalog['ab'], catalog['bc']]
+        assert list(membership.playlists_of(catalog['d'])) == []
+
+    def test_lookups_run_no_queries(self, catalog):
+        membership.enabled()
+
+        with count_queries() as statements:
+            membership.contains(catalog['ab'], catalog['a'])
+            membership.playlists_of(catalog['a'])
+        assert statements == []
+
+    def test_off(self, catalog):
+        membership.active = False
+
+        assert not membership.enabled()
+        assert membership.stats() == {'loaded': False}
+
+    def test_reloads_when_too_old(self, catalog):
+        membership.enabled()
+        db.session.execute(PlaylistSong.__table__.delete())
+        db.session.commit()
+        assert membership.contains(catalog['ab'], catalog['a'])
+
+        membership.loaded_at -= membership.max_age + 1
+        membership.enabled()
+        assert not membership.contains(catalog['ab'], catalog['a'])
+
+    def test_concurrent_requests_reload_once(self, catalog, monkeypatch):
+        membership.enabled()
+        membership.loaded_at -= membership.max_age + 1
+        loads = []
+
+        def slow_load(engine=None):
+            loads.append(engine)
+            time.sleep(0.05)
+            membership.loaded_at = time.monotonic()
+
+        monkeypatch.setattr(membership, '_load', slow_load)
+        threads = [threading.Thread(target=membership.enabled) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(loads) == 1
+
+    def test_stats(self, catalog):
+        membership.enabled()
+        stats = membership.stats()
+
+        assert (stats['edges'], stats['playlists'], stats['songs']) == (4, 2, 3)
+        assert stats['bytes_per_million_edges'] == stats['bytes'] * 250000
+
+
+class TestSync:
+    def test_follows_set_at_a_time_writes(self, catalog):
+        membership.enabled()
+        add_songs(catalog['ab'], [catalog['d']])
+        remove_songs(catalog['bc'], [catalog['b']])
+        assert not membership.contains(catalog['ab'], catalog['d'])
+
+        db.session.commit()
+
+        assert list(membership.songs_of(catalog['ab'])) == [catalog['a'], catalog['b'],
+                                                            catalog['d']]
+        assert list(membership.playlists_of(catalog['b'])) == [catalog['ab']]
+        assert list(membership.playlists_of(catalog['d'])) == [catalog['ab']]
+
+    def test_rebuilds_each_song_once(self, catalog, monkeypatch):
+        membership.enabled()
+        playlists = [Playlist(name=f'p{n}') for n in range(3)]
+        db.session.add_all(playlists)
+        db.session.flush()
+        for playlist in playlists:
+            add_songs(playlist.id, [catalog['d'], catalog['b']])
+        remove_songs(catalog['ab'], [catalog['b']])
+
+        relinked = []
+        relink = membership._relink
+        monkeypatch.setattr(membership, '_relink', lambda song_id, *changes: (
+            relinked.append(song_id), relink(song_id, *changes)))
+        db.session.commit()
+
+        assert sorted(relinked) == sorted([catalog['b'], catalog['d']])
+        assert list(membership.playlists_of(catalog['b'])) == [
+            catalog['bc'], *(playlist.id for playlist in playlists)]
+        assert list(membership.playlists_of(catalog['d'])) == [
+            playlist.id for playlist in playlists]
+
+    def test_follows_orm_writes(self, catalog):
+        membership.enabled()
+        db.session.add(PlaylistSong(playlist_id=catalog['bc'], song_id=catalog['a']))
+        db.session.commit()
+        assert membership.contains(catalog['bc'], catalog['a'])
+
+        db.session.delete(Song.query.get(catalog['b']))
+        db.session.commit()
+        assert list(membership.playlists_of(catalog['b'])) == []
+        assert list(membership.songs_of(catalog['ab'])) == [catalog['a']]
+
+    def test_ignores_rolled_back_writes(self, catalog):
+        membership.enabled()
+        add_songs(catalog['ab'], [catalog['c']])
+        db.session.flush()
+        db.session.rollback()
+
+        db.session.add(Playlist(name='empty'))
+        db.session.commit()
+        assert not membership.contains(catalog['ab'], catalog['c'])
+
+
+class TestUsers:
+    def test_song_choices(self, catalog):
+        membership.enabled()
+
+        with count_queries() as statements:
+            choices = song_choices(catalog['ab'], limit=1)
+        assert choices == [(catalog['c'], 'c')]
+        # One page, with room for a and b, which are skipped
+        assert len(statements) == 1
+        assert 'playlist_song' not in statements[0]
+
+    def test_song_choices_pages_past_the_playlist(self, catalog, monkeypatch):
+        monkeypatch.setattr('choices.SKIP_PAGES', 0)
+        membership.enabled()
+
+        with count_queries() as statements:
+            choices = song_choices(catalog['ab'], limit=1)
+        assert choices == [(catalog['c'], 'c')]
+        assert len(statements) == 3
+
+    def test_song_page(self, catalog, client):
+        membership.enabled()
+
+        html = client.get(f"/songs/{catalog['b']}").get_data(as_text=True)
+
+        assert 'ab' in html and 'bc' in html
+
+    def test_metrics(self, catalog, client):
+        membership.enabled()
+
+        assert client.get('/metrics/membership').get_json()['edges'] == 4
@@ -0,0 +1,120 @@
+import pytest
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import inspect, text
+from app import app
+from db_audit import missing_indexes
+from models import Playlist, Song, PlaylistSong, db
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def migrated(tmp_path):
+    """An empty database file brought to head by the migrations alone."""
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'migrated.db'}"
+    try:
+        with app.app_context():
+            upgrade()
+            yield db.engine
+            db.session.remove()
+    finally:
+        app.config['SQLALCHEMY_DATABASE_URI'] = uri
+
+
+class TestMigrations:
+    def test_upgrade_matches_models(self, migrated):
+        assert missing_indexes(migrated, db.metadata) == []
+
+        indexes = {ix['name'] for ix in inspect(migrated).get_indexes('playlist_song')}
+        assert 'ix_playlist_song_song_playlist' in indexes
+
+    def test_downgrade_to_initial_drops_lookup_indexes(self, migrated):
+        downgrade(revision='0001')
+
+        missing = missing_indexes(migrated, db.metadata)
+        assert ('songs', ('title',)) in [(m.table, m.columns) for m in missing]
+        assert ('playlist_song', ('song_id',)) in [(m.table, m.columns) for m in missing]
+
+    def test_positions_are_backfilled(self, migrated):
+        downgrade(revision='0001')
+        assert 'position' not in {c['name'] for c in inspect(migrated).get_columns('playlist_song')}
+
+        with migrated.begin() as conn:
+            conn.execute(text("INSERT INTO playlists (name) VALUES ('a'), ('b')"))
+            conn.execute(text("INSERT INTO songs (title, artist) VALUES ('x', 'y'), ('z', 'w')"))
+            conn.execute(text("INSERT INTO playlist_song VALUES (1, 2), (1, 1), (2, 2)"))
+
+        upgrade()
+        with migrated.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT playlist_id, song_id, position FROM playlist_song"
+                " ORDER BY playlist_id, position")).all()
+        assert rows == [(1, 1, 1 << 16), (1, 2, 2 << 16), (2, 2, 1 << 16)]
+
+    def test_search_index_is_built_and_dropped(self, migrated):
+        with migrated.begin() as conn:
+            conn.execute(text("INSERT INTO songs (title, artist) VALUES ('Roxanne', 'The Police')"))
+            assert conn.execute(text(
+                "SELECT rowid FROM songs_fts WHERE songs_fts MATCH 'rox*'")).scalar() == 1
+
+        downgrade(revision='0002')
+        assert 'songs_fts' not in inspect(migrated).get_table_names()
+
+        with migrated.begin() as conn:
+            conn.execute(text("INSERT INTO songs (title, artist) VALUES ('Message', 'The Police')"))
+
+        upgrade()
+        with migrated.connect() as conn:
+            ids = conn.execute(text(
+                "SELECT rowid FROM songs_fts WHERE songs_fts MATCH 'police' ORDER BY rowid")).scalars().all()
+        assert ids == [1, 2]
+
+
+class TestCascades:
+    def test_deleting_a_song_removes_its_playlist_rows(self, client):
+        playlist = Playlist(name="Doomed")
+        song = Song(title="Gone", artist="Soon")
+        playlist.songs.append(song)
+        db.session.add(playlist)
+        db.session.commit()
+
+        db.session.execute(text("DELETE FROM songs WHERE id = :id"), {'id': song.id})
+        db.session.commit()
+
+        assert PlaylistSong.query.count() == 0
+
+
+class TestDbAudit:
+    def test_reports_missing_index(self, client):
+        db.session.execute(text("DROP INDEX ix_songs_artist"))
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['db-audit'])
+
+        assert result.exit_code == 1
+        assert 'songs(artist): declared on the model as ix_songs_artist' in result.output
+        assert 'need PostgreSQL; skipped' in result.output
+
+    def test_clean_schema(self, client):
+        result = app.test_cli_runner().invoke(args=['db-audit'])
+
+        assert result.exit_code == 0, result.output
+        assert 'No missing indexes.' in result.output
@@ -130,7 +130,7 @@ class TestModels:
         def test_song_model_has_only_expected_columns(self, client):
             columns = set(column.name for column in Song.__table__.columns)
 
-            expected_columns = {'id', 'title', 'artist'}
+            expected_columns = {'id', 'title', 'artist', 'dedupe_key'}
             assert columns == expected_columns, f"Unexpected columns found: {', '.join(columns - expected_columns)}"
 
     class TestPlaylistSong:
@@ -0,0 +1,124 @@
+import pytest
+from sqlalchemy import create_engine, func, select
+from app import app
+from instrumentation import count_queries
+from movie_analytics import (dirty_movies, install, movies, movies_cli, refresh, report,
+                             roles, source, star_rollup, stars)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A small movies_db with the rollups installed."""
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'movies.db'}")
+    source.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(movies.insert(), [
+            {'id': 1, 'title': 'Titanic', 'release_year': 1997, 'runtime': 194, 'rating': 'PG-13'},
+            {'id': 2, 'title': 'The Lion King', 'release_year': 1994, 'runtime': 89, 'rating': 'G'},
+            {'id': 3, 'title': 'Toy Story 2', 'release_year': 1999, 'runtime': 95, 'rating': 'G'},
+            {'id': 4, 'title': 'Frozen', 'release_year': 2013, 'runtime': 108, 'rating': 'PG'},
+        ])
+        conn.execute(stars.insert(), [
+            {'id': 1, 'first_name': 'Kate', 'last_name': 'Winslet'},
+            {'id': 2, 'first_name': 'Tom', 'last_name': 'Hanks'},
+            {'id': 3, 'first_name': 'Tom', 'last_name': 'Hanks'},
+            {'id': 4, 'first_name': 'Idris', 'last_name': 'Elba'},
+        ])
+        conn.execute(roles.insert(), [
+            {'movie_id': 1, 'star_id': 1},
+            {'movie_id': 3, 'star_id': 2},
+            {'movie_id': 2, 'star_id': 2},
+            {'movie_id': 2, 'star_id': 3},
+        ])
+        install(conn)
+
+    yield engine
+    engine.dispose()
+
+
+def rows(engine, name, **kwargs):
+    with engine.connect() as conn:
+        return [tuple(row) for row in report(conn, name, **kwargs)[1]]
+
+
+class TestReports:
+    def test_rollup_reports(self, engine):
+        assert rows(engine, 'ratings') == [('G', 2), ('PG', 1), ('PG-13', 1)]
+        assert rows(engine, 'runtime-by-year') == [(2013, 108.0), (1999, 95.0),
+                                                   (1997, 194.0), (1994, 89.0)]
+        # Two stars with the same name are counted separately
+        assert rows(engine, 'star-movie-counts') == [('Tom', 'Hanks', 2), ('Kate', 'Winslet', 1),
+                                                     ('Tom', 'Hanks', 1)]
+        assert rows(engine, 'movie-star-counts', limit=1) == [('The Lion King', 2)]
+        assert rows(engine, 'longest-average-runtime')[0] == ('Kate', 'Winslet', 194.0)
+        assert rows(engine, 'longest-average-runtime-repeat-stars') == [('Tom', 'Hanks', 92.0)]
+
+    def test_anti_joins(self, engine):
+        assert rows(engine, 'movies-without-stars') == [('Frozen',)]
+        assert rows(engine, 'stars-without-movies') == [('Idris', 'Elba')]
+        assert (None, None, 'Frozen') in rows(engine, 'roles-and-orphans')
+        assert ('Idris', 'Elba', None) in rows(engine, 'roles-and-orphans')
+        assert len(rows(engine, 'roles-and-orphans')) == 6
+
+    def test_rollup_reports_do_not_read_the_source_tables(self, engine):
+        with count_queries() as statements:
+            rows(engine, 'runtime-by-year')
+        assert 'roles' not in statements[0] and ' movies' not in statements[0]
+
+
+class TestRefresh:
+    def test_changes_are_applied_incrementally(self, engine):
+        with engine.begin() as conn:
+            conn.execute(movies.update().where(movies.c.id == 3)
+                         .values(rating='PG', runtime=105))
+            conn.execute(roles.insert(), {'movie_id': 4, 'star_id': 4})
+            assert sorted(conn.execute(select(dirty_movies.c.movie_id)).scalars()) == [3, 4]
+
+            assert refresh(conn) == {'movies': 2, 'stars': 2}
+            assert conn.execute(select(func.count()).select_from(dirty_movies)).scalar() == 0
+
+        assert rows(engine, 'ratings') == [('G', 1), ('PG', 2), ('PG-13', 1)]
+        assert rows(engine, 'movies-without-stars') == []
+        assert ('Tom', 'Hanks', 97.0) in rows(engine, 'longest-average-runtime-repeat-stars')
+
+    def test_deletes_are_tracked(self, engine):
+        with engine.begin() as conn:
+            conn.execute(movies.delete().where(movies.c.id == 1))
+            refresh(conn)
+            winslet = conn.execute(select(star_rollup.c.movie_count)
+                                   .where(star_rollup.c.star_id == 1)).scalar()
+
+        assert winslet == 0
+        assert rows(engine, 'ratings') == [('G', 2), ('PG', 1)]
+
+    def test_incremental_matches_full(self, engine):
+        with engine.begin() as conn:
+            conn.execute(stars.update().where(stars.c.id == 3).values(first_name='Thomas'))
+            conn.execute(roles.delete().where(roles.c.star_id == 2))
+            refresh(conn)
+        incremental = {name: rows(engine, name) for name in ('ratings', 'star-movie-counts',
+                                                             'movie-star-counts')}
+
+        with engine.begin() as conn:
+            refresh(conn, full=True)
+        assert incremental == {name: rows(engine, name) for name in incremental}
+
+
+class TestCommands:
+    def test_report_command(self, engine):
+        url = str(engine.url)
+        previous = app.config['MOVIES_DATABASE_URL']
+        app.config['MOVIES_DATABASE_URL'] = url
+        try:
+            runner = app.test_cli_runner()
+            result = runner.invoke(movies_cli, ['refresh'])
+            assert result.exit_code == 0, result.output
+            assert 'Refreshed 0 movie(s) and 0 star(s).' in result.output
+
+            result = runner.invoke(movies_cli, ['report', 'ratings'])
+            assert result.exit_code == 0, result.output
+            assert result.output.splitlines() == ['rating\ttotal', 'G\t2', 'PG\t1', 'PG-13\t1']
+        finally:
+            app.config['MOVIES_DATABASE_URL'] = previous
+            app.extensions['movie_analytics'].pop(url).dispose()
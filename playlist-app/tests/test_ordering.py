@@ -0,0 +1,154 @@
+import pytest
+from app import app
+from cache import cache
+from instrumentation import count_queries
+from models import POSITION_GAP, Playlist, Song, PlaylistSong, db
+from ordering import SongNotOnPlaylist, crowded_playlists, move_song, rebalance
+from playlist_songs import add_songs
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def playlist(client):
+    playlist = Playlist(name="Ordered")
+    songs = [Song(title=f"Track {i}", artist="Band") for i in range(5)]
+    db.session.add_all([playlist, *songs])
+    db.session.commit()
+    add_songs(playlist.id, [song.id for song in songs])
+    db.session.commit()
+    return playlist.id, [song.id for song in songs]
+
+
+def order(playlist_id):
+    return [ps.song_id for ps in PlaylistSong.query
+            .filter_by(playlist_id=playlist_id)
+            .order_by(PlaylistSong.position, PlaylistSong.song_id)]
+
+
+def positions(playlist_id):
+    return [ps.position for ps in PlaylistSong.query
+            .filter_by(playlist_id=playlist_id)
+            .order_by(PlaylistSong.position)]
+
+
+class TestAppendPositions:
+    def test_bulk_add_appends_gapped_positions(self, playlist):
+        playlist_id, song_ids = playlist
+
+        assert order(playlist_id) == song_ids
+        assert positions(playlist_id) == [POSITION_GAP * i for i in range(1, 6)]
+
+    def test_orm_inserts_append_without_ties(self, client):
+        playlist = Playlist(name="Appended")
+        playlist.songs = [Song(title=f"S{i}", artist="A") for i in range(3)]
+        db.session.add(playlist)
+        extra = Song(title="Extra", artist="A")
+        db.session.add(extra)
+        db.session.commit()
+        db.session.add(PlaylistSong(playlist_id=playlist.id, song_id=extra.id))
+        db.session.commit()
+
+        assert positions(playlist.id) == [POSITION_GAP * i for i in range(1, 5)]
+
+
+class TestMoveSong:
+    def test_move_after_updates_one_row(self, playlist):
+        playlist_id, song_ids = playlist
+
+        with count_queries() as statements:
+            move_song(playlist_id, song_ids[4], after=song_ids[1])
+        db.session.commit()
+
+        assert len([s for s in statements if s.startswith('UPDATE')]) == 1
+        assert order(playlist_id) == [song_ids[i] for i in (0, 1, 4, 2, 3)]
+
+    def test_move_to_top_and_bottom(self, playlist):
+        playlist_id, song_ids = playlist
+
+        move_song(playlist_id, song_ids[3], after=None)
+        move_song(playlist_id, song_ids[0], after=song_ids[4])
+        db.session.commit()
+
+        assert order(playlist_id) == [song_ids[i] for i in (3, 1, 2, 4, 0)]
+
+    def test_exhausted_gap_triggers_rebalance(self, playlist):
+        playlist_id, song_ids = playlist
+
+        # Keep squeezing songs in right after the first: the gap halves
+        # each time, and runs out after ~log2(POSITION_GAP) moves
+        for _ in range(20):
+            move_song(playlist_id, song_ids[4], after=song_ids[0])
+            move_song(playlist_id, song_ids[3], after=song_ids[0])
+        db.session.commit()
+
+        assert order(playlist_id) == [song_ids[i] for i in (0, 3, 4, 1, 2)]
+        assert len(set(positions(playlist_id))) == 5
+
+    def test_unknown_song(self, playlist):
+        playlist_id, song_ids = playlist
+
+        with pytest.raises(SongNotOnPlaylist):
+            move_song(playlist_id, 999, after=song_ids[0])
+        with pytest.raises(SongNotOnPlaylist):
+            move_song(playlist_id, song_ids[0], after=999)
+
+
+class TestCompaction:
+    def test_crowded_playlists_are_rebalanced(self, client, playlist):
+        playlist_id, song_ids = playlist
+        PlaylistSong.query.filter_by(playlist_id=playlist_id, song_id=song_ids[1]).update(
+            {'position': POSITION_GAP + 1})
+        db.session.commit()
+
+        assert crowded_playlists() == [playlist_id]
+
+        result = app.test_cli_runner().invoke(args=['compact-positions'])
+        assert 'Rebalanced 1 playlist(s).' in result.output
+        assert crowded_playlists() == []
+        assert order(playlist_id) == song_ids
+
+    def test_rebalance_keeps_order(self, playlist):
+        playlist_id, song_ids = playlist
+        move_song(playlist_id, song_ids[0], after=song_ids[2])
+        rebalance(playlist_id)
+        db.session.commit()
+
+        assert positions(playlist_id) == [POSITION_GAP * i for i in range(1, 6)]
+        assert order(playlist_id) == [song_ids[i] for i in (1, 2, 0, 3, 4)]
+
+
+class TestOrderedPlaylistPage:
+    def test_songs_render_in_position_order(self, client, playlist):
+        playlist_id, song_ids = playlist
+
+        response = client.post(f'/playlists/{playlist_id}/songs/{song_ids[0]}/move',
+                               json={'after': song_ids[4]})
+        assert response.status_code == 200
+
+        body = client.get(f'/playlists/{playlist_id}').data.decode()
+        assert body.index('Track 4') < body.index('Track 0')
+        assert body.index('Track 1') < body.index('Track 2')
+
+    def test_move_unknown_song_is_404(self, client, playlist):
+        playlist_id, _ = playlist
+
+        response = client.post(f'/playlists/{playlist_id}/songs/999/move', json={'after': None})
+        assert response.status_code == 404
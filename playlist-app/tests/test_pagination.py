@@ -0,0 +1,89 @@
+import pytest
+from app import app
+from models import Playlist, Song, db
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+def add_songs(n):
+    songs = [Song(title=f"Song {i}", artist="Artist") for i in range(n)]
+    db.session.add_all(songs)
+    db.session.commit()
+    return [song.id for song in songs]
+
+
+class TestKeysetPagination:
+    def test_songs_first_page_is_limited(self, client):
+        song_ids = add_songs(5)
+
+        response = client.get('/songs?limit=2')
+        assert response.status_code == 200
+        assert b'Song 0' in response.data
+        assert b'Song 1' in response.data
+        assert b'Song 2' not in response.data
+        assert f'after={song_ids[1]}&limit=2'.encode() in response.data
+
+    def test_songs_next_page_seeks_past_cursor(self, client):
+        song_ids = add_songs(5)
+
+        response = client.get(f'/songs?after={song_ids[3]}&limit=2')
+        assert response.status_code == 200
+        assert b'Song 3' not in response.data
+        assert b'Song 4' in response.data
+        assert b'Next page' not in response.data
+
+    def test_bad_limit_falls_back_to_default(self, client):
+        add_songs(3)
+
+        response = client.get('/songs?limit=-4')
+        assert response.status_code == 200
+        assert b'Song 2' in response.data
+
+    def test_playlists_are_paged(self, client):
+        playlists = [Playlist(name=f"List {i}") for i in range(3)]
+        db.session.add_all(playlists)
+        db.session.commit()
+        first_id = playlists[0].id
+
+        response = client.get(f'/playlists?after={first_id}&limit=1')
+        assert b'List 0' not in response.data
+        assert b'List 1' in response.data
+        assert b'List 2' not in response.data
+        assert b'Next page' in response.data
+
+
+class TestStreamedListing:
+    def test_songs_stream_renders_every_row(self, client):
+        add_songs(120)
+
+        response = client.get('/songs?stream=1')
+        assert response.status_code == 200
+        assert response.is_streamed
+        body = response.get_data()
+        assert b'Song 0<' in body
+        assert b'Song 119<' in body
+        assert b'Next page' not in body
+
+    def test_playlists_stream(self, client):
+        db.session.add(Playlist(name="Road Trip"))
+        db.session.commit()
+
+        response = client.get('/playlists?stream=1')
+        assert response.is_streamed
+        assert b'Road Trip' in response.get_data()
@@ -0,0 +1,115 @@
+import pytest
+from app import app
+from cache import cache
+from instrumentation import count_queries
+from models import Playlist, Song, PlaylistSong, db
+from playlist_songs import add_songs, remove_songs
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def catalog(client):
+    playlist = Playlist(name="Mixtape")
+    songs = [Song(title=f"Track {i}", artist="Band") for i in range(6)]
+    db.session.add_all([playlist, *songs])
+    db.session.commit()
+    return playlist.id, [song.id for song in songs]
+
+
+def on_playlist(playlist_id):
+    return sorted(ps.song_id for ps in PlaylistSong.query.filter_by(playlist_id=playlist_id))
+
+
+class TestAddRemoveSongs:
+    def test_add_skips_duplicates_and_unknown_ids(self, catalog):
+        playlist_id, song_ids = catalog
+
+        assert add_songs(playlist_id, song_ids[:3]) == 3
+        assert add_songs(playlist_id, song_ids[2:5] + [9999]) == 2
+        db.session.commit()
+
+        assert on_playlist(playlist_id) == song_ids[:5]
+
+    def test_add_chunks_long_lists(self, catalog, monkeypatch):
+        import playlist_songs
+        monkeypatch.setattr(playlist_songs, 'CHUNK_SIZE', 2)
+        playlist_id, song_ids = catalog
+
+        assert add_songs(playlist_id, song_ids) == 6
+
+    def test_remove(self, catalog):
+        playlist_id, song_ids = catalog
+        add_songs(playlist_id, song_ids)
+
+        assert remove_songs(playlist_id, song_ids[:2] + [9999]) == 2
+        db.session.commit()
+
+        assert on_playlist(playlist_id) == song_ids[2:]
+
+    def test_one_insert_statement_per_chunk(self, catalog):
+        playlist_id, song_ids = catalog
+
+        with count_queries() as statements:
+            add_songs(playlist_id, song_ids)
+
+        assert len([s for s in statements if s.startswith('INSERT')]) == 1
+
+
+class TestMultiSelectForm:
+    def test_form_lists_songs(self, client, catalog):
+        playlist_id, _ = catalog
+
+        response = client.get(f'/playlists/{playlist_id}/add-songs')
+        assert response.status_code == 200
+        assert b'multiple' in response.data
+        assert b'Track 5' in response.data
+
+    def test_post_adds_all_selected(self, client, catalog):
+        playlist_id, song_ids = catalog
+
+        response = client.post(f'/playlists/{playlist_id}/add-songs',
+                               data={'songs': song_ids[:4]})
+        assert response.status_code == 302
+        assert on_playlist(playlist_id) == song_ids[:4]
+
+
+class TestBatchEndpoint:
+    def test_add_and_remove_in_one_request(self, client, catalog):
+        playlist_id, song_ids = catalog
+        add_songs(playlist_id, song_ids[:2])
+        db.session.commit()
+
+        response = client.post(f'/playlists/{playlist_id}/songs/batch',
+                               json={'add': song_ids[1:4], 'remove': [song_ids[0]]})
+
+        assert response.json == {'added': 2, 'removed': 1}
+        assert on_playlist(playlist_id) == song_ids[1:4]
+
+    def test_rejects_bad_payload(self, client, catalog):
+        playlist_id, _ = catalog
+
+        response = client.post(f'/playlists/{playlist_id}/songs/batch',
+                               json={'add': ['one']})
+        assert response.status_code == 400
+
+    def test_unknown_playlist(self, client):
+        assert client.post('/playlists/42/songs/batch', json={}).status_code == 404
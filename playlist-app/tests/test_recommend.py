@@ -0,0 +1,183 @@
+import pytest
+from app import app
+from instrumentation import count_queries
+from models import Playlist, PlaylistSong, PlaylistSongLog, Song, db
+from playlist_songs import add_songs
+from recommend import (CooccurrenceIndex, build_index, build_recommendations_command,
+                       publish, recommend_for_playlist, recommender)
+
+
+@pytest.fixture
+def client(tmp_path):
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    previous = app.config['RECOMMENDATIONS_PATH']
+    app.config['RECOMMENDATIONS_PATH'] = str(tmp_path)
+    recommender.clear()
+
+    # recommend.py reads its configuration from current_app
+    with app.test_client() as client, app.app_context():
+        db.create_all()
+
+        yield client
+
+        db.session.remove()
+        db.close_all_sessions()
+        db.drop_all()
+
+    app.config['RECOMMENDATIONS_PATH'] = previous
+    recommender.clear()
+
+
+@pytest.fixture
+def songs(client):
+    """Songs 'a'..'f'; a goes with b and c, b and c go with each other, d with e."""
+
+    songs = {name: Song(title=name, artist='X') for name in 'abcdef'}
+    db.session.add_all(songs.values())
+    db.session.commit()
+
+    for names in ('abc', 'ab', 'ac', 'bc', 'de', 'f'):
+        playlist = Playlist(name=names)
+        db.session.add(playlist)
+        db.session.flush()
+        add_songs(playlist.id, [songs[name].id for name in names])
+    db.session.commit()
+    return {name: song.id for name, song in songs.items()}
+
+
+def build(path):
+    with db.engine.connect() as connection:
+        directory, _, _ = build_index(connection, str(path))
+    publish(str(path), directory)
+    return directory
+
+
+def titles(recommended):
+    return [title for _, title, _ in recommended]
+
+
+class TestIndex:
+    def test_build_keeps_strongest_neighbours(self, songs, tmp_path):
+        with db.engine.connect() as connection:
+            directory, song_count, entries = build_index(connection, str(tmp_path),
+                                                         neighbours=1, block_size=2)
+        index = CooccurrenceIndex(directory)
+
+        assert song_count == 6
+        assert entries == 5     # f co-occurs with nothing
+        assert list(index.degrees) == [3, 3, 3, 1, 1, 1]
+
+    def test_empty_database(self, client, tmp_path):
+        directory = build(tmp_path)
+
+        assert len(CooccurrenceIndex(directory).songs) == 0
+        assert recommender.recommend([1]) == []
+
+    def test_publish_keeps_the_previous_build(self, songs, tmp_path):
+        first, second, third = build(tmp_path), build(tmp_path), build(tmp_path)
+
+        assert not (tmp_path / first.rsplit('/', 1)[1]).exists()
+        assert (tmp_path / second.rsplit('/', 1)[1]).exists()
+        assert (tmp_path / 'CURRENT').read_text() == third.rsplit('/', 1)[1]
+
+
+class TestRecommend:
+    def test_ranks_by_cooccurrence(self, songs, tmp_path):
+        build(tmp_path)
+
+        assert titles(recommender.recommend([songs['a']])) == ['b', 'c']
+        assert titles(recommender.recommend([songs['d']])) == ['e']
+        assert recommender.recommend([songs['f']]) == []
+
+    def test_excludes_songs_already_there(self, songs, tmp_path):
+        build(tmp_path)
+
+        assert titles(recommender.recommend([songs['a'], songs['b']])) == ['c']
+
+    def test_long_playlists_are_seeded_by_a_sample(self, songs, tmp_path, monkeypatch):
+        build(tmp_path)
+        playlist = [songs['a'], songs['b'], songs['d']]
+
+        monkeypatch.setitem(app.config, 'RECOMMENDATIONS_SEEDS', 1)
+        # Seeded by a alone: nothing goes with d, b is on the playlist
+        assert titles(recommender.recommend(playlist)) == ['c']
+
+        monkeypatch.setitem(app.config, 'RECOMMENDATIONS_SEEDS', 2)
+        assert titles(recommender.recommend(playlist)) == ['c', 'e']
+
+    def test_k(self, songs, tmp_path):
+        build(tmp_path)
+
+        assert titles(recommender.recommend([songs['a']], k=1)) == ['b']
+
+    def test_songs_added_since_the_build_count(self, songs, tmp_path):
+        build(tmp_path)
+        playlist = Playlist(name='new')
+        db.session.add(playlist)
+        db.session.flush()
+        add_songs(playlist.id, [songs['d'], songs['f']])
+        db.session.commit()
+
+        assert titles(recommender.recommend([songs['f']])) == ['d']
+        assert titles(recommender.recommend([songs['d']])) == ['e', 'f']
+
+    def test_deleted_songs_are_skipped(self, songs, tmp_path):
+        build(tmp_path)
+        PlaylistSong.query.filter_by(song_id=songs['e']).delete()
+        Song.query.filter_by(id=songs['e']).delete()
+        db.session.commit()
+
+        assert recommender.recommend([songs['d']]) == []
+
+    def test_nothing_without_an_index(self, songs):
+        playlist_id = Playlist.query.filter_by(name='abc').one().id
+
+        with count_queries() as statements:
+            assert recommend_for_playlist(playlist_id) == []
+        assert statements == []
+
+
+class TestRoutes:
+    def test_show_playlist(self, songs, tmp_path):
+        build(tmp_path)
+        playlist_id = Playlist.query.filter_by(name='ab').one().id
+
+        html = client_get(f'/playlists/{playlist_id}')
+
+        assert 'Songs that go with this playlist' in html
+        assert 'c by X' in html
+
+    def test_show_playlist_without_an_index(self, songs):
+        playlist_id = Playlist.query.filter_by(name='ab').one().id
+
+        assert 'Songs that go with' not in client_get(f'/playlists/{playlist_id}')
+
+    def test_add_song_suggests_first(self, songs, tmp_path):
+        build(tmp_path)
+        playlist_id = Playlist.query.filter_by(name='ab').one().id
+
+        html = client_get(f'/playlists/{playlist_id}/add-song')
+
+        assert '<optgroup label="Suggested">' in html
+        assert html.index(f'value="{songs["c"]}"') < html.index('All songs')
+
+
+def client_get(url):
+    with app.test_client() as client:
+        response = client.get(url)
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+class TestCommand:
+    def test_builds_and_trims_the_log(self, songs, tmp_path):
+        assert PlaylistSongLog.query.count() == 12
+
+        result = app.test_cli_runner().invoke(build_recommendations_command)
+
+        assert result.exit_code == 0, result.output
+        assert 'Built recommendations for 6 songs (8 pairs)' in result.output
+        assert PlaylistSongLog.query.count() == 0
+        assert (tmp_path / 'CURRENT').exists()
+        assert titles(recommender.recommend([songs['a']])) == ['b', 'c']
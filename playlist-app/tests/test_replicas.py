@@ -0,0 +1,108 @@
+import pytest
+from app import app as default_app, create_app
+from async_db import async_db
+from cache import cache, song_key
+from models import Song, db
+from replicas import STICKY_COOKIE
+
+
+@pytest.fixture
+def client():
+    default_app.config['TESTING'] = True
+    default_app.config['WTF_CSRF_ENABLED'] = False
+    default_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+    with default_app.test_client() as client:
+        with default_app.app_context():
+            db.create_all()
+
+        yield client
+
+        with default_app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def routed(request, tmp_path):
+    """An app on a primary file plus one replica file, both with the schema.
+
+    Nothing replicates between them, so which database a page came from
+    shows in its content. Parametrize indirectly with True for async views.
+    """
+
+    app = create_app({'TESTING': True,
+                      'ASYNC_VIEWS': getattr(request, 'param', False),
+                      'WTF_CSRF_ENABLED': False,
+                      'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+                      'SQLALCHEMY_REPLICA_URIS': [f"sqlite:///{tmp_path / 'replica.db'}"]})
+
+    with app.app_context():
+        primary = db.get_engine(app)
+        replica = db.get_engine(app, bind='replica_0')
+        for engine, title in ((primary, 'On Primary'), (replica, 'On Replica')):
+            db.metadata.create_all(engine)
+            with engine.begin() as conn:
+                conn.execute(Song.__table__.insert(), {'title': title, 'artist': 'X'})
+
+    try:
+        with app.test_client() as client:
+            yield app, client
+    finally:
+        async_db.dispose()
+        cache.clear()
+        with app.app_context():
+            db.session.remove()
+            db.get_engine(app).dispose()
+            db.get_engine(app, bind='replica_0').dispose()
+        db.app = default_app
+
+
+class TestReplicaRouting:
+    def test_reads_go_to_a_replica(self, routed):
+        app, client = routed
+
+        page = client.get('/songs').data
+        assert b'On Replica' in page
+        assert b'On Primary' not in page
+
+    def test_writes_go_to_the_primary(self, routed):
+        app, client = routed
+
+        client.post('/songs/add', data={'title': 'Fresh', 'artist': 'Y'})
+
+        with app.app_context():
+            primary = db.get_engine(app)
+            replica = db.get_engine(app, bind='replica_0')
+            assert primary.execute("SELECT count(*) FROM songs WHERE title = 'Fresh'").scalar() == 1
+            assert replica.execute("SELECT count(*) FROM songs WHERE title = 'Fresh'").scalar() == 0
+
+    def test_redirect_after_write_reads_the_primary(self, routed):
+        app, client = routed
+
+        response = client.post('/songs/add', data={'title': 'Fresh', 'artist': 'Y'},
+                               follow_redirects=True)
+        assert b'Fresh' in response.data
+        assert b'On Primary' in response.data
+
+    def test_stickiness_expires(self, routed):
+        app, client = routed
+        app.config['READ_YOUR_WRITES_SECONDS'] = 0
+
+        client.post('/songs/add', data={'title': 'Fresh', 'artist': 'Y'})
+        assert b'On Replica' in client.get('/songs').data
+
+    @pytest.mark.parametrize('routed', [False, True], indirect=True)
+    def test_cache_misses_load_from_the_primary(self, routed):
+        app, client = routed
+        cache.clear()
+
+        assert b'On Primary' in client.get('/songs/1').data
+        assert cache.backend.get(song_key(1))['title'] == 'On Primary'
+        # Uncached pages still read the replica
+        assert b'On Replica' in client.get('/songs/1?limit=2').data
+
+    def test_no_cookie_without_replicas(self, client):
+        response = client.post('/playlists/add', data={'name': 'P'})
+        assert STICKY_COOKIE not in response.headers.get('Set-Cookie', '')
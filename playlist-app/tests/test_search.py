@@ -0,0 +1,137 @@
+import pytest
+from app import app
+from choices import song_choices
+from models import Playlist, Song, db
+from search import _MATCHES, parse_cursor, search_songs, search_terms
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def catalog(client):
+    songs = [Song(title="Hold the Line", artist="Toto"),
+             Song(title="Africa", artist="Toto"),
+             Song(title="Linger", artist="The Cranberries"),
+             Song(title="Holdin' On", artist="Line of Fire"),
+             Song(title="Déjà Vu", artist="Beyoncé")]
+    db.session.add_all(songs)
+    db.session.commit()
+    return {song.title: song.id for song in songs}
+
+
+class TestSearchTerms:
+    def test_punctuation_is_dropped(self):
+        assert search_terms("Hold, the line!") == ['hold', 'the', 'line']
+        assert search_terms('" OR 1=1 --') == ['or', '1', '1']
+        assert search_terms(None) == []
+
+    def test_cursor_round_trip(self):
+        assert parse_cursor('-1.25:7') == (-1.25, 7)
+        assert parse_cursor('garbage') is None
+        assert parse_cursor(None) is None
+
+
+class TestSearchSongs:
+    def test_all_words_must_prefix_match(self, catalog):
+        results, _ = search_songs("hold li")
+        assert {r[0] for r in results} == {catalog["Hold the Line"], catalog["Holdin' On"]}
+
+    def test_title_matches_rank_above_artist_matches(self, catalog):
+        results, _ = search_songs("line")
+        assert results[0][0] == catalog["Hold the Line"]
+        assert catalog["Holdin' On"] in [r[0] for r in results]
+
+    def test_diacritics_are_folded(self, catalog):
+        results, _ = search_songs("deja beyonce")
+        assert [r[0] for r in results] == [catalog["Déjà Vu"]]
+
+    def test_index_follows_updates_and_deletes(self, catalog):
+        song = Song.query.get(catalog["Africa"])
+        song.title = "Rosanna"
+        db.session.commit()
+
+        assert search_songs("africa")[0] == []
+        assert [r[0] for r in search_songs("rosanna")[0]] == [catalog["Africa"]]
+
+        db.session.delete(song)
+        db.session.commit()
+        assert search_songs("rosanna")[0] == []
+
+    def test_keyset_pages_cover_every_match_once(self, catalog):
+        seen, after = [], None
+        while True:
+            results, after = search_songs("t", after=after, limit=1)
+            seen += [r[0] for r in results]
+            if after is None:
+                break
+
+        everything, _ = search_songs("t", limit=100)
+        assert seen == [r[0] for r in everything]
+        assert len(seen) == len(set(seen)) == 3
+
+    def test_pages_split_tied_scores(self, catalog):
+        db.session.add_all(Song(title=f"Same {n}", artist="Band") for n in range(5))
+        db.session.commit()
+
+        seen, after = [], None
+        while True:
+            results, after = search_songs("same", after=after, limit=2)
+            seen += [r[0] for r in results]
+            if after is None:
+                break
+
+        everything, _ = search_songs("same", limit=100)
+        assert len({r[3] for r in everything}) == 1
+        assert seen == sorted(seen) == [r[0] for r in everything]
+        assert len(set(seen)) == 5
+
+    def test_postgresql_score_is_double_precision(self):
+        assert 'AS double precision) AS score' in _MATCHES['postgresql']
+
+    def test_empty_query(self, catalog):
+        assert search_songs("  ?! ") == ([], None)
+
+
+class TestSearchRoutes:
+    def test_html_page(self, client, catalog):
+        response = client.get('/songs/search?q=toto')
+        assert response.status_code == 200
+        assert b'Hold the Line' in response.data
+        assert b'Africa' in response.data
+        assert b'Linger' not in response.data
+
+    def test_json_api_pages(self, client, catalog):
+        body = client.get('/api/v1/songs/search?q=toto&limit=1').json
+        assert len(body['results']) == 1
+        assert body['next_after']
+
+        body = client.get('/api/v1/songs/search', query_string={
+            'q': 'toto', 'limit': 1, 'after': body['next_after']}).json
+        assert len(body['results']) == 1
+        assert body['next_after'] is None
+
+
+class TestChooserUsesSearch:
+    def test_word_anywhere_in_title(self, catalog):
+        playlist = Playlist(name="P")
+        db.session.add(playlist)
+        db.session.commit()
+
+        choices = song_choices(playlist.id, "line")
+        assert {c[0] for c in choices} == {catalog["Hold the Line"], catalog["Holdin' On"]}
@@ -0,0 +1,92 @@
+from collections import Counter
+
+import pytest
+from app import app
+from aggregates import drifted_playlists
+from models import Playlist, PlaylistSong, PlaylistVersion, Song, db
+from seed import seed_command, seed_database
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+def seed(**options):
+    options = dict({'songs': 500, 'playlists': 20, 'avg_len': 30}, **options)
+    with db.engine.begin() as connection:
+        return seed_database(connection, **options)
+
+
+def snapshot():
+    return (db.session.query(Song.id, Song.title, Song.artist).order_by(Song.id).all(),
+            db.session.query(PlaylistSong.playlist_id, PlaylistSong.song_id,
+                             PlaylistSong.position)
+            .order_by(PlaylistSong.playlist_id, PlaylistSong.position).all())
+
+
+class TestSeed:
+    def test_counts_and_derived_tables(self, client):
+        result = seed()
+
+        assert Song.query.count() == result.songs == 500
+        assert Playlist.query.count() == result.playlists == 20
+        assert PlaylistSong.query.count() == result.tracks
+        assert PlaylistVersion.query.count() == 20
+        assert drifted_playlists(db.session.connection()) == []
+
+    def test_same_seed_same_data(self, client):
+        seed(seed=7)
+        first = snapshot()
+
+        db.drop_all()
+        db.create_all()
+        seed(seed=7)
+        assert snapshot() == first
+
+        db.drop_all()
+        db.create_all()
+        seed(seed=8)
+        assert snapshot() != first
+
+    def test_popularity_is_skewed(self, client):
+        seed(songs=2000, playlists=50)
+        songs, tracks = snapshot()
+
+        artists = Counter(artist for _, _, artist in songs).most_common()
+        assert artists[0][1] > 10 * artists[len(artists) // 2][1]
+
+        plays = Counter(song_id for _, song_id, _ in tracks).most_common()
+        assert plays[0][1] > 10 * plays[len(plays) // 2][1]
+
+    def test_appends_after_existing_rows(self, client):
+        db.session.add(Song(title="Africa", artist="Toto"))
+        db.session.commit()
+
+        seed(songs=10, playlists=2, avg_len=3)
+        assert Song.query.count() == 11
+
+        # New ids keep working after the explicit-id inserts
+        db.session.add(Song(title="Rosanna", artist="Toto"))
+        db.session.commit()
+        assert Song.query.count() == 12
+
+    def test_command(self, client):
+        result = app.test_cli_runner().invoke(
+            seed_command, ['--songs', '100', '--playlists', '5', '--avg-len', '10'])
+
+        assert result.exit_code == 0, result.output
+        assert 'Seeded 100 songs, 5 playlists' in result.output
+        assert Song.query.count() == 100
@@ -0,0 +1,247 @@
+import pytest
+from app import app
+from cache import cache, song_key
+from instrumentation import count_queries
+from models import Playlist, PlaylistSong, PlaylistStats, Song, db
+from ordering import move_song
+from playlist_songs import add_songs
+from setops import UnknownPlaylists, clone_playlist, combine_playlists, playlists_cli
+from versions import playlist_version
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+    app.config['WTF_CSRF_ENABLED'] = True
+
+
+@pytest.fixture
+def catalog(client):
+    """Playlists x = [a, b, c, d], y = [d, b, e] and z = [b, f], in that order."""
+
+    songs = {name: Song(title=name, artist='X') for name in 'abcdef'}
+    playlists = {name: Playlist(name=name) for name in 'xyz'}
+    db.session.add_all([*songs.values(), *playlists.values()])
+    db.session.commit()
+
+    for name, tracks in (('x', 'abcd'), ('y', 'deb'), ('z', 'bf')):
+        add_songs(playlists[name].id, [songs[track].id for track in tracks])
+    db.session.commit()
+    # add_songs appends in id order; put y in the order wanted
+    move_song(playlists['y'].id, songs['d'].id, None)
+    db.session.commit()
+
+    ids = {name: song.id for name, song in songs.items()}
+    ids.update((name, playlist.id) for name, playlist in playlists.items())
+    return ids
+
+
+def tracks(playlist_id):
+    names = (db.session.query(Song.title)
+             .join(PlaylistSong, PlaylistSong.song_id == Song.id)
+             .filter(PlaylistSong.playlist_id == playlist_id)
+             .order_by(PlaylistSong.position))
+    return ''.join(name for name, in names)
+
+
+class TestOperations:
+    def test_clone(self, catalog):
+        playlist_id, songs = clone_playlist(catalog['y'], 'copy', 'of y')
+        db.session.commit()
+
+        assert songs == 3
+        assert tracks(playlist_id) == 'dbe'
+        assert Playlist.query.get(playlist_id).description == 'of y'
+
+    def test_union(self, catalog):
+        playlist_id, songs = combine_playlists('union', [catalog['y'], catalog['x'],
+                                                         catalog['z']], 'all')
+
+        assert songs == 6
+        assert tracks(playlist_id) == 'dbeacf'
+
+    def test_intersect(self, catalog):
+        playlist_id, _ = combine_playlists('intersect', [catalog['x'], catalog['y']], 'both')
+        assert tracks(playlist_id) == 'bd'
+
+        playlist_id, _ = combine_playlists('intersect', [catalog['x'], catalog['y'],
+                                                         catalog['z']], 'all three')
+        assert tracks(playlist_id) == 'b'
+
+    def test_difference(self, catalog):
+        playlist_id, songs = combine_playlists('difference', [catalog['x'], catalog['y'],
+                                                              catalog['z']], 'only x')
+
+        assert songs == 2
+        assert tracks(playlist_id) == 'ac'
+
+    def test_one_insert_no_song_loading(self, catalog):
+        with count_queries() as statements:
+            combine_playlists('union', [catalog['x'], catalog['y']], 'all')
+
+        inserts = [s for s in statements if s.startswith('INSERT INTO playlist_song ')]
+        assert len(inserts) == 1 and 'SELECT' in inserts[0]
+        assert not any('FROM songs' in s for s in statements)
+
+    def test_aggregates_and_version_at_commit(self, catalog):
+        playlist_id, _ = combine_playlists('union', [catalog['x'], catalog['z']], 'all')
+        db.session.commit()
+
+        assert PlaylistStats.query.get(playlist_id).song_count == 5
+        assert playlist_version(db.session.connection(), playlist_id).version == 1
+
+    def test_empty_result(self, catalog):
+        playlist_id, songs = combine_playlists('difference', [catalog['z'], catalog['x']],
+                                               'just f')
+        assert (songs, tracks(playlist_id)) == (1, 'f')
+
+        playlist_id, songs = combine_playlists('intersect', [catalog['z'], catalog['y'],
+                                                             catalog['x']], 'b only')
+        assert songs == 1
+
+    def test_bad_arguments(self, catalog):
+        with pytest.raises(ValueError):
+            combine_playlists('xor', [catalog['x'], catalog['y']], 'n')
+        with pytest.raises(ValueError):
+            combine_playlists('union', [catalog['x'], catalog['x']], 'n')
+        with pytest.raises(UnknownPlaylists) as exc:
+            combine_playlists('union', [catalog['x'], 998, 999], 'n')
+        assert exc.value.args[0] == [998, 999]
+        with pytest.raises(UnknownPlaylists):
+            clone_playlist(999, 'n')
+
+
+class TestRoutes:
+    def test_clone_form(self, client, catalog):
+        page = client.get(f"/playlists/{catalog['x']}/clone").get_data(as_text=True)
+        assert 'value="x (copy)"' in page
+
+        response = client.post(f"/playlists/{catalog['x']}/clone", data={'name': 'x2'})
+
+        assert response.status_code == 302
+        playlist = Playlist.query.filter_by(name='x2').one()
+        assert response.location.endswith(f"/playlists/{playlist.id}")
+        assert tracks(playlist.id) == 'abcd'
+
+    def test_combine_form(self, client, catalog):
+        assert '>y</option>' in client.get('/playlists/combine').get_data(as_text=True)
+
+        response = client.post('/playlists/combine', data={
+            'name': 'x and y', 'operation': 'intersect',
+            'first': catalog['x'], 'playlists': [catalog['y']]})
+
+        assert response.status_code == 302
+        assert tracks(Playlist.query.filter_by(name='x and y').one().id) == 'bd'
+
+    def test_combine_form_keeps_the_first_playlist_first(self, client, catalog):
+        # z has the highest id; it must stay the base of the difference
+        client.post('/playlists/combine', data={
+            'name': 'z-x', 'operation': 'difference',
+            'first': catalog['z'], 'playlists': [catalog['x'], catalog['z']]})
+        client.post('/playlists/combine', data={
+            'name': 'y+x', 'operation': 'union',
+            'first': catalog['y'], 'playlists': [catalog['x']]})
+
+        assert tracks(Playlist.query.filter_by(name='z-x').one().id) == 'f'
+        assert tracks(Playlist.query.filter_by(name='y+x').one().id) == 'dbeac'
+
+    def test_combine_form_needs_two_playlists(self, client, catalog):
+        response = client.post('/playlists/combine', data={
+            'name': 'n', 'operation': 'union',
+            'first': catalog['x'], 'playlists': [catalog['x']]})
+
+        assert response.status_code == 200
+        assert 'at least two' in response.get_data(as_text=True)
+        assert Playlist.query.filter_by(name='n').count() == 0
+
+    def test_api(self, client, catalog):
+        response = client.post('/api/v1/playlists/combine', json={
+            'operation': 'union', 'playlists': [catalog['z'], catalog['y']], 'name': 'zy'})
+
+        assert response.status_code == 201
+        body = response.get_json()
+        assert body['songs'] == 4
+        assert response.headers['Location'].endswith(f"/api/v1/playlists/{body['id']}")
+        assert [s['title'] for s in client.get(response.headers['Location'])
+                .get_json()['songs']] == list('bfde')
+
+        response = client.post(f"/api/v1/playlists/{catalog['z']}/clone", json={'name': 'z2'})
+        assert (response.status_code, response.get_json()['songs']) == (201, 2)
+
+    def test_cached_song_pages_list_the_new_playlist(self, client, catalog):
+        for song in 'bf':
+            assert b'z2' not in client.get(f"/songs/{catalog[song]}").data
+
+        client.post(f"/playlists/{catalog['z']}/clone", data={'name': 'z2'})
+        client.post('/api/v1/playlists/combine', json={
+            'operation': 'intersect', 'playlists': [catalog['z'], catalog['x']],
+            'name': 'zx'})
+
+        assert b'z2' in client.get(f"/songs/{catalog['f']}").data
+        page = client.get(f"/songs/{catalog['b']}").data
+        assert b'z2' in page and b'zx' in page
+        assert b'zx' not in client.get(f"/songs/{catalog['f']}").data
+
+    def test_large_results_drop_every_song_page(self, client, catalog, monkeypatch):
+        monkeypatch.setattr('setops.SONG_KEYS_LIMIT', 1)
+        client.get(f"/songs/{catalog['f']}")
+        client.get(f"/songs/{catalog['b']}")
+
+        with count_queries() as statements:
+            combine_playlists('union', [catalog['x'], catalog['y']], 'all')
+        db.session.commit()
+
+        assert not any(s.startswith('SELECT playlist_song.song_id') for s in statements)
+        assert cache.backend.get(song_key(catalog['f'])) is None
+        assert b'all' in client.get(f"/songs/{catalog['b']}").data
+
+    def test_api_errors(self, client, catalog):
+        post = client.post
+        assert post('/api/v1/playlists/combine', json={
+            'operation': 'union', 'playlists': [catalog['x']]}).status_code == 400
+        assert post('/api/v1/playlists/combine', json={
+            'operation': 'nand', 'playlists': [catalog['x'], catalog['y']],
+            'name': 'n'}).status_code == 400
+        assert post('/api/v1/playlists/combine', json={
+            'operation': 'union', 'playlists': [catalog['x'], 999],
+            'name': 'n'}).status_code == 404
+        assert post('/api/v1/playlists/999/clone', json={'name': 'n'}).status_code == 404
+
+
+class TestCommands:
+    def test_combine(self, catalog):
+        result = app.test_cli_runner().invoke(playlists_cli, [
+            'combine', 'difference', str(catalog['x']), str(catalog['y']), '--name', 'x-y'])
+
+        assert result.exit_code == 0, result.output
+        assert 'with 2 song(s)' in result.output
+        assert tracks(Playlist.query.filter_by(name='x-y').one().id) == 'ac'
+
+    def test_clone(self, catalog):
+        result = app.test_cli_runner().invoke(playlists_cli, [
+            'clone', str(catalog['z']), '--name', 'z2'])
+
+        assert result.exit_code == 0, result.output
+        assert tracks(Playlist.query.filter_by(name='z2').one().id) == 'bf'
+
+    def test_unknown_playlist(self, catalog):
+        result = app.test_cli_runner().invoke(playlists_cli, [
+            'combine', 'union', str(catalog['x']), '999', '--name', 'n'])
+
+        assert result.exit_code == 2
+        assert 'No playlist 999' in result.output
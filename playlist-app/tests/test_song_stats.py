@@ -0,0 +1,199 @@
+import pytest
+from app import app
+from aggregates import drifted_songs, rebuild_aggregates_command
+from cache import cache
+from membership import membership
+from models import Playlist, PlaylistSong, Song, SongStats, db
+from ordering import move_song
+from playlist_songs import add_songs, remove_songs
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+
+
+@pytest.fixture
+def catalog(client):
+    """Songs a, b, c on playlists p0..p4: a on all five, b on p0 only."""
+
+    songs = {name: Song(title=name, artist='X') for name in 'abc'}
+    playlists = [Playlist(name=f'p{n}') for n in range(5)]
+    db.session.add_all([*songs.values(), *playlists])
+    db.session.commit()
+
+    for n, playlist in enumerate(playlists):
+        add_songs(playlist.id, [songs['a'].id] + ([songs['b'].id] if n == 0 else []))
+    db.session.commit()
+
+    ids = {name: song.id for name, song in songs.items()}
+    ids['playlists'] = [playlist.id for playlist in playlists]
+    return ids
+
+
+def playlist_count(song_id):
+    stats = db.session.get(SongStats, song_id)
+    db.session.expire_all()
+    return stats.playlist_count if stats else 0
+
+
+class TestTriggers:
+    def test_counts_follow_inserts(self, catalog):
+        assert playlist_count(catalog['a']) == 5
+        assert playlist_count(catalog['b']) == 1
+        assert playlist_count(catalog['c']) == 0
+
+    def test_counts_follow_orm_changes(self, catalog):
+        song = db.session.get(Song, catalog['c'])
+        playlist = db.session.get(Playlist, catalog['playlists'][1])
+        playlist.songs.append(song)
+        db.session.commit()
+        assert playlist_count(catalog['c']) == 1
+
+        playlist = db.session.get(Playlist, catalog['playlists'][1])
+        playlist.songs.remove(db.session.get(Song, catalog['c']))
+        db.session.commit()
+        assert playlist_count(catalog['c']) == 0
+
+    def test_counts_follow_removal(self, catalog):
+        remove_songs(catalog['playlists'][0], [catalog['a'], catalog['b']])
+        db.session.commit()
+        assert playlist_count(catalog['a']) == 4
+        assert playlist_count(catalog['b']) == 0
+
+    def test_moves_leave_counts_alone(self, catalog):
+        move_song(catalog['playlists'][0], catalog['b'], None)
+        db.session.commit()
+        assert playlist_count(catalog['a']) == 5
+        assert playlist_count(catalog['b']) == 1
+
+    def test_repointing_a_row_moves_its_count(self, catalog):
+        (db.session.query(PlaylistSong)
+         .filter_by(playlist_id=catalog['playlists'][0], song_id=catalog['b'])
+         .update({'song_id': catalog['c']}))
+        db.session.commit()
+        assert playlist_count(catalog['b']) == 0
+        assert playlist_count(catalog['c']) == 1
+
+    def test_deleting_a_playlist(self, catalog):
+        db.session.delete(db.session.get(Playlist, catalog['playlists'][0]))
+        db.session.commit()
+        assert playlist_count(catalog['a']) == 4
+        assert playlist_count(catalog['b']) == 0
+        assert drifted_songs(db.session.connection()) == []
+
+
+class TestDrift:
+    def test_check_and_rebuild(self, catalog):
+        db.session.query(SongStats).filter_by(song_id=catalog['a']).update(
+            {'playlist_count': 2})
+        db.session.commit()
+        assert drifted_songs(db.session.connection()) == [catalog['a']]
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(rebuild_aggregates_command, ['--check'])
+        assert result.exit_code == 1
+        assert f"1 song(s) had drifted: {catalog['a']}" in result.output
+
+        result = runner.invoke(rebuild_aggregates_command)
+        assert result.exit_code == 0
+        assert playlist_count(catalog['a']) == 5
+        assert drifted_songs(db.session.connection()) == []
+
+    def test_zero_rows_are_not_drift(self, catalog):
+        remove_songs(catalog['playlists'][0], [catalog['b']])
+        db.session.commit()
+        assert db.session.get(SongStats, catalog['b']).playlist_count == 0
+        assert drifted_songs(db.session.connection()) == []
+
+
+class TestSongPage:
+    def test_count_and_first_page(self, client, catalog):
+        response = client.get(f"/songs/{catalog['a']}?limit=2")
+        assert b'On 5 playlists.' in response.data
+        assert b'p0' in response.data and b'p1' in response.data
+        assert b'p2' not in response.data
+        assert (f"?after={catalog['playlists'][1]}&limit=2".encode()
+                in response.data)
+
+    def test_last_page(self, client, catalog):
+        response = client.get(
+            f"/songs/{catalog['a']}?after={catalog['playlists'][3]}&limit=2")
+        assert b'p4' in response.data and b'p3' not in response.data
+        assert b'Next page' not in response.data
+
+    def test_song_on_no_playlist(self, client, catalog):
+        response = client.get(f"/songs/{catalog['c']}")
+        assert b'On 0 playlists.' in response.data
+        assert b'not part of any playlist' in response.data
+
+    def test_missing_song(self, client, catalog):
+        assert client.get('/songs/999').status_code == 404
+
+    def test_only_the_default_first_page_is_cached(self, client, catalog):
+        client.get(f"/songs/{catalog['c']}")
+        client.get(f"/songs/{catalog['c']}?limit=2")
+        # Behind the cache's back: no song_key invalidation
+        add_songs(catalog['playlists'][3], [catalog['c']])
+        db.session.commit()
+
+        assert b'p3' not in client.get(f"/songs/{catalog['c']}").data
+        assert b'p3' in client.get(f"/songs/{catalog['c']}?limit=2").data
+
+
+class TestSongApi:
+    def test_song(self, client, catalog):
+        response = client.get(f"/api/v1/songs/{catalog['a']}")
+        assert response.json == {'id': catalog['a'], 'title': 'a', 'artist': 'X',
+                                 'playlist_count': 5}
+
+    def test_playlists_pages(self, client, catalog):
+        seen, after = [], None
+        while True:
+            query = {'limit': 2} if after is None else {'limit': 2, 'after': after}
+            body = client.get(f"/api/v1/songs/{catalog['a']}/playlists",
+                              query_string=query).json
+            seen.extend(playlist['id'] for playlist in body['playlists'])
+            after = body['next_after']
+            if after is None:
+                break
+        assert seen == catalog['playlists']
+
+    def test_missing_song(self, client, catalog):
+        assert client.get('/api/v1/songs/999').status_code == 404
+        assert client.get('/api/v1/songs/999/playlists').status_code == 404
+        assert client.get(f"/api/v1/songs/{catalog['c']}/playlists").json == {
+            'playlists': [], 'next_after': None}
+
+
+class TestWithMembershipIndex:
+    @pytest.fixture(autouse=True)
+    def index(self, client):
+        membership.active = True
+        membership.clear()
+        yield
+        membership.active = False
+        membership.clear()
+
+    def test_pages_match_the_query(self, client, catalog):
+        body = client.get(f"/api/v1/songs/{catalog['a']}/playlists?limit=3").json
+        assert [p['id'] for p in body['playlists']] == catalog['playlists'][:3]
+        assert body['next_after'] == catalog['playlists'][2]
+
+        body = client.get(f"/api/v1/songs/{catalog['a']}/playlists",
+                          query_string={'limit': 3, 'after': body['next_after']}).json
+        assert [p['id'] for p in body['playlists']] == catalog['playlists'][3:]
+        assert body['next_after'] is None
@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy.dialects.postgresql import psycopg2
+from werkzeug.exceptions import NotFound
+
+from app import app
+from cache import cache
+from choices import song_choice, song_choices
+from instrumentation import count_queries
+from models import Playlist, PlaylistSong, Song, db
+from statements import (PLAYLIST, SONG_CHOICES, playlist_or_404, songs_page,
+                        statements)
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        cache.clear()
+
+        yield client
+
+        with app.app_context():
+            db.session.remove()
+            db.close_all_sessions()
+            db.drop_all()
+    statements.init_app(app)
+
+
+@pytest.fixture
+def catalog(client):
+    """Songs c, b, a (ids in that order); playlist p holds b."""
+
+    songs = [Song(title=title, artist='X') for title in 'cba']
+    playlist = Playlist(name='p')
+    db.session.add_all([*songs, playlist])
+    db.session.commit()
+    db.session.add(PlaylistSong(playlist_id=playlist.id, song_id=songs[1].id))
+    db.session.commit()
+    return {'playlist': playlist.id, **{song.title: song.id for song in songs}}
+
+
+class TestStatements:
+    def test_playlist_or_404(self, catalog):
+        assert playlist_or_404(catalog['playlist']).name == 'p'
+        with pytest.raises(NotFound):
+            playlist_or_404(999)
+
+    def test_songs_page(self, catalog):
+        rows, next_after = songs_page(None, 2)
+        assert [row.title for row in rows] == ['c', 'b']
+        assert next_after == catalog['b']
+        rows, next_after = songs_page(next_after, 2)
+        assert [row.title for row in rows] == ['a']
+        assert next_after is None
+
+    def test_choices(self, catalog):
+        assert song_choices(catalog['playlist']) == [(catalog['a'], 'a'), (catalog['c'], 'c')]
+        assert song_choices(catalog['playlist'], limit=1) == [(catalog['a'], 'a')]
+        assert song_choice(catalog['playlist'], catalog['a']) == [(catalog['a'], 'a')]
+        assert song_choice(catalog['playlist'], catalog['b']) == []
+
+    def test_prepare_is_ignored_off_postgresql(self, catalog):
+        statements.prepare = True
+        with count_queries() as executed:
+            assert playlist_or_404(catalog['playlist']).name == 'p'
+        assert not any('PREPARE' in statement for statement in executed)
+
+    def test_routes_use_them(self, client, catalog):
+        assert client.get(f"/playlists/{catalog['playlist']}/add-song").status_code == 200
+        assert client.get('/playlists/999/add-song').status_code == 404
+        assert b'Next page' in client.get('/songs?limit=2').data
+
+
+class TestPrepared:
+    def test_postgresql_prepare_and_execute(self):
+        prepare, execute = SONG_CHOICES.prepared(psycopg2.dialect())
+        assert prepare.startswith('PREPARE song_choices AS SELECT')
+        assert 'playlist_song.playlist_id = $1' in prepare
+        assert prepare.rstrip().endswith('LIMIT $2')
+        assert str(execute) == 'EXECUTE song_choices(:playlist_id, :limit)'
+
+    def test_orm_statements_still_load_entities(self):
+        prepare, execute = PLAYLIST.prepared(psycopg2.dialect())
+        assert prepare.rstrip().endswith('WHERE playlists.id = $1')
+        assert str(execute) == 'EXECUTE playlist_by_id(:playlist_id)'
+        assert execute.is_select and not execute.is_text
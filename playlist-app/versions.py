@@ -0,0 +1,94 @@
+"""Per-playlist version counters for conditional API requests.
+
+playlist_versions holds a version number and last-modified time for
+each playlist. The JSON API turns them into a strong ETag and a
+Last-Modified header, and can answer If-None-Match / If-Modified-Since
+with a 304 from that one row, without loading the playlist.
+
+Writes that change a playlist's songs, their order or its own columns
+register the playlist with bump_on_commit(); all registered playlists
+are bumped in one statement just before the transaction commits.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import PlaylistVersion
+
+_PENDING = 'bump_playlist_versions'
+
+_UPSERT = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+_table = PlaylistVersion.__table__
+
+
+def playlist_etag(playlist_id, version):
+    return f'playlist-{playlist_id}-v{version}'
+
+
+def playlist_version(connection, playlist_id):
+    """Return (version, updated_at) for a playlist, or None if it has none."""
+
+    return connection.execute(
+        select(_table.c.version, _table.c.updated_at)
+        .where(_table.c.playlist_id == playlist_id)).first()
+
+
+def bump(connection, playlist_ids, now=None):
+    """Increment the versions of playlist_ids, creating missing rows."""
+
+    playlist_ids = sorted(set(playlist_ids))
+    if not playlist_ids:
+        return
+
+    now = now or datetime.utcnow()
+    insert = _UPSERT.get(connection.dialect.name)
+
+    if insert is not None:
+        stmt = insert(_table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['playlist_id'],
+            set_={'version': _table.c.version + 1, 'updated_at': stmt.excluded.updated_at})
+        connection.execute(stmt, [{'playlist_id': playlist_id, 'version': 1, 'updated_at': now}
+                                  for playlist_id in playlist_ids])
+        return
+
+    connection.execute(_table.update()
+                       .where(_table.c.playlist_id.in_(playlist_ids))
+                       .values(version=_table.c.version + 1, updated_at=now))
+    existing = set(connection.execute(
+        select(_table.c.playlist_id)
+        .where(_table.c.playlist_id.in_(playlist_ids))).scalars())
+    missing = [{'playlist_id': playlist_id, 'version': 1, 'updated_at': now}
+               for playlist_id in playlist_ids if playlist_id not in existing]
+    if missing:
+        connection.execute(_table.insert(), missing)
+
+
+def bump_on_commit(session, *playlist_ids):
+    """Bump these playlists' versions as part of session's next commit."""
+
+    session.info.setdefault(_PENDING, set()).update(playlist_ids)
+
+
+def _before_commit(session):
+    playlist_ids = session.info.pop(_PENDING, None)
+    if playlist_ids:
+        bump(session.connection(), playlist_ids)
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop(_PENDING, None)
+
+
+def track_versions(session):
+    """Hook bump_on_commit() into session's commits (idempotent)."""
+
+    if not event.contains(session, 'before_commit', _before_commit):
+        event.listen(session, 'before_commit', _before_commit)
+        event.listen(session, 'after_soft_rollback', _after_rollback)